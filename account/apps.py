@@ -2,4 +2,9 @@ from django.apps import AppConfig
 
 
 class AccountConfig(AppConfig):
+    # What the migrations create: the project sets no DEFAULT_AUTO_FIELD
+    default_auto_field = 'django.db.models.BigAutoField'
     name = 'account'
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,216 @@
+# account/async_views.py
+"""
+Native async read paths for ASGI deployments (enabled with ASYNC_API_VIEWS).
+
+JSON GETs run on Django's async ORM so one worker can serve many slow
+polling clients concurrently. HTML pages and writes are handed off to the
+matching sync view in views.py.
+
+BatchProgressStreamView (Server-Sent Events) is always routed; it is
+meant for ASGI, where an open stream doesn't pin a worker thread.
+"""
+import asyncio
+import json
+import uuid
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models import Count
+from django.http import HttpResponse, StreamingHttpResponse
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework.renderers import JSONRenderer
+
+from . import compact, views
+from .cache import ensure_listener
+from .models import Book, BulkUploadBatch, BulkUploadTask
+from .pagination import InvalidCursor, parse_limit, settle_horizon, task_changes
+from .progress import batch_done, broadcaster
+from .serializers import BookSerializer, BulkUploadTaskSerializer
+from .status_store import task_status_store
+
+
+def _json(data, status=200):
+    # Same renderer as the DRF views, so responses are byte-identical
+    return HttpResponse(JSONRenderer().render(data), content_type='application/json', status=status)
+
+
+def _wants_json(req):
+    return req.headers.get('Accept') == 'application/json'
+
+
+async def _batch_counters(batch_uuid):
+    """
+    (batch, counters, ingested) from the batch row, or one grouped query
+    (batch None) for batches uploaded before batch rows existed.
+    """
+    batch = await BulkUploadBatch.objects.filter(batch_id=batch_uuid).afirst()
+    if batch is not None:
+        return batch, batch.counters(), batch.ingested_at is not None
+    counts = {}
+    async for row in BulkUploadTask.objects.filter(batch_id=batch_uuid).order_by().values('status').annotate(n=Count('pk')):
+        key = row['status'].lower()
+        counts[key] = counts.get(key, 0) + row['n']
+    return None, BulkUploadBatch.counters_from_status_counts(counts), bool(counts)
+
+
+def _sse(event):
+    name = 'done' if event['done'] else 'progress'
+    return f"event: {name}\ndata: {json.dumps(event, separators=(',', ':'))}\n\n"
+
+
+class AsyncAPIView(View):
+    """CSRF-exempt like DRF's APIView; `fallback` delegates to sync_view_class."""
+    sync_view_class = None
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        return csrf_exempt(super().as_view(**initkwargs))
+
+    async def fallback(self, req, *args, **kwargs):
+        return await sync_to_async(self.sync_view_class.as_view())(req, *args, **kwargs)
+
+
+class AsyncBookListCreateAPIView(AsyncAPIView):
+    sync_view_class = views.BookListCreateAPIView
+
+    async def get(self, req):
+        if not _wants_json(req):
+            return await self.fallback(req)
+        if not req.user.is_authenticated:
+            return _json({'error': 'Authentication required'}, status=401)
+
+        try:
+            books, fields, limit = views.book_list_query(Book.objects.filter(user=req.user), req.GET)
+            page = [book async for book in books]
+        except InvalidCursor:
+            return _json({'error': 'invalid cursor'}, status=400)
+        except ValueError as exc:
+            return _json({'error': str(exc)}, status=400)
+        body, headers = views.book_list_page(req, req.GET, page, fields, limit)
+        return HttpResponse(body, content_type='application/json', headers=headers)
+
+    async def post(self, req):
+        return await self.fallback(req)
+
+
+class AsyncBookDetailAPIView(AsyncAPIView):
+    sync_view_class = views.BookDetailAPIView
+
+    async def get(self, req, id):
+        if not _wants_json(req):
+            return await self.fallback(req, id=id)
+
+        book = await Book.objects.filter(id=id).afirst()
+        if book is None:
+            return _json({'detail': 'No Book matches the given query.'}, status=404)
+        if book.user_id != req.user.id:
+            return _json({'detail': 'Forbidden'}, status=403)
+        return _json(BookSerializer(book, context={'request': req}).data)
+
+
+class AsyncTaskStatusAPIView(AsyncAPIView):
+
+    async def get(self, req):
+        task_id = req.GET.get('task_id')
+        if not task_id:
+            return _json({'error': 'task_id required'}, status=400)
+
+        payload = await task_status_store.aget(task_id)
+        if payload is not None:
+            return _json(payload)
+        if compact.parse_task_id(task_id) is not None:
+            payload = await sync_to_async(compact.task_status)(task_id)
+            if payload is None:
+                return _json({'error': 'Task not found'}, status=404)
+            return _json(payload)
+
+        try:
+            task = await BulkUploadTask.objects.aget(task_id=task_id)
+        except BulkUploadTask.DoesNotExist:
+            return _json({'error': 'Task not found'}, status=404)
+        return _json(BulkUploadTaskSerializer(task).data)
+
+
+class AsyncBatchStatusAPIView(AsyncAPIView):
+
+    async def get(self, req):
+        batch_id = req.GET.get('batch_id')
+        if not batch_id:
+            return _json({'error': 'batch_id required'}, status=400)
+
+        try:
+            batch_uuid = uuid.UUID(batch_id)
+        except Exception:
+            return _json({'error': 'invalid batch_id'}, status=400)
+
+        batch, counters, _ = await _batch_counters(batch_uuid)
+        summary = {'batch_id': str(batch_uuid), **counters}
+        if req.GET.get('include_tasks', '1') != '0':
+            cursor = req.GET.get('since') or req.GET.get('cursor')
+            limit = parse_limit(req.GET.get('limit'), settings.BATCH_TASKS_PAGE_SIZE, settings.BATCH_TASKS_MAX_PAGE_SIZE)
+            try:
+                if batch is not None and batch.storage == 'compact':
+                    if req.GET.get('since'):
+                        return _json({'error': compact.SINCE_UNSUPPORTED}, status=400)
+                    summary.update(await sync_to_async(compact.task_page)(batch, cursor, limit))
+                else:
+                    horizon = settle_horizon()
+                    queryset = task_changes(BulkUploadTask.objects.filter(batch_id=batch_uuid), cursor, horizon)
+                    page = [task async for task in queryset[:limit + 1]]
+                    summary.update(views.task_page(page, limit, cursor, req, horizon))
+            except InvalidCursor:
+                return _json({'error': 'invalid cursor'}, status=400)
+        return _json(summary)
+
+
+class BatchProgressStreamView(AsyncAPIView):
+    """
+    Server-Sent Events for one batch: a snapshot of its counters first, then
+    a `progress` event per imported chunk with the ids of the tasks that
+    changed, and a final `done` event once every row is settled. Events come
+    from account.progress, so an open stream costs no database queries.
+    """
+
+    async def get(self, req):
+        batch_id = req.GET.get('batch_id')
+        if not batch_id:
+            return _json({'error': 'batch_id required'}, status=400)
+
+        try:
+            batch_uuid = uuid.UUID(batch_id)
+        except Exception:
+            return _json({'error': 'invalid batch_id'}, status=400)
+
+        response = StreamingHttpResponse(self.events(batch_uuid), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'  # stop nginx from buffering the stream
+        return response
+
+    async def events(self, batch_uuid):
+        # Watch before taking the snapshot so no event can fall in between
+        queue = broadcaster.watch(batch_uuid)
+        ensure_listener()
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + settings.BATCH_PROGRESS_STREAM_TIMEOUT
+        try:
+            _, counters, ingested = await _batch_counters(batch_uuid)
+            event = {
+                'batch_id': str(batch_uuid), **counters, 'ingested': ingested,
+                'done': batch_done(counters, ingested), 'changed': [],
+            }
+            yield _sse(event)
+            while not event['done']:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break  # EventSource reconnects and gets a fresh snapshot
+                try:
+                    event = await asyncio.wait_for(
+                        queue.get(), timeout=min(settings.BATCH_PROGRESS_HEARTBEAT, remaining)
+                    )
+                except asyncio.TimeoutError:
+                    yield ': keepalive\n\n'
+                    continue
+                yield _sse(event)
+        finally:
+            broadcaster.unwatch(batch_uuid, queue)
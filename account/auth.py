@@ -11,4 +11,54 @@
 #             return None
 #         validated_token = self.get_validated_token(raw_token)
 #         return self.get_user(validated_token), validated_token
-    
\ No newline at end of file
+
+
+from .signed_tokens import averify_signed_token, is_signed_token, verify_signed_token
+from .token_cache import aget_auth_token, aget_user, get_auth_token, get_user
+
+
+def authenticate_token(token_str):
+    """
+    Validate an opaque or signed token.
+    Returns (user, auth, error): auth is the AuthToken row for opaque tokens
+    and the claims dict for signed ones; error is set when the token is rejected.
+    """
+    if is_signed_token(token_str):
+        claims = verify_signed_token(token_str)
+        if claims is None:
+            return None, None, "Invalid or expired token"
+        return _check_user(get_user(claims['uid']), claims)
+
+    return _check_opaque(get_auth_token(token_str))
+
+
+async def aauthenticate_token(token_str):
+    """Async version of authenticate_token() for the ASGI request path."""
+    if is_signed_token(token_str):
+        claims = await averify_signed_token(token_str)
+        if claims is None:
+            return None, None, "Invalid or expired token"
+        return _check_user(await aget_user(claims['uid']), claims)
+
+    return _check_opaque(await aget_auth_token(token_str))
+
+
+def _check_user(user, claims):
+    if user is None or not user.is_active:
+        return None, None, "User is not active"
+    return user, claims, None
+
+
+def _check_opaque(token_obj):
+    if token_obj is None:
+        return None, None, "Invalid token"
+
+    # Read-only: flipping expired tokens' status is left to the
+    # expire_auth_tokens beat task.
+    if not token_obj.is_valid():
+        return None, None, "Token expired or inactive"
+
+    if not token_obj.user.is_active:
+        return None, None, "User is not active"
+
+    return token_obj.user, token_obj, None
@@ -0,0 +1,377 @@
+# account/bulk_import.py
+"""
+Database side of bulk uploads: turning parsed rows into BulkUploadTask
+records and queueing them for import, one chunk at a time, so an upload
+costs O(chunks) round trips instead of O(rows).
+"""
+import logging
+import time
+import uuid
+from collections import Counter
+from contextlib import nullcontext
+
+from celery import current_app
+from django.conf import settings
+from django.db import DatabaseError, transaction
+from django.utils import timezone
+
+from .governor import write_governor
+from .ingest import chunked
+from .login_guard import BoundedExecutor, Saturated
+from .models import Book, BulkUploadBatch, BulkUploadTask
+from .progress import publish_progress
+from .scheduler import scheduler
+from .status_store import record as record_status, task_status_store
+from .validation import book_validator
+
+logger = logging.getLogger(__name__)
+
+_TITLE_MAX = BulkUploadTask._meta.get_field('title').max_length
+_AUTHOR_MAX = BulkUploadTask._meta.get_field('author').max_length
+
+# Statuses an import may still move a task out of
+OPEN_STATUSES = ('pending', 'processing')
+
+# Shared by every inline upload in this process; None runs jobs in the request thread
+inline_executor = BoundedExecutor(
+    workers=settings.BULK_UPLOAD_INLINE_WORKERS,
+    queue_size=getattr(settings, 'BULK_UPLOAD_INLINE_QUEUE_SIZE', 16),
+    name='inline-import',
+) if getattr(settings, 'BULK_UPLOAD_INLINE_WORKERS', 4) else None
+
+
+def build_tasks(rows, batch_id):
+    """Validate a chunk of parsed rows in memory; return unsaved BulkUploadTasks."""
+    now = timezone.now()
+    columns, errors = book_validator.validate(rows)
+    tasks = []
+    for title, author, description, error in zip(columns['title'], columns['author'], columns['description'], errors):
+        task = BulkUploadTask(
+            task_id=uuid.uuid4(),
+            batch_id=batch_id,
+            # clipped so an over-long value fails the row rather than the INSERT
+            title=title[:_TITLE_MAX],
+            author=author[:_AUTHOR_MAX],
+            description=description,
+            status='pending',
+        )
+        # Invalid rows are recorded as failed so they still show up in the batch
+        if error:
+            task.status = 'failed'
+            task.error_message = error
+            task.completed_at = now
+        tasks.append(task)
+    return tasks
+
+
+def ingest_rows(rows, user_id, batch_id, chunk_size, import_chunk_size, collect_ids=True, priority=1,
+                run_jobs=None):
+    """
+    Create the batch's BulkUploadTask rows with bulk_create and enqueue the
+    valid ones, chunk by chunk; each Celery message carries up to
+    import_chunk_size rows (or what the write governor currently allows).
+    With run_jobs, each chunk's (celery_task_id, task_ids) jobs are handed
+    to it instead and the broker is never touched. Returns (total_rows,
+    valid_rows, task_ids); task_ids is None unless collect_ids.
+    """
+    total_rows = valid_rows = 0
+    task_ids = [] if collect_ids else None
+    BulkUploadBatch.objects.create(batch_id=batch_id, user_id=user_id)
+    # One broker connection for the whole upload instead of one per message
+    with nullcontext() if run_jobs else current_app.producer_or_acquire() as producer:
+        for chunk in chunked(rows, chunk_size):
+            tasks = build_tasks(chunk, batch_id)
+            pending = [task for task in tasks if task.status == 'pending']
+
+            # Celery ids are chosen up front so they go in with the INSERT
+            # instead of needing a second write per row once the job is queued.
+            jobs = []
+            for job_tasks in chunked(pending, write_governor.chunk_size(import_chunk_size)):
+                celery_task_id = str(uuid.uuid4())
+                for task in job_tasks:
+                    task.celery_task_id = celery_task_id
+                jobs.append((celery_task_id, [str(task.task_id) for task in job_tasks]))
+            BulkUploadTask.objects.bulk_create(tasks, batch_size=chunk_size)
+            BulkUploadBatch.bump(
+                batch_id, total=len(tasks), pending=len(pending), failed=len(tasks) - len(pending)
+            )
+
+            # Publish only after the rows and counters exist, so workers always find them
+            if run_jobs:
+                run_jobs(jobs)
+            else:
+                enqueue_import_jobs(jobs, user_id, batch_id, producer=producer, priority=priority)
+            publish_progress(batch_id, [task.task_id for task in tasks if task.status == 'failed'])
+
+            total_rows += len(tasks)
+            valid_rows += len(pending)
+            if collect_ids:
+                task_ids.extend(str(task.task_id) for task in tasks)
+    now = timezone.now()
+    BulkUploadBatch.objects.filter(batch_id=batch_id).update(ingested_at=now, updated_at=now)
+    publish_progress(batch_id)
+    return total_rows, valid_rows, task_ids
+
+
+def abort_ingest(batch_id, exc):
+    """
+    End the ingest of an upload that turned out unreadable part way
+    through; returns the error result. Whatever was ingested before the bad
+    byte still imports, and watchers are told no more rows are coming.
+    """
+    now = timezone.now()
+    BulkUploadBatch.objects.filter(batch_id=batch_id).update(ingested_at=now, updated_at=now)
+    publish_progress(batch_id)
+    error = 'File is not valid UTF-8' if isinstance(exc, UnicodeDecodeError) else str(exc)
+    return {'batch_id': batch_id, 'status': 'failed', 'error': error}
+
+
+def discard_batch(batch_id):
+    """Delete a batch and its task rows, for uploads rejected as a whole."""
+    BulkUploadTask.objects.filter(batch_id=batch_id).delete()
+    BulkUploadBatch.objects.filter(batch_id=batch_id).delete()
+
+
+def enqueue_import_jobs(jobs, user_id, batch_id, producer=None, priority=1):
+    """Hand (celery_task_id, task_ids) import jobs to the fair scheduler."""
+    from .tasks import process_book_upload_chunk
+
+    scheduler.submit(
+        user_id, batch_id,
+        [(process_book_upload_chunk.name, [job_task_ids, user_id], celery_task_id) for celery_task_id, job_task_ids in jobs],
+        priority=priority, producer=producer,
+    )
+
+
+def import_inline(rows, user_id, batch_id, chunk_size, import_chunk_size, priority=1, max_rows=None):
+    """
+    Ingest and import an upload inside the request: jobs run on the
+    process-wide inline_executor as their chunk is written (in this thread
+    when it is disabled). Jobs the pool has no room for, and every job
+    once max_rows rows have been imported inline, are queued for the
+    workers as usual. Returns ingest_rows' (total_rows, valid_rows,
+    task_ids) plus the number of rows queued, once every inline job has
+    finished.
+    """
+    futures = []
+    queued = 0
+    # Rows left to import inline: a small compressed file can inflate to millions
+    budget = float('inf') if max_rows is None else max_rows
+
+    def run_jobs(jobs):
+        nonlocal queued, budget
+        overflow = []
+        for job in jobs:
+            _, job_task_ids = job
+            if len(job_task_ids) > budget:
+                budget = 0
+                overflow.append(job)
+                queued += len(job_task_ids)
+                continue
+            if inline_executor is None:
+                run_import_job(job_task_ids, user_id)
+                budget -= len(job_task_ids)
+                continue
+            try:
+                futures.append(inline_executor.submit(run_import_job, job_task_ids, user_id))
+                budget -= len(job_task_ids)
+            except Saturated:
+                overflow.append(job)
+                queued += len(job_task_ids)
+        if overflow:
+            enqueue_import_jobs(overflow, user_id, batch_id, priority=priority)
+
+    total_rows, valid_rows, task_ids = ingest_rows(
+        rows, user_id, batch_id, chunk_size, import_chunk_size, run_jobs=run_jobs
+    )
+    for future in futures:
+        future.result()
+    return total_rows, valid_rows, task_ids, queued
+
+
+def run_import_job(task_ids, user_id):
+    """
+    import_chunk for one job; if it raises, mark the job's unfinished
+    tasks failed instead (import jobs are not retried).
+    """
+    try:
+        result = import_chunk(task_ids, user_id)
+    except Exception as exc:
+        unfinished = BulkUploadTask.objects.filter(task_id__in=task_ids, status__in=OPEN_STATUSES)
+        batch_ids = set(unfinished.values_list('batch_id', flat=True))
+        unfinished.update(
+            status='failed', error_message=str(exc), completed_at=timezone.now(), updated_at=timezone.now()
+        )
+        # Rare path: rebuild the counters rather than work out the deltas
+        record_status(BulkUploadTask.objects.filter(task_id__in=task_ids))
+        for batch in BulkUploadBatch.objects.filter(batch_id__in=batch_ids):
+            batch.recount()
+            publish_progress(batch.batch_id, task_ids)
+        return {'status': 'failed', 'error': str(exc), 'tasks': len(task_ids)}
+    result['tasks'] = len(task_ids)
+    return result
+
+
+def import_chunk(task_ids, user_id):
+    """
+    Import a chunk of pending BulkUploadTasks: one bulk_create for all the
+    books and bulk updates for the status changes. A row that fails only
+    fails itself. Returns counts and per-stage timings in ms.
+
+    Safe to run more than once for the same chunk (acks_late redelivery):
+    a book is created at most once per task (Book.import_task_id is unique)
+    and only rows still open in the database are finished and counted.
+    """
+    timings = {}
+    started = time.perf_counter()
+
+    def lap(name):
+        nonlocal started
+        now = time.perf_counter()
+        timings[name] = round((now - started) * 1000, 2)
+        started = now
+
+    # Rows left 'processing' by a delivery that died are picked up again
+    tasks = list(BulkUploadTask.objects.filter(task_id__in=task_ids, status__in=OPEN_STATUSES))
+    if not tasks:
+        return {'success': 0, 'failed': 0, 'timings_ms': timings}
+    batch_id = tasks[0].batch_id  # a job never spans batches
+    rows = len(tasks)
+    # .update() skips auto_now, so updated_at is always set explicitly
+    now = timezone.now()
+    # With write-behind 'processing' only goes to the hot store; rows and
+    # counters are written once, at the terminal state
+    if not task_status_store.write_behind:
+        claimed = BulkUploadTask.objects.filter(
+            task_id__in=[task.task_id for task in tasks if task.status == 'pending'], status='pending'
+        ).update(status='processing', updated_at=now)
+        BulkUploadBatch.bump(batch_id, pending=-claimed, processing=claimed)
+    for task in tasks:
+        task.status = 'processing'
+        task.updated_at = now
+    record_status(tasks)
+    lap('claim')
+
+    valid = []
+    _, errors = book_validator.validate([task_fields(task) for task in tasks])
+    for task, error in zip(tasks, errors):
+        if not user_id:
+            _fail(task, "user_id is required", now)
+        elif error:
+            _fail(task, error, now)
+        else:
+            valid.append(task)
+    lap('validate')
+
+    books = [
+        Book(
+            title=task.title,
+            author=task.author,
+            description=task.description or "",
+            user_id=user_id,
+            import_task_id=task.task_id,
+        )
+        for task in valid
+    ]
+    for index, error in insert_books(books).items():
+        _fail(valid[index], error, now)
+    lap('insert')
+
+    # bulk_create doesn't return ids on MySQL: map them back by import_task_id
+    book_ids = dict(
+        Book.objects.filter(import_task_id__in=[task.task_id for task in valid]).values_list('import_task_id', 'id')
+    )
+    now = timezone.now()
+    for task in valid:
+        if task.status == 'failed':
+            continue
+        task.status = 'success'
+        task.created_book_id_id = book_ids.get(task.task_id)
+        task.completed_at = now
+    with transaction.atomic():
+        # Conditional transition: finish (and count) only the rows that are
+        # still open, so a duplicate delivery of this chunk changes nothing
+        was = dict(
+            BulkUploadTask.objects.select_for_update()
+            .filter(task_id__in=[task.task_id for task in tasks], status__in=OPEN_STATUSES)
+            .values_list('task_id', 'status')
+        )
+        dropped = [task.task_id for task in tasks if task.task_id not in was]
+        tasks = [task for task in tasks if task.task_id in was]
+        # Stamp after the row locks are held, to keep the gap to the
+        # commit small (see pagination.task_changes)
+        now = timezone.now()
+        for task in tasks:
+            task.updated_at = now
+        if tasks:
+            BulkUploadTask.objects.bulk_update(
+                tasks, ['status', 'error_message', 'created_book_id', 'completed_at', 'updated_at'], batch_size=len(tasks)
+            )
+        succeeded = sum(1 for task in tasks if task.status == 'success')
+        was = Counter(was.values())
+        BulkUploadBatch.bump(
+            batch_id, pending=-was['pending'], processing=-was['processing'],
+            success=succeeded, failed=len(tasks) - succeeded,
+        )
+    record_status(tasks)
+    if dropped:
+        # Finished by another delivery: replace the 'processing' recorded at the claim
+        record_status(BulkUploadTask.objects.filter(task_id__in=dropped))
+    lap('update')
+    write_governor.observe(timings['insert'] + timings['update'], rows)
+
+    publish_progress(batch_id, [task.task_id for task in tasks])
+    lap('publish')
+
+    return {'success': succeeded, 'failed': len(tasks) - succeeded, 'timings_ms': timings}
+
+
+def insert_books(books):
+    """
+    bulk_create books in one INSERT. If that fails, retry row by row so a bad
+    row only fails itself. A book whose import_task_id already exists, even
+    if another delivery of the job created it meanwhile, counts as inserted
+    (with that book's pk). Returns {index: error message} for rows not inserted.
+    """
+    errors = {}
+    if not books:
+        return errors
+    try:
+        with transaction.atomic():
+            Book.objects.bulk_create(books, batch_size=len(books))
+    except DatabaseError:
+        # One bad row poisons the whole INSERT; retry row by row to isolate it
+        logger.warning("bulk_create failed for %d books, inserting one by one", len(books), exc_info=True)
+        # Books an earlier delivery of the same job already created count as inserted
+        existing = imported_ids([book.import_task_id for book in books if book.import_task_id])
+        for index, book in enumerate(books):
+            if book.import_task_id in existing:
+                continue
+            book.pk = None
+            try:
+                with transaction.atomic():
+                    book.save()
+            except DatabaseError as exc:
+                # A duplicate import_task_id: an overlapping delivery has just created it
+                book.pk = None
+                if book.import_task_id:
+                    book.pk = Book.objects.filter(import_task_id=book.import_task_id).values_list('id', flat=True).first()
+                if book.pk is None:
+                    errors[index] = str(exc)
+    return errors
+
+
+def imported_ids(import_task_ids):
+    """The import_task_ids among these that already have a Book."""
+    return set(Book.objects.filter(import_task_id__in=import_task_ids).values_list('import_task_id', flat=True))
+
+
+def task_fields(task):
+    return {'title': task.title, 'author': task.author, 'description': task.description}
+
+
+def _fail(task, message, now):
+    task.status = 'failed'
+    task.error_message = message
+    task.completed_at = now
+    task.updated_at = now
@@ -0,0 +1,276 @@
+# account/cache.py
+"""
+Small caching helpers shared by the account app.
+
+LRUCache is a bounded, thread-safe in-process cache with a TTL per entry.
+TwoLevelCache puts an LRUCache in front of an optional Redis tier and
+broadcasts invalidations over Redis pub/sub so every process drops its
+local copy straight away instead of waiting for the TTL.
+
+publish()/subscribe() are the underlying pub/sub helpers: one listener
+thread per process pattern-subscribes to every ``account:*`` channel and
+dispatches messages to the registered handlers.
+"""
+import logging
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+_redis_client = None
+_redis_lock = threading.Lock()
+
+
+def get_redis():
+    """Return the shared Redis client, or None when REDIS_CACHE_URL is unset."""
+    global _redis_client
+    url = getattr(settings, 'REDIS_CACHE_URL', None)
+    if not url:
+        return None
+    if _redis_client is None:
+        with _redis_lock:
+            if _redis_client is None:
+                import redis
+                _redis_client = redis.Redis.from_url(
+                    url, socket_timeout=0.5, socket_connect_timeout=0.5
+                )
+    return _redis_client
+
+
+_handlers = {}
+_listener = None
+_listener_lock = threading.Lock()
+
+
+def publish(channel, message):
+    """Publish message on an ``account:*`` channel; no-op without Redis."""
+    client = get_redis()
+    if client is None:
+        return
+    try:
+        client.publish(channel, message)
+    except Exception:
+        logger.warning("Publish on %s failed", channel, exc_info=True)
+
+
+def subscribe(channel, handler):
+    """
+    Call handler(message) for every message published on channel.
+    handler(None) means messages may have been missed (reconnect), so any
+    state derived from them should be reset.
+    """
+    if not channel.startswith('account:'):
+        raise ValueError("channel must start with 'account:'")
+    _handlers.setdefault(channel, []).append(handler)
+
+
+def ensure_listener():
+    """Start this process's pub/sub listener thread if Redis is configured."""
+    global _listener
+    if get_redis() is None or (_listener is not None and _listener.is_alive()):
+        return
+    with _listener_lock:
+        if _listener is not None and _listener.is_alive():
+            return
+        _listener = threading.Thread(target=_listen, name='account-pubsub', daemon=True)
+        _listener.start()
+
+
+def _dispatch(channel, message):
+    for handler in _handlers.get(channel, ()):
+        try:
+            handler(message)
+        except Exception:
+            logger.exception("Pub/sub handler for %s failed", channel)
+
+
+def _listen():
+    import redis
+
+    while True:
+        try:
+            # Dedicated connection without a socket timeout: listen() blocks.
+            client = redis.Redis.from_url(settings.REDIS_CACHE_URL, health_check_interval=30)
+            pubsub = client.pubsub(ignore_subscribe_messages=True)
+            pubsub.psubscribe('account:*')
+            # Anything published while we were disconnected is lost.
+            for channel in list(_handlers):
+                _dispatch(channel, None)
+            for message in pubsub.listen():
+                channel, data = message['channel'], message['data']
+                if isinstance(channel, bytes):
+                    channel = channel.decode()
+                _dispatch(channel, data.decode() if isinstance(data, bytes) else data)
+        except Exception:
+            logger.warning("Pub/sub listener disconnected", exc_info=True)
+            for channel in list(_handlers):
+                _dispatch(channel, None)
+            time.sleep(1)
+
+
+class LRUCache:
+    """Bounded in-process LRU cache whose entries expire after a TTL."""
+
+    def __init__(self, maxsize=1024, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, expires = item
+            if expires <= time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class TwoLevelCache:
+    """
+    Local LRU in front of an optional shared Redis tier.
+
+    Values are pickled in both tiers so callers never share mutable objects
+    across requests. When Redis is configured, invalidate() publishes the key
+    and a listener thread in every process evicts it from the local tier.
+    Without Redis other processes never hear about invalidations, so
+    entries are kept for at most `unshared_ttl` seconds (0 turns the cache
+    off); None keeps the full ttl.
+    """
+
+    def __init__(self, name, maxsize=1024, ttl=300, unshared_ttl=None):
+        self.name = name
+        self.ttl = ttl
+        self.unshared_ttl = unshared_ttl
+        self.local = LRUCache(maxsize=maxsize, ttl=ttl)
+        self._stats = {'local_hits': 0, 'shared_hits': 0, 'misses': 0, 'sets': 0, 'invalidations': 0}
+        self._stats_lock = threading.Lock()
+        self.channel = f'account:{name}:invalidate'
+        subscribe(self.channel, self._on_invalidate)
+
+    def _on_invalidate(self, key):
+        if key is None:
+            self.local.clear()
+        else:
+            self.local.delete(key)
+
+    def _shared_key(self, key):
+        return f'{self.name}:{key}'
+
+    def _count(self, name):
+        with self._stats_lock:
+            self._stats[name] += 1
+
+    def get(self, key):
+        raw = self.local.get(key)
+        if raw is not None:
+            self._count('local_hits')
+            return pickle.loads(raw)
+
+        client = get_redis()
+        if client is not None:
+            ensure_listener()
+            try:
+                pipe = client.pipeline()
+                pipe.get(self._shared_key(key))
+                pipe.pttl(self._shared_key(key))
+                raw, ttl_ms = pipe.execute()
+            except Exception:
+                logger.warning("Shared cache read failed for %s", self.name, exc_info=True)
+                raw = None
+            if raw is not None:
+                self.local.set(key, raw, ttl=ttl_ms / 1000 if ttl_ms and ttl_ms > 0 else None)
+                self._count('shared_hits')
+                return pickle.loads(raw)
+
+        self._count('misses')
+        return None
+
+    async def aget(self, key):
+        """get() for async callers: only the Redis round trip runs in a thread."""
+        raw = self.local.get(key)
+        if raw is not None:
+            self._count('local_hits')
+            return pickle.loads(raw)
+        if get_redis() is None:
+            self._count('misses')
+            return None
+        return await sync_to_async(self.get, thread_sensitive=False)(key)
+
+    async def aset(self, key, value, ttl=None):
+        if get_redis() is None:
+            self.set(key, value, ttl)
+        else:
+            await sync_to_async(self.set, thread_sensitive=False)(key, value, ttl)
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        client = get_redis()
+        if client is None and self.unshared_ttl is not None:
+            ttl = min(ttl, self.unshared_ttl)
+        if ttl <= 0:
+            return
+        raw = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        self.local.set(key, raw, ttl=ttl)
+        self._count('sets')
+
+        if client is not None:
+            ensure_listener()
+            try:
+                client.set(self._shared_key(key), raw, px=max(int(ttl * 1000), 1))
+            except Exception:
+                logger.warning("Shared cache write failed for %s", self.name, exc_info=True)
+
+    def invalidate(self, key):
+        """Drop key from every tier and tell the other processes to do the same."""
+        self.local.delete(key)
+        self._count('invalidations')
+
+        client = get_redis()
+        if client is not None:
+            try:
+                pipe = client.pipeline()
+                pipe.delete(self._shared_key(key))
+                pipe.publish(self.channel, key)
+                pipe.execute()
+            except Exception:
+                logger.warning("Shared cache invalidation failed for %s", self.name, exc_info=True)
+
+    def get_stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        lookups = stats['local_hits'] + stats['shared_hits'] + stats['misses']
+        stats['hit_ratio'] = round((lookups - stats['misses']) / lookups, 4) if lookups else None
+        stats['local_size'] = len(self.local)
+        stats['shared_tier'] = get_redis() is not None
+        return stats
@@ -0,0 +1,338 @@
+# account/compact.py
+"""
+Compact storage for very large bulk uploads.
+
+Instead of one BulkUploadTask per CSV line, a compact batch stores:
+
+- one BulkUploadSegment per import message, holding the status of its rows
+  packed 2 bits per row (a million rows fit in ~250 KB);
+- one BulkUploadFailure per failed row, with its error message;
+- nothing for the row payloads: an import message only says where its
+  segment starts (row number and byte offset in the stored upload) and
+  how many rows it has. The worker reads them back from the file, which
+  is deleted once every row is final. Compressed uploads are stored
+  decompressed first so that offsets can be seeked to.
+
+Rows are addressed by their 1-based position in the file. Their task id
+is "<batch_id>:<row_number>", and /task-status/ and /batch-status/ accept
+it like a BulkUploadTask id. Books created from row n carry
+import_task_id = uuid5(batch_id, n), so re-running a segment never
+duplicates them.
+"""
+import tempfile
+import time
+import uuid
+
+from celery import current_app
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .bulk_import import insert_books
+from .governor import write_governor
+from .ingest import DECOMPRESSORS, READ_SIZE, chunked, peek_head, read_rows_at, sniff_compression, upload_format
+from .models import Book, BulkUploadBatch, BulkUploadFailure, BulkUploadSegment
+from .pagination import InvalidCursor, decode_cursor, encode_cursor
+from .progress import publish_progress
+from .scheduler import scheduler
+from .validation import book_validator
+
+PENDING, PROCESSING, SUCCESS, FAILED = range(4)
+STATUS_NAMES = ('pending', 'processing', 'success', 'failed')
+
+# Rows are listed in file order only: statuses are packed per segment, with
+# no per-row update time to page by
+SINCE_UNSUPPORTED = 'since is not supported for compact batches; page in file order with cursor'
+
+_TITLE_MAX = BulkUploadFailure._meta.get_field('title').max_length
+_AUTHOR_MAX = BulkUploadFailure._meta.get_field('author').max_length
+
+
+def packed_size(count):
+    return (count + 3) // 4
+
+
+def get_status(packed, index):
+    return (packed[index >> 2] >> ((index & 3) * 2)) & 3
+
+
+def set_status(packed, index, code):
+    """Set row index's 2-bit status in a bytearray."""
+    shift = (index & 3) * 2
+    packed[index >> 2] = (packed[index >> 2] & ~(3 << shift)) | (code << shift)
+
+
+def task_id_for(batch_id, row_number):
+    return f'{batch_id}:{row_number}'
+
+
+def parse_task_id(task_id):
+    """(batch_uuid, row_number) for a compact task id, or None."""
+    batch_id, sep, row_number = str(task_id).rpartition(':')
+    if not sep:
+        return None
+    try:
+        return uuid.UUID(batch_id), int(row_number)
+    except ValueError:
+        return None
+
+
+def book_import_id(batch_id, row_number):
+    return uuid.uuid5(uuid.UUID(str(batch_id)), str(row_number))
+
+
+def ingest_compact(rows, batch, segment_size, priority=1):
+    """
+    Coordinator for a compact batch: validate rows, given as (offset, row)
+    pairs, in memory, write one segment plus the failures per segment_size
+    rows and queue each segment with valid rows as one import message
+    holding its first row number, row count and byte offset. Returns
+    (total, valid).
+    """
+    from .tasks import process_compact_segment
+
+    total_rows = valid_rows = 0
+    with current_app.producer_or_acquire() as producer:
+        for chunk in chunked(rows, segment_size):
+            start_row = total_rows + 1
+            statuses = bytearray(packed_size(len(chunk)))
+            failures = []
+            columns, errors = book_validator.validate([row for _, row in chunk])
+            for offset, (title, author, error) in enumerate(zip(columns['title'], columns['author'], errors)):
+                if error:
+                    set_status(statuses, offset, FAILED)
+                    failures.append(BulkUploadFailure(
+                        batch=batch, row_number=start_row + offset, title=title[:_TITLE_MAX], author=author[:_AUTHOR_MAX],
+                        error_message=error,
+                    ))
+            valid = len(chunk) - len(failures)
+
+            with transaction.atomic():
+                BulkUploadSegment.objects.get_or_create(
+                    batch=batch, start_row=start_row, defaults={'count': len(chunk), 'statuses': bytes(statuses)}
+                )
+                BulkUploadFailure.objects.bulk_create(failures, ignore_conflicts=True)
+                BulkUploadBatch.bump(batch.batch_id, total=len(chunk), pending=valid, failed=len(failures))
+            if valid:
+                args = [str(batch.batch_id), start_row, len(chunk), chunk[0][0], batch.user_id]
+                scheduler.submit(
+                    batch.user_id, batch.batch_id, [(process_compact_segment.name, args, str(uuid.uuid4()))],
+                    priority=priority, producer=producer,
+                )
+            publish_progress(batch.batch_id, [task_id_for(batch.batch_id, f.row_number) for f in failures])
+
+            total_rows += len(chunk)
+            valid_rows += valid
+    now = timezone.now()
+    BulkUploadBatch.objects.filter(batch_id=batch.batch_id).update(ingested_at=now, updated_at=now)
+    publish_progress(batch.batch_id)
+    # Every segment may have finished while the file was still being read
+    release_source(batch.batch_id)
+    return total_rows, valid_rows
+
+
+def uncompressed_source(batch):
+    """
+    Path of batch's stored upload, first replaced by its decompressed copy
+    if it is gzip or zstd compressed: segments are read back by offset.
+    """
+    with default_storage.open(batch.source_path, 'rb') as f:
+        head, chunks = peek_head(f.chunks(READ_SIZE))
+        compression = sniff_compression(head)
+        if compression is None:
+            return batch.source_path
+        with tempfile.TemporaryFile() as spool:
+            for data in DECOMPRESSORS[compression](chunks):
+                spool.write(data)
+            spool.seek(0)
+            directory = batch.source_path.rpartition('/')[0]
+            path = default_storage.save(f'{directory}/{batch.batch_id}.{upload_format(batch.source_path)}', File(spool))
+    BulkUploadBatch.objects.filter(batch_id=batch.batch_id).update(source_path=path)
+    default_storage.delete(batch.source_path)
+    batch.source_path = path
+    return path
+
+
+def release_source(batch_id):
+    """Delete a compact batch's stored upload once every row is final."""
+    path = (
+        BulkUploadBatch.objects
+        .filter(batch_id=batch_id, ingested_at__isnull=False, pending=0, processing=0)
+        .exclude(source_path='')
+        .values_list('source_path', flat=True)
+        .first()
+    )
+    # Clearing source_path first makes exactly one caller the deleter
+    if path and BulkUploadBatch.objects.filter(batch_id=batch_id, source_path=path).update(source_path=''):
+        default_storage.delete(path)
+
+
+def segment_rows(batch_id, start_row, count, offset):
+    """(row_number, row) for the `count` rows of a segment, read from the stored upload."""
+    path = BulkUploadBatch.objects.values_list('source_path', flat=True).get(batch_id=batch_id)
+    with default_storage.open(path, 'rb') as f:
+        rows = read_rows_at(f, offset, count, path)
+    return enumerate(rows, start_row)
+
+
+def import_segment(batch_id, start_row, count, offset, user_id):
+    """
+    Import the valid rows of one segment (`count` rows from row start_row,
+    at byte `offset` of the stored upload) and write its statuses back in
+    a single UPDATE. Rows already past 'pending' are skipped and the
+    UPDATE only applies if the segment is unchanged since it was read, so
+    a redelivered or duplicate message neither creates books twice nor
+    moves the counters twice.
+    """
+    segment = BulkUploadSegment.objects.get(batch_id=batch_id, start_row=start_row)
+    original = bytes(segment.statuses)
+    statuses = bytearray(original)
+    # A finished segment's file may be gone already: check before reading it
+    if all(get_status(statuses, index) != PENDING for index in range(count)):
+        return {'success': 0, 'failed': 0}
+    pending = [
+        (row_number, row) for row_number, row in segment_rows(batch_id, start_row, count, offset)
+        if get_status(statuses, row_number - start_row) == PENDING
+    ]
+    columns, checks = book_validator.validate([row for _, row in pending])
+    rows = list(zip(
+        (row_number for row_number, _ in pending), columns['title'], columns['author'], columns['description']
+    ))
+    # Invalid rows were marked failed at ingest; a row only fails the check
+    # here if the stored file changed underneath
+    errors = {index: error for index, error in enumerate(checks) if error}
+    valid = [index for index in range(len(rows)) if index not in errors]
+    books = [
+        Book(
+            title=title, author=author, description=description, user_id=user_id,
+            import_task_id=book_import_id(batch_id, row_number),
+        )
+        for row_number, title, author, description in (rows[index] for index in valid)
+    ]
+    started = time.perf_counter()
+    if user_id:
+        errors.update((valid[index], error) for index, error in insert_books(books).items())
+    else:
+        errors.update(dict.fromkeys(valid, 'user_id is required'))
+
+    failures = []
+    for index, (row_number, title, author, _description) in enumerate(rows):
+        if index in errors:
+            set_status(statuses, row_number - start_row, FAILED)
+            failures.append(BulkUploadFailure(
+                batch_id=batch_id, row_number=row_number, title=title[:_TITLE_MAX], author=author[:_AUTHOR_MAX],
+                error_message=errors[index],
+            ))
+        else:
+            set_status(statuses, row_number - start_row, SUCCESS)
+    with transaction.atomic():
+        # Compare-and-set on the packed statuses: a concurrent delivery that
+        # finished first wins and this one records nothing
+        updated = BulkUploadSegment.objects.filter(pk=segment.pk, statuses=original).update(
+            statuses=bytes(statuses), updated_at=timezone.now()
+        )
+        if updated:
+            BulkUploadFailure.objects.bulk_create(failures, ignore_conflicts=True)
+            BulkUploadBatch.bump(
+                batch_id, pending=-len(rows), success=len(rows) - len(failures), failed=len(failures)
+            )
+    if not updated:
+        return {'success': 0, 'failed': 0}
+    write_governor.observe((time.perf_counter() - started) * 1000, len(rows))
+    publish_progress(batch_id, [task_id_for(batch_id, row[0]) for row in rows])
+    release_source(batch_id)
+    return {'success': len(rows) - len(failures), 'failed': len(failures)}
+
+
+def task_status(task_id):
+    """The /task-status/ payload for a compact task id, or None if unknown."""
+    parsed = parse_task_id(task_id)
+    if parsed is None:
+        return None
+    batch_id, row_number = parsed
+    segment = (
+        BulkUploadSegment.objects.select_related('batch')
+        .filter(batch_id=batch_id, start_row__lte=row_number).order_by('-start_row').first()
+    )
+    if segment is None or row_number >= segment.start_row + segment.count:
+        return None
+    code = get_status(segment.statuses, row_number - segment.start_row)
+    payload = {
+        'task_id': task_id_for(batch_id, row_number),
+        'status': STATUS_NAMES[code],
+        'title': None,
+        'author': None,
+        'error_message': None,
+        'created_at': segment.batch.created_at,
+        'completed_at': segment.updated_at if code in (SUCCESS, FAILED) else None,
+    }
+    # Only finished rows have a copy outside the uploaded file
+    if code == FAILED:
+        failure = BulkUploadFailure.objects.filter(batch_id=batch_id, row_number=row_number).first()
+        if failure is not None:
+            payload.update(title=failure.title, author=failure.author, error_message=failure.error_message)
+    elif code == SUCCESS:
+        book = Book.objects.filter(import_task_id=book_import_id(batch_id, row_number)).values('title', 'author').first()
+        if book is not None:
+            payload.update(book)
+    return payload
+
+
+def task_page(batch, cursor, limit):
+    """
+    One page of a compact batch's rows in file order, with the same fields
+    as the row-storage listing. The cursor is the last row number returned.
+    title and author come from the failure or the created book, so they are
+    None until a row is final. There is no changes-since mode (the views
+    reject ?since=): poll the counters, or page again from the start.
+    """
+    after = 0
+    if cursor:
+        kind, row_number = decode_cursor(cursor, 2)
+        if kind != 'row' or not row_number.isdigit():
+            raise InvalidCursor(cursor)
+        after = int(row_number)
+    # Segments overlapping rows after+1 .. after+limit
+    segments = (
+        BulkUploadSegment.objects
+        .filter(batch=batch, start_row__lte=after + limit, start_row__gt=after + 1 - F('count'))
+        .order_by('start_row')
+    )
+    failures = {
+        row_number: {'title': title, 'author': author, 'error_message': error_message}
+        for row_number, title, author, error_message in
+        BulkUploadFailure.objects.filter(batch=batch, row_number__gt=after, row_number__lte=after + limit)
+        .values_list('row_number', 'title', 'author', 'error_message')
+    }
+    rows = []
+    for segment in segments:
+        for index in range(max(0, after + 1 - segment.start_row), segment.count):
+            if len(rows) == limit:
+                break
+            rows.append((segment.start_row + index, get_status(segment.statuses, index), segment.updated_at))
+    book_ids = {book_import_id(batch.batch_id, row_number): row_number for row_number, code, _ in rows if code == SUCCESS}
+    books = {
+        book_ids[import_task_id]: {'title': title, 'author': author}
+        for import_task_id, title, author in
+        Book.objects.filter(import_task_id__in=book_ids).values_list('import_task_id', 'title', 'author')
+    }
+    tasks = []
+    for row_number, code, updated_at in rows:
+        tasks.append({
+            'task_id': task_id_for(batch.batch_id, row_number),
+            'status': STATUS_NAMES[code],
+            'title': None,
+            'author': None,
+            'error_message': None,
+            **failures.get(row_number, books.get(row_number, {})),
+            'created_at': batch.created_at,
+            'completed_at': updated_at if code in (SUCCESS, FAILED) else None,
+        })
+    last = rows[-1][0] if rows else after
+    return {
+        'tasks': tasks,
+        'next_cursor': encode_cursor('row', last) if tasks else cursor,
+        'has_more': last < batch.total,
+    }
@@ -0,0 +1,156 @@
+# account/governor.py
+"""
+AIMD write-rate governor shared by the import workers.
+
+Every import task reports how long its database writes took (the Book
+INSERT plus the status UPDATEs of one chunk) and for how many rows. The
+governor keeps an EWMA of the milliseconds per row, so samples from
+chunks of any size (and from single-row tasks) are comparable and
+shrinking the chunk size doesn't by itself look like the database
+recovering. At most once per `interval` seconds:
+
+- when the EWMA is over the per-row target, halves the import chunk size
+  and the number of import messages allowed in flight (multiplicative
+  decrease);
+- when it is under the target, grows the chunk size by `chunk_step` rows
+  and the concurrency by one (additive increase).
+
+The fair scheduler (account/scheduler.py) uses concurrency() as its
+in-flight limit and ingest uses chunk_size() to size new import messages,
+so imports back off as soon as MySQL slows down and interactive requests
+keep their latency. pace() additionally delays a worker in proportion to
+how far the EWMA is over target, which is what throttles setups without
+the scheduler.
+
+With Redis the state is shared by all workers (last writer wins, which is
+fine for a heuristic); without it each process governs itself.
+"""
+import logging
+import threading
+import time
+
+from django.conf import settings
+
+from .cache import get_redis
+
+logger = logging.getLogger(__name__)
+
+STATE_KEY = 'governor:write'
+
+
+class WriteGovernor:
+    """Holds import write time per row at target_ms by adjusting chunk size and concurrency."""
+
+    def __init__(self, target_ms=1.5, chunk_size=200, min_chunk=25, max_chunk=1000, chunk_step=25,
+                 max_concurrency=8, alpha=0.3, interval=1.0, max_pause=1.0):
+        self.target_ms = target_ms
+        self.initial_chunk = chunk_size
+        self.min_chunk = min_chunk
+        self.max_chunk = max_chunk
+        self.chunk_step = chunk_step
+        self.max_concurrency = max_concurrency
+        self.alpha = alpha
+        self.interval = interval
+        self.max_pause = max_pause
+        self._local = self._initial_state()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return settings.IMPORT_WRITE_GOVERNOR
+
+    def _initial_state(self):
+        return {
+            'ewma_ms': 0.0, 'chunk_size': self.initial_chunk, 'concurrency': self.max_concurrency,
+            'adjusted_at': 0.0, 'samples': 0, 'increases': 0, 'decreases': 0,
+        }
+
+    def _load(self):
+        client = get_redis()
+        if client is None:
+            return dict(self._local)
+        try:
+            raw = client.hgetall(STATE_KEY)
+        except Exception:
+            logger.warning("Write governor state unavailable", exc_info=True)
+            return dict(self._local)
+        state = self._initial_state()
+        for key, value in raw.items():
+            key = key.decode()
+            if key in state:
+                state[key] = type(state[key])(float(value))
+        return state
+
+    def _save(self, state):
+        client = get_redis()
+        if client is None:
+            self._local = state
+            return
+        try:
+            client.hset(STATE_KEY, mapping=state)
+        except Exception:
+            logger.warning("Write governor state not saved", exc_info=True)
+
+    def observe(self, elapsed_ms, rows=1):
+        """Record that writing `rows` rows took elapsed_ms, and adjust."""
+        if not self.enabled:
+            return
+        row_ms = elapsed_ms / max(1, rows)
+        with self._lock:
+            state = self._load()
+            if state['samples']:
+                state['ewma_ms'] += self.alpha * (row_ms - state['ewma_ms'])
+            else:
+                state['ewma_ms'] = float(row_ms)
+            state['samples'] += 1
+            now = time.time()
+            if now - state['adjusted_at'] >= self.interval:
+                if state['ewma_ms'] > self.target_ms:
+                    state['chunk_size'] = max(self.min_chunk, state['chunk_size'] // 2)
+                    state['concurrency'] = max(1, state['concurrency'] // 2)
+                    state['decreases'] += 1
+                else:
+                    state['chunk_size'] = min(self.max_chunk, state['chunk_size'] + self.chunk_step)
+                    state['concurrency'] = min(self.max_concurrency, state['concurrency'] + 1)
+                    state['increases'] += 1
+                state['adjusted_at'] = now
+            self._save(state)
+
+    def chunk_size(self, default):
+        """Rows per new import message; `default` when the governor is off."""
+        return self._load()['chunk_size'] if self.enabled else default
+
+    def concurrency(self):
+        """Import messages allowed in flight."""
+        return self._load()['concurrency'] if self.enabled else self.max_concurrency
+
+    def pace(self, rows=1):
+        """Before writing `rows` rows, sleep for their excess over the target (capped at max_pause)."""
+        if not self.enabled:
+            return
+        excess_ms = (self._load()['ewma_ms'] - self.target_ms) * rows
+        if excess_ms > 0:
+            time.sleep(min(excess_ms / 1000, self.max_pause))
+
+    def get_stats(self):
+        state = self._load()
+        return {
+            'enabled': self.enabled,
+            'shared': get_redis() is not None,
+            'row_target_ms': self.target_ms,
+            'row_write_ms': round(state['ewma_ms'], 3),
+            'chunk_size': state['chunk_size'],
+            'concurrency': state['concurrency'],
+            'samples': state['samples'],
+            'increases': state['increases'],
+            'decreases': state['decreases'],
+        }
+
+
+write_governor = WriteGovernor(
+    target_ms=getattr(settings, 'IMPORT_WRITE_ROW_TARGET_MS', 1.5),
+    chunk_size=getattr(settings, 'BULK_IMPORT_CHUNK_SIZE', 200),
+    min_chunk=getattr(settings, 'IMPORT_CHUNK_SIZE_MIN', 25),
+    max_chunk=getattr(settings, 'IMPORT_CHUNK_SIZE_MAX', 1000),
+    max_concurrency=getattr(settings, 'IMPORT_MAX_IN_FLIGHT', 8),
+)
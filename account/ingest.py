@@ -0,0 +1,276 @@
+# account/ingest.py
+"""
+Streaming ingestion for bulk-upload files.
+
+Uploads are decoded incrementally and parsed lazily, and rows are handed
+on in fixed-size chunks, so peak memory is bounded by the chunk size
+rather than by the size of the file.
+
+CSV and JSON Lines are supported (ROW_READERS), optionally gzip or zstd
+compressed (DECOMPRESSORS). The format comes from the file extension or
+content type; compression is recognised by its magic bytes and undone on
+the fly, chunk by chunk.
+"""
+import codecs
+import csv
+import json
+import zlib
+from itertools import chain, islice
+
+try:
+    from compression import zstd  # Python 3.14+
+except ImportError:
+    zstd = None
+
+READ_SIZE = 64 * 1024
+
+
+class UploadFormatError(ValueError):
+    """The upload's format or compression is unsupported or corrupt."""
+
+
+def iter_text_lines(chunks, encoding='utf-8-sig'):
+    """
+    Decode an iterable of byte chunks incrementally and yield text lines
+    with their line endings. Lines are split on '\\n' only, which is what
+    the csv module expects (it handles '\\r\\n' and quoted newlines itself).
+    """
+    decoder = codecs.getincrementaldecoder(encoding)()
+    pending = ''
+    for chunk in chunks:
+        parts = (pending + decoder.decode(chunk)).split('\n')
+        pending = parts.pop()
+        for part in parts:
+            yield part + '\n'
+    pending += decoder.decode(b'', final=True)
+    if pending:
+        yield pending
+
+
+def iter_csv_rows(chunks):
+    """Yield each CSV record as a dict keyed by the header row."""
+    return csv.DictReader(iter_text_lines(chunks))
+
+
+def chunked(iterable, size):
+    """Yield lists of up to `size` items from iterable."""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def iter_jsonl_rows(chunks):
+    """
+    Yield each JSON Lines record as a dict of strings. Lines that aren't a
+    JSON object yield {} so they fail validation as rows, not the upload.
+    """
+    return jsonl_records(iter_text_lines(chunks))
+
+
+def jsonl_records(lines):
+    """iter_jsonl_rows over text lines."""
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            record = None
+        if not isinstance(record, dict):
+            yield {}
+            continue
+        yield {key: value if value is None or isinstance(value, str) else str(value) for key, value in record.items()}
+
+
+def gunzip_chunks(chunks):
+    """Decompress a (possibly multi-member) gzip stream, READ_SIZE at a time."""
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    pending = False
+    try:
+        for data in chunks:
+            while data:
+                pending = True
+                out = decompressor.decompress(data, READ_SIZE)
+                if out:
+                    yield out
+                if decompressor.eof:
+                    data = decompressor.unused_data
+                    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+                    pending = False
+                else:
+                    data = decompressor.unconsumed_tail
+        tail = decompressor.flush()
+    except zlib.error as exc:
+        raise UploadFormatError(f'Invalid gzip data: {exc}')
+    if tail:
+        yield tail
+    if pending and not decompressor.eof:
+        raise UploadFormatError('Truncated gzip data')
+
+
+def unzstd_chunks(chunks):
+    """Decompress a zstd stream (stdlib on Python 3.14+, else the zstandard package)."""
+    if zstd is not None:
+        decompressor, error = zstd.ZstdDecompressor(), zstd.ZstdError
+    else:
+        try:
+            import zstandard
+        except ImportError:
+            raise UploadFormatError('zstd uploads need Python 3.14+ or the zstandard package')
+        decompressor, error = zstandard.ZstdDecompressor().decompressobj(), zstandard.ZstdError
+    try:
+        for data in chunks:
+            out = decompressor.decompress(data)
+            if out:
+                yield out
+    except error as exc:
+        raise UploadFormatError(f'Invalid zstd data: {exc}')
+
+
+ROW_READERS = {'csv': iter_csv_rows, 'jsonl': iter_jsonl_rows}
+DECOMPRESSORS = {'gzip': gunzip_chunks, 'zstd': unzstd_chunks}
+
+FORMAT_EXTENSIONS = {'.csv': 'csv', '.jsonl': 'jsonl', '.ndjson': 'jsonl'}
+COMPRESSION_EXTENSIONS = {'.gz': 'gzip', '.zst': 'zstd'}
+FORMAT_CONTENT_TYPES = {
+    'text/csv': 'csv',
+    'application/csv': 'csv',
+    'application/jsonl': 'jsonl',
+    'application/x-jsonlines': 'jsonl',
+    'application/x-ndjson': 'jsonl',
+}
+MAGIC_BYTES = {b'\x1f\x8b': 'gzip', b'\x28\xb5\x2f\xfd': 'zstd'}
+MAGIC_LENGTH = max(map(len, MAGIC_BYTES))
+
+
+def _split_compression_extension(filename):
+    name = (filename or '').lower()
+    for ext in COMPRESSION_EXTENSIONS:
+        if name.endswith(ext):
+            return name[:-len(ext)], ext
+    return name, ''
+
+
+def upload_format(filename='', content_type=''):
+    """Row format named by the file extension, else the content type; CSV by default."""
+    name, _ = _split_compression_extension(filename)
+    for ext, name_format in FORMAT_EXTENSIONS.items():
+        if name.endswith(ext):
+            return name_format
+    return FORMAT_CONTENT_TYPES.get((content_type or '').split(';')[0].strip().lower(), 'csv')
+
+
+def upload_suffix(filename='', content_type=''):
+    """File suffix to store an upload under, e.g. '.csv' or '.jsonl.gz'."""
+    _, compression_ext = _split_compression_extension(filename)
+    return f'.{upload_format(filename, content_type)}{compression_ext}'
+
+
+def peek_head(chunks):
+    """
+    (head, chunks): the leading bytes, long enough to hold any magic number
+    unless the data is shorter, and the whole stream again.
+    """
+    chunks = iter(chunks)
+    head = b''
+    for chunk in chunks:
+        head += chunk
+        if len(head) >= MAGIC_LENGTH:
+            break
+    return head, chain([head], chunks)
+
+
+def sniff_compression(head):
+    for magic, compression in MAGIC_BYTES.items():
+        if head.startswith(magic):
+            return compression
+    return None
+
+
+def is_plain_csv(head, filename='', content_type=''):
+    return sniff_compression(head) is None and upload_format(filename, content_type) == 'csv'
+
+
+class LinePositions:
+    """
+    Iterator over text lines that tracks `position`, the byte offset just
+    past the last line handed out. The csv module and jsonl_records never
+    read past the row they return, so before each row it is where that row
+    starts in the byte stream.
+    """
+
+    def __init__(self, lines, position=0):
+        self.lines = iter(lines)
+        self.position = position
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        line = next(self.lines)
+        self.position += len(line.encode('utf-8'))
+        return line
+
+
+def with_offsets(reader, lines):
+    """(offset, row) for each row of reader, which reads from LinePositions lines."""
+    while True:
+        offset = lines.position
+        row = next(reader, None)
+        if row is None:
+            return
+        yield offset, row
+
+
+def iter_row_offsets(chunks, filename='', content_type=''):
+    """
+    (offset, row) for each row of an uncompressed upload, offset being the
+    byte position of the row's first line, so read_rows_at() can read the
+    row again later without the rows before it. Compressed data raises
+    UploadFormatError: there is no offset to seek to.
+    """
+    head, chunks = peek_head(chunks)
+    if sniff_compression(head):
+        raise UploadFormatError('Row offsets need an uncompressed upload')
+    lines = LinePositions(
+        iter_text_lines(chunks), len(codecs.BOM_UTF8) if head.startswith(codecs.BOM_UTF8) else 0
+    )
+    if upload_format(filename, content_type) == 'csv':
+        reader = csv.DictReader(lines)
+        reader.fieldnames  # read the header: rows start after it
+    else:
+        reader = jsonl_records(lines)
+    return with_offsets(reader, lines)
+
+
+def read_rows_at(f, offset, count, filename='', content_type=''):
+    """
+    The `count` rows starting at byte `offset` (from iter_row_offsets) of
+    the uncompressed upload open in binary file f. CSV rows are keyed by
+    the header, which is read from the start of the file.
+    """
+    def read_chunks():
+        return iter(lambda: f.read(READ_SIZE), b'')
+
+    if upload_format(filename, content_type) == 'csv':
+        f.seek(0)
+        fieldnames = csv.DictReader(iter_text_lines(read_chunks())).fieldnames
+        f.seek(offset)
+        reader = csv.DictReader(iter_text_lines(read_chunks(), 'utf-8'), fieldnames)
+    else:
+        f.seek(offset)
+        reader = jsonl_records(iter_text_lines(read_chunks(), 'utf-8'))
+    return list(islice(reader, count))
+
+
+def iter_rows(chunks, filename='', content_type=''):
+    """Rows of an upload in any supported format, decompressed on the fly."""
+    head, chunks = peek_head(chunks)
+    compression = sniff_compression(head)
+    if compression:
+        chunks = DECOMPRESSORS[compression](chunks)
+    return ROW_READERS[upload_format(filename, content_type)](chunks)
@@ -0,0 +1,216 @@
+# account/login_guard.py
+"""
+Keeps login bursts from starving the rest of the API.
+
+Password verification (PBKDF2, tens of ms of CPU) runs on a small bounded
+thread pool; when its queue is full new attempts fail fast instead of
+piling up on every web worker. Attempts are also rate limited per username
+and per client IP with token buckets kept in process memory, or in Redis
+when REDIS_CACHE_URL is set so the limits hold across workers.
+"""
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connections
+
+from .cache import LRUCache, get_redis
+
+logger = logging.getLogger(__name__)
+
+
+class Saturated(Exception):
+    """The executor's queue is full."""
+
+
+class BoundedExecutor:
+    """ThreadPoolExecutor that rejects work beyond workers + queue_size."""
+
+    def __init__(self, workers=2, queue_size=16, name='bounded'):
+        self.workers = workers
+        self.queue_size = queue_size
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=name)
+        self._slots = threading.BoundedSemaphore(workers + queue_size)
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._stats = {'submitted': 0, 'rejected': 0, 'completed': 0, 'max_queue_wait_ms': 0.0, 'max_run_ms': 0.0}
+        self._run_ms = deque(maxlen=1000)
+
+    def submit(self, fn, *args, **kwargs):
+        """Schedule fn, or raise Saturated if the queue is full."""
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._stats['rejected'] += 1
+            raise Saturated()
+        with self._lock:
+            self._stats['submitted'] += 1
+            self._in_flight += 1
+        return self._pool.submit(self._run, time.monotonic(), fn, args, kwargs)
+
+    def _run(self, queued_at, fn, args, kwargs):
+        started = time.monotonic()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            # Pool threads aren't request threads: don't leave DB connections open
+            connections.close_all()
+            finished = time.monotonic()
+            self._slots.release()
+            with self._lock:
+                self._in_flight -= 1
+                self._stats['completed'] += 1
+                self._stats['max_queue_wait_ms'] = max(self._stats['max_queue_wait_ms'], (started - queued_at) * 1000)
+                self._stats['max_run_ms'] = max(self._stats['max_run_ms'], (finished - started) * 1000)
+                self._run_ms.append((finished - started) * 1000)
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['in_flight'] = self._in_flight
+            stats['queue_depth'] = max(0, self._in_flight - self.workers)
+            samples = sorted(self._run_ms)
+        stats['workers'] = self.workers
+        stats['queue_size'] = self.queue_size
+        if samples:
+            stats['run_ms_p50'] = round(samples[len(samples) // 2], 2)
+            stats['run_ms_p95'] = round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 2)
+        return stats
+
+
+# KEYS[1] bucket hash; ARGV rate/s, burst, now, cost. Returns {allowed, retry_after}.
+_TOKEN_BUCKET_LUA = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local data = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(data[1]) or burst
+local ts = tonumber(data[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+local allowed = 0
+local retry_after = 0
+if tokens >= 1 then
+    tokens = tokens - tonumber(ARGV[4])
+    allowed = 1
+else
+    retry_after = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(burst / rate * 1000))
+return {allowed, tostring(retry_after)}
+"""
+
+
+class TokenBucketThrottle:
+    """
+    Token bucket per key: `per_minute` refill rate, up to `burst` tokens.
+    A per_minute of 0 (or less) turns the throttle off.
+    """
+
+    def __init__(self, name, per_minute, burst, max_keys=100000):
+        self.name = name
+        self.rate = max(0.0, per_minute / 60.0)
+        self.burst = burst
+        self._local = LRUCache(maxsize=max_keys, ttl=burst / self.rate if self.rate else 1)
+        self._lock = threading.Lock()
+        self._script = None
+        self._stats = {'allowed': 0, 'throttled': 0}
+
+    @property
+    def enabled(self):
+        return self.rate > 0
+
+    def allow(self, key, cost=1):
+        """
+        Take `cost` tokens for key (0 only checks that one is left).
+        Returns (allowed, retry_after_seconds).
+        """
+        if not self.enabled:
+            return True, 0.0
+        allowed, retry_after = self._take_redis(key, cost)
+        if allowed is None:
+            allowed, retry_after = self._take_local(key, cost)
+        with self._lock:
+            self._stats['allowed' if allowed else 'throttled'] += 1
+        return allowed, retry_after
+
+    def _take_local(self, key, cost):
+        now = time.monotonic()
+        with self._lock:
+            tokens, ts = self._local.get(key) or (self.burst, now)
+            tokens = min(self.burst, tokens + (now - ts) * self.rate)
+            if tokens >= 1:
+                self._local.set(key, (tokens - cost, now))
+                return True, 0.0
+            self._local.set(key, (tokens, now))
+            return False, (1 - tokens) / self.rate
+
+    def _take_redis(self, key, cost):
+        client = get_redis()
+        if client is None:
+            return None, None
+        try:
+            if self._script is None:
+                self._script = client.register_script(_TOKEN_BUCKET_LUA)
+            allowed, retry_after = self._script(
+                keys=[f'throttle:{self.name}:{key}'], args=[self.rate, self.burst, time.time(), cost]
+            )
+            return bool(int(allowed)), float(retry_after)
+        except Exception:
+            logger.warning("Redis throttle %s unavailable, using local bucket", self.name, exc_info=True)
+            return None, None
+
+    def get_stats(self):
+        with self._lock:
+            return dict(self._stats, enabled=self.enabled, per_minute=self.rate * 60, burst=self.burst)
+
+
+password_executor = BoundedExecutor(
+    workers=getattr(settings, 'LOGIN_HASH_WORKERS', 2),
+    queue_size=getattr(settings, 'LOGIN_HASH_QUEUE_SIZE', 16),
+    name='password-hash',
+)
+username_throttle = TokenBucketThrottle(
+    'login-user',
+    per_minute=getattr(settings, 'LOGIN_THROTTLE_USER_PER_MINUTE', 10),
+    burst=getattr(settings, 'LOGIN_THROTTLE_USER_BURST', 10),
+)
+ip_throttle = TokenBucketThrottle(
+    'login-ip',
+    per_minute=getattr(settings, 'LOGIN_THROTTLE_IP_PER_MINUTE', 60),
+    burst=getattr(settings, 'LOGIN_THROTTLE_IP_BURST', 30),
+)
+
+
+def check_login_throttle(username, ip):
+    """
+    Return 0 if the attempt may proceed, else seconds until it may retry.
+    Every attempt costs its IP a token; the username's bucket is only
+    checked here and charged by record_login_failure(), so successful
+    logins never use it up.
+    """
+    for throttle, key, cost in ((ip_throttle, ip, 1), (username_throttle, (username or '').lower(), 0)):
+        if not key:
+            continue
+        allowed, retry_after = throttle.allow(key, cost)
+        if not allowed:
+            return max(1, int(retry_after + 0.999))
+    return 0
+
+
+def record_login_failure(username):
+    """Charge the username's bucket for a failed password check."""
+    if username:
+        username_throttle.allow(username.lower())
+
+
+def get_stats():
+    return {
+        'password_executor': password_executor.get_stats(),
+        'throttle': {
+            'username': username_throttle.get_stats(),
+            'ip': ip_throttle.get_stats(),
+        },
+    }
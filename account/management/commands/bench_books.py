@@ -0,0 +1,92 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test import RequestFactory
+from rest_framework.renderers import JSONRenderer
+
+from account.fast_serializers import BOOK_FIELDS, book_columns, books_json, orjson
+from account.models import Book
+from account.serializers import BookSerializer
+
+
+def _best_ms(fn, repeat):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        elapsed = (time.perf_counter() - started) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the book list serializers: BookSerializer + JSONRenderer against "
+        "the fast path (account/fast_serializers.py), and check the output is byte-identical."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10_000, help="Books to generate when no --user is given")
+        parser.add_argument('--user', type=int, help="Serialize this user's books from the database instead")
+        parser.add_argument('--fields', help="Sparse fieldset, as for ?fields= (e.g. id,title)")
+        parser.add_argument('--repeat', type=int, default=5, help="Runs per path; the best one is reported")
+        parser.add_argument('--host', default='localhost:8000', help="Host the picture URLs are built for")
+
+    def handle(self, *args, **options):
+        fields = [name.strip() for name in options['fields'].split(',')] if options['fields'] else None
+        if fields and set(fields) - set(BOOK_FIELDS):
+            raise CommandError(f"Unknown fields: {', '.join(sorted(set(fields) - set(BOOK_FIELDS)))}")
+        request = RequestFactory().get('/api/books/', HTTP_HOST=options['host'])
+        columns = book_columns(fields)
+
+        if options['user'] is not None:
+            # Both paths include their query
+            queryset = Book.objects.filter(user_id=options['user']).order_by('id')
+            load_books = lambda: list(queryset)
+            load_rows = lambda: list(queryset.values_list(*columns))
+        else:
+            books = self._generate(options['rows'])
+            rows = [
+                tuple(book.picture.name if column == 'picture' else getattr(book, column) for column in columns)
+                for book in books
+            ]
+            load_books = lambda: books
+            load_rows = lambda: rows
+
+        def drf():
+            data = BookSerializer(load_books(), many=True, context={'request': request, 'fields': fields}).data
+            return JSONRenderer().render(data)
+
+        def fast():
+            return books_json(load_rows(), fields, request)
+
+        drf_ms, expected = _best_ms(drf, options['repeat'])
+        fast_ms, body = _best_ms(fast, options['repeat'])
+        count = len(load_rows())
+
+        self.stdout.write(f"books:       {count} ({len(body) / 1024:.0f} KB of JSON)")
+        self.stdout.write(f"encoder:     {'orjson' if orjson is not None else 'json'}")
+        for name, elapsed in (('drf', drf_ms), ('fast', fast_ms)):
+            rate = count / elapsed * 1000 if elapsed else 0
+            self.stdout.write(f"{name:<12} {elapsed:8.1f} ms  {rate:12,.0f} books/s  ({drf_ms / elapsed:.1f}x)")
+
+        if body != expected:
+            offset = next((i for i, (a, b) in enumerate(zip(body, expected)) if a != b), min(len(body), len(expected)))
+            raise CommandError(
+                f"Output differs at byte {offset}: fast {body[offset:offset + 60]!r} "
+                f"vs drf {expected[offset:offset + 60]!r}"
+            )
+        self.stdout.write("output:      identical")
+
+    def _generate(self, rows):
+        return [
+            Book(
+                id=i,
+                title=f'Book {i} — édition "spéciale"',
+                author=f'Author {i % 1000}',
+                description=f'Description of book {i}\nwith a second line\tand a tab  ',
+                picture=f'book_pictures/cover {i}.jpg' if i % 3 == 0 else None,
+                user_id=1 + i % 10,
+            )
+            for i in range(1, rows + 1)
+        ]
@@ -0,0 +1,83 @@
+import csv
+import os
+import resource
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from account.ingest import READ_SIZE, chunked, iter_csv_rows
+from account.parallel_ingest import iter_parallel_rows
+
+
+def _peak_rss_mb():
+    # ru_maxrss is in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _read_chunks(path, size=READ_SIZE):
+    with open(path, 'rb') as f:
+        while True:
+            data = f.read(size)
+            if not data:
+                return
+            yield data
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the bulk-upload parser: rows/s and peak RSS, for the streaming "
+        "parser and the multi-process parser at each --workers count."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', help="CSV file to parse (default: generate one)")
+        parser.add_argument('--rows', type=int, default=1_000_000, help="Rows to generate when no path is given")
+        parser.add_argument('--chunk-size', type=int, default=settings.BULK_UPLOAD_CHUNK_SIZE)
+        parser.add_argument(
+            '--workers', default='0',
+            help="Comma-separated process counts to compare, 0 = streaming parser (e.g. 0,2,4,8)",
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        generated = path is None
+        if generated:
+            path = self._generate(options['rows'])
+
+        try:
+            size_mb = os.path.getsize(path) / 1024 / 1024
+            self.stdout.write(f"file:        {size_mb:.1f} MB")
+            baseline = None
+            for workers in [int(w) for w in options['workers'].split(',')]:
+                if workers > 0:
+                    rows_iter, mode = iter_parallel_rows(path, workers), f"{workers} processes"
+                else:
+                    rows_iter, mode = iter_csv_rows(_read_chunks(path)), "streaming"
+                started = time.perf_counter()
+                rows = chunks = 0
+                for chunk in chunked(rows_iter, options['chunk_size']):
+                    rows += len(chunk)
+                    chunks += 1
+                elapsed = time.perf_counter() - started
+                rate = rows / elapsed if elapsed else 0
+                baseline = baseline or rate
+                self.stdout.write(
+                    f"{mode:<14} {rows} rows in {chunks} chunks: {elapsed:.2f} s, "
+                    f"{rate:,.0f} rows/s ({rate / baseline if baseline else 0:.2f}x)"
+                )
+        finally:
+            if generated:
+                os.unlink(path)
+
+        self.stdout.write(f"peak RSS:    {_peak_rss_mb():.1f} MB")
+
+    def _generate(self, rows):
+        fd, path = tempfile.mkstemp(suffix='.csv')
+        with os.fdopen(fd, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['title', 'author', 'description'])
+            for i in range(rows):
+                writer.writerow([f'Book {i}', f'Author {i % 1000}', f'Description of book {i}, "quoted"\nsecond line'])
+        return path
@@ -1,67 +1,101 @@
 # account/middleware.py
-from django.utils.deprecation import MiddlewareMixin
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
 from django.http import JsonResponse
-from django.utils import timezone
-from .models import AuthToken
+from .auth import aauthenticate_token, authenticate_token
 import logging
 
-class CustomAuthMiddleware(MiddlewareMixin):
+logger = logging.getLogger(__name__)
+
+
+class CustomAuthMiddleware:
     """
     Custom authentication middleware for auth tokens.
     Validates token on every request, sets request.user if valid.
+    Token and user lookups go through account.token_cache, so the common
+    case costs no database round trips; signed tokens are verified locally.
+
+    Sync and async capable: under ASGI the token is validated with the
+    async ORM instead of hopping to a thread.
     """
-    
+    sync_capable = True
+    async_capable = True
+
+    # Skip auth for certain paths (e.g., login, signup, static files)
+    exempt_paths = ('/login', '/signup', '/admin', '/static', '/media')
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        response = self.process_request(request)
+        if response is None:
+            response = self.get_response(request)
+        return self.process_response(request, response)
+
+    async def __acall__(self, request):
+        response = await self.aprocess_request(request)
+        if response is None:
+            response = await self.get_response(request)
+        if hasattr(request, 'auth_token') or not hasattr(request, 'auser'):
+            return self.process_response(request, response)
+        # Session user is a lazy object; resolving it synchronously would
+        # hit the database from the event loop.
+        user = await request.auser()
+        response['X-Auth-Status'] = 'validated' if user.is_authenticated else 'none'
+        return response
+
+    def _get_token(self, request):
+        # Extract token: Header first (API), then cookie (web)
+        auth_header = request.META.get('HTTP_AUTHORIZATION', '')
+        # im checking if header doesn exist i move forward but this should throw error
+        return auth_header[7:] if auth_header.startswith('Bearer ') else request.COOKIES.get('auth_token') # this should throw error
+
     def process_request(self, request):
         """
         Called before view processing.
         Extracts token from Authorization header, validates it.
         """
-
-       
-        # Skip auth for certain paths (e.g., login, signup, static files)
-        exempt_paths = ['/login', '/signup', '/admin', '/static', '/media']
-        if any(request.path.startswith(path) for path in exempt_paths):
+        if request.path.startswith(self.exempt_paths):
             return  # Skip middleware
-        
-        # Extract token: Header first (API), then cookie (web)
-        auth_header = request.META.get('HTTP_AUTHORIZATION', '')
-        # im checking if header doesn exist i move forward but this should throw error
 
-        token_str = auth_header[7:] if auth_header.startswith('Bearer ') else request.COOKIES.get('auth_token') # this should throw error
-        
-        logging.info(f"Auth header: {auth_header}")
-        logging.info(f"Token str: {token_str}")
-        print(f"Token str: {token_str}")
-        print(f"Auth header: {auth_header}")
-        
-        
+        token_str = self._get_token(request)
         if not token_str:
             return self._unauthorized_response("Missing or invalid Authorization header")
-        
+
         # Validate token
-        try:
-            token_obj = AuthToken.objects.get(token=token_str)
-            logging.info(f"Token obj: {token_obj}, user: {token_obj.user}")
-            logging.info(f"is_valid: {token_obj.is_valid()}, is_active: {token_obj.is_active}, status: {token_obj.status}")
-            logging.info(f"expires_at: {token_obj.expires_at}, now: {timezone.now()}")
-            
-            if not token_obj.is_valid():
-                if token_obj.expires_at <= timezone.now():
-                    token_obj.status = 'expired'
-                    token_obj.save()
-                return self._unauthorized_response("Token expired or inactive")
-            
-            if not token_obj.user.is_active:
-                return self._unauthorized_response("User is not active")
-            
-            # Token is valid: set request.user and token metadata
-            request.user = token_obj.user
-            request.auth_token = token_obj  # Optional: attach token object for views
-            request.user_permissions = token_obj.permissions  # Optional: permissions
-            
-            logging.info(f"User set: {request.user}")
-        except AuthToken.DoesNotExist:
-            return self._unauthorized_response("Invalid token")
+        return self._apply(request, *authenticate_token(token_str))
+
+    async def aprocess_request(self, request):
+        """Async version of process_request()."""
+        if request.path.startswith(self.exempt_paths):
+            return
+
+        token_str = self._get_token(request)
+        if not token_str:
+            return self._unauthorized_response("Missing or invalid Authorization header")
+
+        return self._apply(request, *await aauthenticate_token(token_str))
+
+    def _apply(self, request, user, auth, error):
+        if error:
+            return self._unauthorized_response(error)
+        
+        # Token is valid: set request.user and token metadata
+        request.user = user
+        if isinstance(auth, dict):
+            # Signed token: there is no AuthToken object, only its claims
+            request.auth_token = None
+            request.token_claims = auth
+            request.user_permissions = auth['scope']
+        else:
+            request.auth_token = auth  # Optional: attach token object for views
+            request.user_permissions = auth.permissions  # Optional: permissions
+        logger.debug("Authenticated user %s", user.pk)
     
     def _unauthorized_response(self, message):
         """Return 401 Unauthorized response."""
@@ -74,4 +108,4 @@ class CustomAuthMiddleware(MiddlewareMixin):
         """
         # Example: Add custom header
         response['X-Auth-Status'] = 'validated' if hasattr(request, 'user') and request.user.is_authenticated else 'none'
-        return response
\ No newline at end of file
+        return response
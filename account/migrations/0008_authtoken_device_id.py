@@ -0,0 +1,18 @@
+# Generated by Django 6.0 on 2026-10-18 10:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account', '0007_authtoken_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='authtoken',
+            name='device_id',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+    ]
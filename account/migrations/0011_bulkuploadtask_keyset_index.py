@@ -0,0 +1,21 @@
+# Generated by Django 6.0 on 2026-10-18 13:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account', '0010_bulkuploadbatch'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='bulkuploadtask',
+            options={},
+        ),
+        migrations.AddIndex(
+            model_name='bulkuploadtask',
+            index=models.Index(fields=['batch_id', 'updated_at', 'task_id'], name='account_bul_batch_i_759272_idx'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 6.0 on 2026-10-18 13:40
+
+from django.db import migrations, models
+
+
+def mark_existing_ingested(apps, schema_editor):
+    # Batches created before this field were ingested inside the request
+    BulkUploadBatch = apps.get_model('account', 'BulkUploadBatch')
+    BulkUploadBatch.objects.filter(ingested_at__isnull=True).update(ingested_at=models.F('updated_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account', '0011_bulkuploadtask_keyset_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bulkuploadbatch',
+            name='ingested_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(mark_existing_ingested, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 6.0 on 2026-10-18 14:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account', '0012_bulkuploadbatch_ingested_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bulkuploadbatch',
+            name='storage',
+            field=models.CharField(choices=[('rows', 'One BulkUploadTask per row'), ('compact', 'Packed status segments')], default='rows', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='bulkuploadbatch',
+            name='source_path',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+        migrations.CreateModel(
+            name='BulkUploadFailure',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('row_number', models.IntegerField()),
+                ('title', models.CharField(blank=True, default='', max_length=200)),
+                ('author', models.CharField(blank=True, default='', max_length=100)),
+                ('error_message', models.TextField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('batch', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='failures', to='account.bulkuploadbatch')),
+            ],
+            options={
+                'unique_together': {('batch', 'row_number')},
+            },
+        ),
+        migrations.CreateModel(
+            name='BulkUploadSegment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start_row', models.IntegerField()),
+                ('count', models.IntegerField()),
+                ('statuses', models.BinaryField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('batch', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='segments', to='account.bulkuploadbatch')),
+            ],
+            options={
+                'unique_together': {('batch', 'start_row')},
+            },
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 6.0 on 2026-10-18 18:05
+
+from django.db import migrations, models
+
+import account.models
+
+
+def fill_jti(apps, schema_editor):
+    AuthToken = apps.get_model('account', 'AuthToken')
+    tokens = list(AuthToken.objects.filter(jti__isnull=True).only('token'))
+    for token in tokens:
+        token.jti = account.models.new_token_jti()
+    AuthToken.objects.bulk_update(tokens, ['jti'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account', '0015_book_user_id_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='authtoken',
+            name='jti',
+            field=models.CharField(editable=False, max_length=32, null=True),
+        ),
+        migrations.RunPython(fill_jti, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='authtoken',
+            name='jti',
+            field=models.CharField(default=account.models.new_token_jti, editable=False, max_length=32, unique=True),
+        ),
+    ]
@@ -1,8 +1,10 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import User
 import uuid
 
 import hashlib
+import secrets
+from django.conf import settings
 from django.utils import timezone
 from datetime import timedelta
 # Create your models here.
@@ -14,6 +16,16 @@ class Book(models.Model):
     description = models.TextField()
     author = models.CharField(max_length=100,null=False, blank=False)
     picture = models.ImageField(upload_to='book_pictures/', blank=True, null=True)
+    # BulkUploadTask this book was imported from; lets bulk imports map
+    # bulk_create'd rows back to their tasks (MySQL returns no ids)
+    import_task_id = models.UUIDField(unique=True, blank=True, null=True, editable=False)
+
+    class Meta:
+        # the book list pages through a user's books by id (keyset)
+        indexes = [
+            models.Index(fields=['user', 'id']),
+        ]
+
     def __str__(self):
         return self.title
     
@@ -21,10 +33,10 @@ class Book(models.Model):
 class BulkUploadTask(models.Model):
     """Track Status of each csv row upload"""
     STATUS_CHOICES = [
-        ('PENDING', 'Pending'),
-        ('PROCESSING', 'Processing'),
-        ('COMPLETED', 'Completed'),
-        ('FAILED', 'Failed'),
+        ('pending', 'Pending'),
+        ('processing', 'Processing'),
+        ('success', 'Success'),
+        ('failed', 'Failed'),
     ]
 
     task_id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -37,7 +49,7 @@ class BulkUploadTask(models.Model):
 
 
     #status tracking
-    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='PENDING')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
     error_message = models.TextField(blank=True, null=True)
     created_book_id = models.ForeignKey(Book, on_delete=models.SET_NULL, blank=True, null=True)
 
@@ -50,13 +62,157 @@ class BulkUploadTask(models.Model):
     batch_id = models.UUIDField(default=uuid.uuid4)
 
     class Meta:
-        ordering = ['-created_at']
+        # No default ordering: it forced a sort on every query. Batch listings
+        # page by (updated_at, task_id) via the composite index below.
         indexes = [
             models.Index(fields=['batch_id']),
             models.Index(fields=['status']),
+            models.Index(fields=['batch_id', 'updated_at', 'task_id']),
         ]
     def __str__(self):
         return f"{self.task_id} - {self.title} ({self.status})"
+
+    @classmethod
+    def status_counts(cls, batch_id):
+        """{status: count} for a batch in a single grouped query."""
+        rows = cls.objects.filter(batch_id=batch_id).order_by().values('status').annotate(n=models.Count('pk'))
+        counts = {}
+        for row in rows:
+            key = row['status'].lower()
+            counts[key] = counts.get(key, 0) + row['n']
+        return counts
+
+
+class BulkUploadBatch(models.Model):
+    """
+    One row per bulk upload with per-status counters, kept up to date with
+    atomic F() updates by the ingest and import code so batch status
+    reads are O(1) whatever the batch size.
+    """
+    COUNTERS = ('total', 'pending', 'processing', 'success', 'failed')
+    STORAGE_CHOICES = [
+        ('rows', 'One BulkUploadTask per row'),
+        ('compact', 'Packed status segments'),
+    ]
+
+    batch_id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='upload_batches', blank=True, null=True)
+    # 'compact' batches keep row status in BulkUploadSegment and only failed
+    # rows in BulkUploadFailure; source_path is the stored upload, cleared
+    # (and the file deleted) once every row is final
+    storage = models.CharField(max_length=10, choices=STORAGE_CHOICES, default='rows')
+    source_path = models.CharField(max_length=255, blank=True, default='')
+
+    total = models.IntegerField(default=0)
+    pending = models.IntegerField(default=0)
+    processing = models.IntegerField(default=0)
+    success = models.IntegerField(default=0)
+    failed = models.IntegerField(default=0)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    # set once every row has been parsed; until then total keeps growing
+    ingested_at = models.DateTimeField(blank=True, null=True)
+
+    @classmethod
+    def bump(cls, batch_id, **deltas):
+        """Atomically add deltas to counters, e.g. bump(id, pending=-5, processing=5)."""
+        deltas = {name: models.F(name) + delta for name, delta in deltas.items() if delta}
+        if deltas:
+            cls.objects.filter(batch_id=batch_id).update(updated_at=timezone.now(), **deltas)
+
+    def recount(self):
+        """
+        Rebuild the counters from the task rows (one grouped query). The
+        batch row stays locked from the count to the save, so a concurrent
+        bump() waits and then applies its delta on top instead of being lost.
+        """
+        with transaction.atomic():
+            list(BulkUploadBatch.objects.select_for_update().filter(batch_id=self.batch_id).values_list('pk'))
+            counts = BulkUploadTask.status_counts(self.batch_id)
+            for name in self.COUNTERS[1:]:
+                setattr(self, name, counts.get(name, 0))
+            self.total = sum(counts.values())
+            self.save(update_fields=[*self.COUNTERS, 'updated_at'])
+
+    def counters(self):
+        return {name: getattr(self, name) for name in self.COUNTERS}
+
+    @classmethod
+    def counters_from_status_counts(cls, counts):
+        counters = {name: counts.get(name, 0) for name in cls.COUNTERS[1:]}
+        return {'total': sum(counts.values()), **counters}
+
+    def __str__(self):
+        return f"Batch {self.batch_id} ({self.success}/{self.total})"
+
+
+class BulkUploadSegment(models.Model):
+    """
+    Status of rows start_row .. start_row + count - 1 of a compact batch,
+    packed 2 bits per row (see account/compact.py). One segment per import
+    message, so workers never contend for the same row.
+    """
+    batch = models.ForeignKey(BulkUploadBatch, on_delete=models.CASCADE, related_name='segments')
+    start_row = models.IntegerField()
+    count = models.IntegerField()
+    statuses = models.BinaryField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = [('batch', 'start_row')]
+
+    def __str__(self):
+        return f"Segment {self.batch_id} rows {self.start_row}+{self.count}"
+
+
+class BulkUploadFailure(models.Model):
+    """A failed row of a compact batch, the only rows stored individually."""
+    batch = models.ForeignKey(BulkUploadBatch, on_delete=models.CASCADE, related_name='failures')
+    row_number = models.IntegerField()
+    title = models.CharField(max_length=200, blank=True, default='')
+    author = models.CharField(max_length=100, blank=True, default='')
+    error_message = models.TextField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = [('batch', 'row_number')]
+
+    def __str__(self):
+        return f"Row {self.row_number} of {self.batch_id}: {self.error_message}"
+
+
+class ResumableUpload(models.Model):
+    """
+    A bulk upload sent in chunks (see account/resumable.py). Bytes are
+    appended to a spool file under MEDIA_ROOT; `offset` only moves once a
+    chunk is on disk and verified, so clients resume from it.
+    """
+    STATUS_CHOICES = [
+        ('open', 'Open'),
+        ('complete', 'Complete'),
+        ('aborted', 'Aborted'),
+    ]
+
+    upload_id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='resumable_uploads')
+    filename = models.CharField(max_length=255, blank=True, default='')
+    content_type = models.CharField(max_length=100, blank=True, default='')
+    size = models.BigIntegerField(blank=True, null=True)  # declared total, if known
+    offset = models.BigIntegerField(default=0)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='open')
+    batch_id = models.UUIDField(blank=True, null=True)  # set on completion
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # stale upload purge
+            models.Index(fields=['status', 'updated_at']),
+        ]
+
+    def __str__(self):
+        return f"Upload {self.upload_id} ({self.offset}/{self.size or '?'} bytes, {self.status})"
     
 
 # ////////////////////////
@@ -64,6 +220,11 @@ class BulkUploadTask(models.Model):
 
 # account/models.py
 
+def new_token_jti():
+    """Random public id of an AuthToken, used as the jti of its signed form."""
+    return secrets.token_hex(16)
+
+
 class AuthToken(models.Model):
     """
     Custom authentication token model.
@@ -82,6 +243,9 @@ class AuthToken(models.Model):
     permissions = models.JSONField(default=dict, blank=True)  # Optional: {'scope': 'read', 'permissions': ['book.create']}
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='active')
     created_at = models.DateTimeField(auto_now_add=True)
+    device_id = models.CharField(max_length=64, blank=True, default='')  # client/device the session belongs to
+    # Signed tokens are readable by their holder, so they carry this instead of the token
+    jti = models.CharField(max_length=32, unique=True, default=new_token_jti, editable=False)
     
     @staticmethod
     def generate_token():
@@ -91,7 +255,7 @@ class AuthToken(models.Model):
         return hashed
     
     @classmethod
-    def create_token(cls, user, expiration_hours=24, permissions=None):
+    def create_token(cls, user, expiration_hours=24, permissions=None, device_id=''):
         """Create and save a new token."""
         token_str = cls.generate_token()
         expires_at = timezone.now() + timedelta(hours=expiration_hours)
@@ -102,9 +266,68 @@ class AuthToken(models.Model):
             user=user,
             expires_at=expires_at,
             permissions=permissions,
-            status='active'
+            status='active',
+            device_id=device_id,
         )
         return token_obj
+
+    @classmethod
+    def issue_token(cls, user, device_id='', expiration_hours=24, permissions=None):
+        """
+        Sliding session per device: reuse the device's live token and extend
+        its expiry, or create a new one and evict the user's oldest tokens
+        beyond AUTH_TOKEN_MAX_PER_USER.
+        """
+        if device_id:
+            token_obj = (
+                cls.objects
+                .filter(user=user, device_id=device_id, status='active', is_active=True, expires_at__gt=timezone.now())
+                .order_by('-expires_at')
+                .first()
+            )
+            if token_obj is not None:
+                token_obj.extend(expiration_hours)
+                return token_obj
+
+        token_obj = cls.create_token(user, expiration_hours, permissions, device_id=device_id)
+        cls.evict_oldest(user, keep=settings.AUTH_TOKEN_MAX_PER_USER)
+        return token_obj
+
+    @classmethod
+    def evict_oldest(cls, user, keep):
+        """Revoke the user's live tokens beyond the newest `keep`."""
+        from .signed_tokens import denylist
+        from .token_cache import invalidate_token
+
+        stale = list(
+            cls.objects
+            .filter(user=user, status='active', expires_at__gt=timezone.now())
+            .order_by('-created_at')
+            .values_list('token', 'jti', 'expires_at')[keep:]
+        )
+        if not stale:
+            return 0
+        cls.objects.filter(token__in=[token for token, _, _ in stale]).update(status='revoked', is_active=False)
+        for token, jti, expires_at in stale:
+            invalidate_token(token)
+            denylist.add(jti, expires_at.timestamp())
+        return len(stale)
+
+    def extend(self, expiration_hours=24):
+        """
+        Slide expiry to now + expiration_hours. Throttled: skipped unless it
+        moves expiry by at least AUTH_TOKEN_SLIDE_INTERVAL seconds.
+        """
+        from .token_cache import invalidate_token
+
+        new_expires_at = timezone.now() + timedelta(hours=expiration_hours)
+        if (new_expires_at - self.expires_at).total_seconds() < settings.AUTH_TOKEN_SLIDE_INTERVAL:
+            return False
+        updated = AuthToken.objects.filter(token=self.token, status='active').update(expires_at=new_expires_at)
+        if updated:
+            self.expires_at = new_expires_at
+            invalidate_token(self.token)
+        return bool(updated)
     
     def is_valid(self):
         """Check if token is valid (active, not expired)."""
@@ -116,13 +339,24 @@ class AuthToken(models.Model):
         )
     
     def revoke(self):
-        """Revoke the token."""
+        """Revoke the token, drop it from the token cache and deny its signed form."""
+        from .signed_tokens import denylist
+        from .token_cache import invalidate_token
+
         self.status = 'revoked'
         self.is_active = False
         self.save()
+        invalidate_token(self.token)
+        denylist.add(self.jti, self.expires_at.timestamp())
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # per-user lookups of live tokens
+            models.Index(fields=['user', 'status', 'expires_at']),
+            # expiry sweep / purge jobs
+            models.Index(fields=['status', 'expires_at']),
+        ]
     
     def __str__(self):
         return f"Token for {self.user.username} ({self.status})"
\ No newline at end of file
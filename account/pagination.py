@@ -0,0 +1,98 @@
+# account/pagination.py
+"""
+Keyset (cursor) pagination helpers.
+
+Cursors are opaque url-safe strings encoding the sort key of the last row
+a client has seen, so every page is an index range scan no matter how deep
+the client has paged.
+"""
+import base64
+import uuid
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(*parts):
+    raw = '|'.join(str(part) for part in parts)
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, count):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+    except (ValueError, UnicodeDecodeError):
+        raise InvalidCursor(cursor)
+    parts = raw.split('|')
+    if len(parts) != count:
+        raise InvalidCursor(cursor)
+    return parts
+
+
+def parse_limit(value, default, maximum):
+    """Page size from a query param, clamped to [1, maximum]."""
+    try:
+        return max(1, min(int(value), maximum)) if value else default
+    except ValueError:
+        return default
+
+
+def settle_horizon():
+    """updated_at before which every BulkUploadTask change has committed."""
+    return timezone.now() - timedelta(seconds=getattr(settings, 'BATCH_TASKS_SETTLE_SECONDS', 5))
+
+
+def task_changes(queryset, cursor=None, horizon=None):
+    """
+    BulkUploadTasks ordered by (updated_at, task_id), starting after cursor.
+
+    updated_at is stamped before the writing transaction commits, so a row
+    can become visible with an updated_at older than rows a poller has
+    already paged past. With a cursor, rows updated at or after `horizon`
+    (settle_horizon() by default) are therefore held back until the next
+    poll: paging with the returned cursor yields every change whose
+    transaction committed within BATCH_TASKS_SETTLE_SECONDS, at the cost
+    of that much latency. The first page (no cursor) lists every row, and
+    task_cursor() keeps its cursor from passing the horizon.
+    """
+    queryset = queryset.order_by('updated_at', 'task_id')
+    if cursor:
+        updated_at, task_id = decode_cursor(cursor, 2)
+        try:
+            updated_at, task_id = datetime.fromisoformat(updated_at), uuid.UUID(task_id)
+        except ValueError:
+            raise InvalidCursor(cursor)
+        queryset = queryset.filter(
+            Q(updated_at__gt=updated_at) | Q(updated_at=updated_at, task_id__gt=task_id),
+            updated_at__lt=horizon or settle_horizon(),
+        )
+    return queryset
+
+
+def task_cursor(task, horizon=None):
+    """Cursor after task, or at the horizon if task is newer (it will be listed again)."""
+    if horizon is not None and task.updated_at >= horizon:
+        return encode_cursor(horizon.isoformat(), uuid.UUID(int=0))
+    return encode_cursor(task.updated_at.isoformat(), task.task_id)
+
+
+def books_after(queryset, cursor=None):
+    """Books ordered by id, starting after cursor (a (user_id, id) index range scan)."""
+    queryset = queryset.order_by('id')
+    if cursor:
+        (book_id,) = decode_cursor(cursor, 1)
+        try:
+            queryset = queryset.filter(id__gt=int(book_id))
+        except ValueError:
+            raise InvalidCursor(cursor)
+    return queryset
+
+
+def book_cursor(book_id):
+    return encode_cursor(book_id)
@@ -0,0 +1,125 @@
+# account/progress.py
+"""
+Live bulk upload progress for Server-Sent Events watchers.
+
+Ingest and import code calls publish_progress() after each chunk. The
+event (current batch counters plus the ids of the tasks that changed) goes
+out on one Redis pub/sub channel, which the shared listener thread in
+every web process feeds into the local broadcaster. Without Redis the
+event is handed to the broadcaster directly, which only reaches watchers
+in the same process (eager Celery / single-process setups).
+
+Each watcher is an asyncio queue registered with the broadcaster, so
+thousands of open streams share this process's single subscription
+instead of each polling the database.
+"""
+import asyncio
+import json
+import logging
+import threading
+
+from .cache import get_redis, publish, subscribe
+from .models import BulkUploadBatch
+
+logger = logging.getLogger(__name__)
+
+PROGRESS_CHANNEL = 'account:batch:progress'
+
+
+def batch_done(counters, ingested):
+    """True once every row of a fully ingested batch has been imported or failed."""
+    return ingested and counters['pending'] == 0 and counters['processing'] == 0
+
+
+class ProgressBroadcaster:
+    """Fans progress events out to the asyncio queues watching each batch."""
+
+    def __init__(self, queue_size=100):
+        self.queue_size = queue_size
+        self._watchers = {}
+        self._lock = threading.Lock()
+        self._stats = {'received': 0, 'delivered': 0, 'dropped': 0}
+
+    def watch(self, batch_id):
+        """Register a watcher on the running loop; pass the queue to unwatch() when done."""
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        with self._lock:
+            self._watchers.setdefault(str(batch_id), set()).add((asyncio.get_running_loop(), queue))
+        return queue
+
+    def unwatch(self, batch_id, queue):
+        batch_id = str(batch_id)
+        with self._lock:
+            watchers = self._watchers.get(batch_id)
+            if watchers is None:
+                return
+            watchers.difference_update([w for w in watchers if w[1] is queue])
+            if not watchers:
+                del self._watchers[batch_id]
+
+    def deliver(self, event):
+        """Hand event to every watcher of its batch; safe to call from any thread."""
+        with self._lock:
+            self._stats['received'] += 1
+            watchers = list(self._watchers.get(event['batch_id'], ()))
+        for loop, queue in watchers:
+            try:
+                loop.call_soon_threadsafe(self._put, queue, event)
+            except RuntimeError:
+                # Loop already closed; its stream's finally will unwatch
+                pass
+
+    def _put(self, queue, event):
+        # Runs on the watcher's loop. A slow client loses its oldest event
+        # rather than the newest: counters are absolute, so the latest wins.
+        if queue.full():
+            queue.get_nowait()
+            with self._lock:
+                self._stats['dropped'] += 1
+        queue.put_nowait(event)
+        with self._lock:
+            self._stats['delivered'] += 1
+
+    def _on_message(self, message):
+        if message is None:
+            return  # reconnect: the next event carries full counters anyway
+        try:
+            self.deliver(json.loads(message))
+        except (ValueError, KeyError):
+            logger.warning("Malformed progress event: %r", message)
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['batches'] = len(self._watchers)
+            stats['watchers'] = sum(len(w) for w in self._watchers.values())
+        return stats
+
+
+broadcaster = ProgressBroadcaster()
+subscribe(PROGRESS_CHANNEL, broadcaster._on_message)
+
+
+def publish_progress(batch_id, changed=()):
+    """
+    Publish the batch's current counters and the ids of tasks that just
+    changed. Costs one primary-key read; never raises into the import.
+    """
+    try:
+        row = BulkUploadBatch.objects.filter(batch_id=batch_id).values(*BulkUploadBatch.COUNTERS, 'ingested_at').first()
+        if row is None:
+            return
+        ingested = row.pop('ingested_at') is not None
+        event = {
+            'batch_id': str(batch_id),
+            **row,
+            'ingested': ingested,
+            'done': batch_done(row, ingested),
+            'changed': [str(task_id) for task_id in changed],
+        }
+        if get_redis() is None:
+            broadcaster.deliver(event)
+        else:
+            publish(PROGRESS_CHANNEL, json.dumps(event, separators=(',', ':')))
+    except Exception:
+        logger.warning("Could not publish progress for batch %s", batch_id, exc_info=True)
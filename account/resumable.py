@@ -0,0 +1,204 @@
+# account/resumable.py
+"""
+Resumable bulk uploads.
+
+A client creates an upload, PATCHes chunks at the current offset and then
+completes it. Each chunk is streamed straight into a spool file under
+MEDIA_ROOT/bulk_uploads/partial/, checked against its Upload-Checksum
+header ("<algorithm> <base64 digest>", as in tus) and fsynced before the
+stored offset moves. A dropped connection therefore costs at most one
+chunk. Completing an upload renames the spool file into
+MEDIA_ROOT/bulk_uploads/, where the batch import reads it, so the file is
+never copied or loaded into memory.
+"""
+import base64
+import binascii
+import fcntl
+import hashlib
+import os
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.utils import timezone
+
+from .ingest import READ_SIZE, upload_suffix
+from .models import ResumableUpload
+
+CHECKSUM_ALGORITHMS = ('md5', 'sha1', 'sha256')
+
+
+class ResumableUploadError(Exception):
+    status_code = 400
+
+
+class OffsetMismatch(ResumableUploadError):
+    status_code = 409
+
+
+class UploadBusy(ResumableUploadError):
+    status_code = 409
+
+
+class UploadComplete(ResumableUploadError):
+    status_code = 409
+
+
+class UploadAborted(ResumableUploadError):
+    status_code = 410
+
+
+class ChunkTooLarge(ResumableUploadError):
+    status_code = 413
+
+
+class ChecksumMismatch(ResumableUploadError):
+    status_code = 460  # tus' "Checksum Mismatch"
+
+
+def spool_path(upload_id):
+    return os.path.join(settings.MEDIA_ROOT, 'bulk_uploads', 'partial', f'{upload_id}.part')
+
+
+def create_upload(user, filename='', content_type='', size=None):
+    upload = ResumableUpload.objects.create(
+        user=user, filename=filename[:255], content_type=content_type[:100], size=size
+    )
+    path = spool_path(upload.upload_id)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    open(path, 'wb').close()
+    return upload
+
+
+def parse_checksum(header):
+    """(algorithm, digest bytes) from an Upload-Checksum header, or None."""
+    if not header:
+        return None
+    algorithm, _, encoded = header.strip().partition(' ')
+    algorithm = algorithm.lower()
+    if algorithm not in CHECKSUM_ALGORITHMS:
+        raise ResumableUploadError(f'Unsupported checksum algorithm: {algorithm}')
+    try:
+        return algorithm, base64.b64decode(encoded.strip(), validate=True)
+    except (binascii.Error, ValueError):
+        raise ResumableUploadError('Upload-Checksum digest must be base64')
+
+
+def check_open(upload):
+    """Raise unless upload still takes chunks: a closed upload has no spool file."""
+    if upload.status == 'complete':
+        raise UploadComplete('Upload is complete')
+    if upload.status == 'aborted':
+        raise UploadAborted('Upload was aborted')
+
+
+@contextmanager
+def locked_spool(upload, busy_message):
+    """
+    The open upload's spool file, exclusively locked, with upload re-read
+    under the lock. Raises UploadComplete/UploadAborted if it was closed,
+    even by a request that finished in the meantime.
+    """
+    check_open(upload)
+    try:
+        f = open(spool_path(upload.upload_id), 'r+b')
+    except FileNotFoundError:
+        # Completed or aborted since upload was read
+        upload.refresh_from_db(fields=['offset', 'status', 'batch_id'])
+        check_open(upload)
+        raise
+    with f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            raise UploadBusy(busy_message)
+        # Re-check under the lock: a concurrent request may just have committed
+        upload.refresh_from_db(fields=['offset', 'status', 'batch_id'])
+        check_open(upload)
+        yield f
+
+
+def append_chunk(upload, offset, stream, length=None, checksum=None):
+    """
+    Write the chunk read from stream at offset and advance the upload.
+    Nothing past the stored offset is kept unless the whole chunk arrived
+    and matched its checksum. Returns the new offset.
+    """
+    check_open(upload)
+    if offset != upload.offset:
+        raise OffsetMismatch(f'Upload is at offset {upload.offset}')
+    max_chunk = settings.RESUMABLE_UPLOAD_MAX_CHUNK
+    if length is not None and length > max_chunk:
+        raise ChunkTooLarge(f'Chunks are limited to {max_chunk} bytes')
+
+    with locked_spool(upload, 'Another chunk is being written') as f:
+        if offset != upload.offset:
+            raise OffsetMismatch(f'Upload is at offset {upload.offset}')
+
+        # Drop leftovers of an interrupted chunk
+        f.seek(offset)
+        f.truncate()
+        hasher = hashlib.new(checksum[0]) if checksum else None
+        written = 0
+        try:
+            while True:
+                data = stream.read(READ_SIZE)
+                if not data:
+                    break
+                written += len(data)
+                if written > max_chunk:
+                    raise ChunkTooLarge(f'Chunks are limited to {max_chunk} bytes')
+                if upload.size is not None and offset + written > upload.size:
+                    raise ChunkTooLarge(f'Upload is declared as {upload.size} bytes')
+                f.write(data)
+                if hasher:
+                    hasher.update(data)
+            if length is not None and written != length:
+                raise ResumableUploadError(f'Received {written} of {length} bytes')
+            if hasher and hasher.digest() != checksum[1]:
+                raise ChecksumMismatch(f'{checksum[0]} checksum mismatch')
+            f.flush()
+            os.fsync(f.fileno())
+        except BaseException:
+            f.truncate(offset)
+            raise
+
+        new_offset = offset + written
+        ResumableUpload.objects.filter(upload_id=upload.upload_id, offset=offset).update(
+            offset=new_offset, updated_at=timezone.now()
+        )
+        upload.offset = new_offset
+    return new_offset
+
+
+def complete_upload(upload, batch_id):
+    """
+    Move the finished spool file to bulk_uploads/<batch_id><suffix> and
+    return that path, relative to MEDIA_ROOT (a default_storage name).
+    A repeated complete raises UploadComplete; upload.batch_id is then
+    the batch the first one started.
+    """
+    name = f'bulk_uploads/{batch_id}{upload_suffix(upload.filename, upload.content_type)}'
+    with locked_spool(upload, 'A chunk is still being written') as f:
+        if upload.size is not None and upload.offset != upload.size:
+            raise OffsetMismatch(f'Upload has {upload.offset} of {upload.size} bytes')
+        if upload.offset == 0:
+            raise ResumableUploadError('Upload is empty')
+
+        # Leftovers of an interrupted chunk are not part of the upload
+        f.truncate(upload.offset)
+        # Same filesystem: a rename, not a copy
+        os.replace(spool_path(upload.upload_id), os.path.join(settings.MEDIA_ROOT, name))
+        ResumableUpload.objects.filter(upload_id=upload.upload_id).update(
+            status='complete', batch_id=batch_id, updated_at=timezone.now()
+        )
+    upload.status, upload.batch_id = 'complete', batch_id
+    return name
+
+
+def abort_upload(upload):
+    ResumableUpload.objects.filter(upload_id=upload.upload_id).update(status='aborted', updated_at=timezone.now())
+    upload.status = 'aborted'
+    try:
+        os.unlink(spool_path(upload.upload_id))
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,257 @@
+# account/scheduler.py
+"""
+Fair-share dispatch of bulk import messages.
+
+Import jobs are not published to the broker straight away. They wait in
+per-batch Redis lists and are released a few at a time, so the Celery
+queue never holds more than IMPORT_MAX_IN_FLIGHT of them (fewer while the
+write governor, account/governor.py, is backing off). Each release
+picks, by stride scheduling:
+
+- the user whose pass is lowest (every user advances by 1 per job, so
+  users are served round-robin whatever the size of their batches);
+- within that user, the batch whose pass is lowest (a batch advances by
+  1/priority, so a priority 4 batch gets 4 jobs for every 1 of a normal one).
+
+Users and batches join at the current minimum pass, so a user uploading
+10 rows gets the next free slot even while another user's million rows
+are draining. Finished tasks call release(), which frees their slot and
+dispatches the next job. In-flight leases expire after
+CELERY_TASK_TIME_LIMIT in case a worker dies. A job whose publish fails
+goes back to the head of its batch and gives up its slot.
+
+Without Redis (or with IMPORT_FAIR_SCHEDULING off) jobs are published
+immediately, as before.
+"""
+import json
+import logging
+import time
+
+from celery import current_app
+from django.conf import settings
+
+from .cache import get_redis
+from .governor import write_governor
+
+logger = logging.getLogger(__name__)
+
+PREFIX = 'fair:'
+
+# ARGV: prefix, user_id, batch_id, stride, job...
+_ENQUEUE_LUA = """
+local prefix, uid, bid = ARGV[1], ARGV[2], ARGV[3]
+local users = prefix .. 'users'
+local head = redis.call('ZRANGE', users, 0, 0, 'WITHSCORES')
+redis.call('ZADD', users, 'NX', head[2] or 0, uid)
+local batches = prefix .. 'user:' .. uid
+head = redis.call('ZRANGE', batches, 0, 0, 'WITHSCORES')
+redis.call('ZADD', batches, 'NX', head[2] or 0, bid)
+redis.call('HSET', prefix .. 'stride', bid, ARGV[4])
+for i = 5, #ARGV do
+    redis.call('RPUSH', prefix .. 'batch:' .. bid, ARGV[i])
+end
+redis.call('HINCRBY', prefix .. 'depth', uid, #ARGV - 4)
+return #ARGV - 4
+"""
+
+# ARGV: prefix, max_in_flight, now, lease_seconds. Returns a job or nil.
+_DISPATCH_LUA = """
+local prefix, now = ARGV[1], tonumber(ARGV[3])
+local inflight = prefix .. 'inflight'
+redis.call('ZREMRANGEBYSCORE', inflight, '-inf', now - tonumber(ARGV[4]))
+if redis.call('ZCARD', inflight) >= tonumber(ARGV[2]) then
+    return nil
+end
+local users = prefix .. 'users'
+for _ = 1, 100 do
+    local user = redis.call('ZRANGE', users, 0, 0, 'WITHSCORES')
+    if #user == 0 then
+        return nil
+    end
+    local uid, upass = user[1], tonumber(user[2])
+    local batches = prefix .. 'user:' .. uid
+    local batch = redis.call('ZRANGE', batches, 0, 0, 'WITHSCORES')
+    if #batch == 0 then
+        redis.call('ZREM', users, uid)
+    else
+        local bid, bpass = batch[1], tonumber(batch[2])
+        local jobs = prefix .. 'batch:' .. bid
+        local job = redis.call('LPOP', jobs)
+        local stride = tonumber(redis.call('HGET', prefix .. 'stride', bid) or '1')
+        if redis.call('LLEN', jobs) == 0 then
+            redis.call('ZREM', batches, bid)
+            redis.call('HDEL', prefix .. 'stride', bid)
+        else
+            redis.call('ZADD', batches, bpass + stride, bid)
+        end
+        if redis.call('ZCARD', batches) == 0 then
+            redis.call('ZREM', users, uid)
+        else
+            redis.call('ZADD', users, upass + 1, uid)
+        end
+        if job then
+            local decoded = cjson.decode(job)
+            local wait = math.max(0, now - tonumber(decoded['enqueued_at']))
+            local stats = prefix .. 'stats:' .. uid
+            redis.call('HINCRBY', prefix .. 'depth', uid, -1)
+            redis.call('ZADD', inflight, now, decoded['task_id'])
+            redis.call('HINCRBY', stats, 'dispatched', 1)
+            redis.call('HINCRBYFLOAT', stats, 'wait_total', wait)
+            if wait > tonumber(redis.call('HGET', stats, 'wait_max') or '0') then
+                redis.call('HSET', stats, 'wait_max', wait)
+            end
+            return job
+        end
+    end
+end
+return nil
+"""
+
+# ARGV: prefix, user_id, batch_id, stride, task_id, job. Undoes a dispatch
+# whose publish failed: the job goes back to the head of its batch.
+_REQUEUE_LUA = """
+local prefix, uid, bid, stride = ARGV[1], ARGV[2], ARGV[3], tonumber(ARGV[4])
+redis.call('ZREM', prefix .. 'inflight', ARGV[5])
+redis.call('LPUSH', prefix .. 'batch:' .. bid, ARGV[6])
+redis.call('HSET', prefix .. 'stride', bid, stride)
+local function rejoin(key, member, step)
+    if redis.call('ZSCORE', key, member) then
+        redis.call('ZINCRBY', key, -step, member)
+    else
+        local head = redis.call('ZRANGE', key, 0, 0, 'WITHSCORES')
+        redis.call('ZADD', key, head[2] or 0, member)
+    end
+end
+rejoin(prefix .. 'user:' .. uid, bid, stride)
+rejoin(prefix .. 'users', uid, 1)
+redis.call('HINCRBY', prefix .. 'depth', uid, 1)
+redis.call('HINCRBY', prefix .. 'stats:' .. uid, 'dispatched', -1)
+return 1
+"""
+
+
+class FairScheduler:
+    """Holds import jobs in Redis and releases them fairly across users and batches."""
+
+    def __init__(self, max_in_flight=8, lease_seconds=1800):
+        self.max_in_flight = max_in_flight
+        self.lease_seconds = lease_seconds
+        self._scripts = {}
+
+    @property
+    def enabled(self):
+        return settings.IMPORT_FAIR_SCHEDULING and get_redis() is not None
+
+    def _script(self, name, source):
+        if name not in self._scripts:
+            self._scripts[name] = get_redis().register_script(source)
+        return self._scripts[name]
+
+    def submit(self, user_id, batch_id, jobs, priority=1, producer=None):
+        """
+        Queue jobs, given as (task_name, args, task_id), for one batch, then
+        dispatch what the in-flight limit allows. Falls back to publishing
+        directly when the scheduler is off or Redis fails.
+        """
+        if not jobs:
+            return
+        if self.enabled:
+            now = time.time()
+            stride = 1.0 / max(1, priority)
+            # Where the job came from travels with it, so a failed publish can put it back
+            payloads = [
+                json.dumps({
+                    'task': name, 'args': args, 'task_id': task_id, 'enqueued_at': now,
+                    'user_id': user_id or 0, 'batch_id': str(batch_id), 'stride': stride,
+                })
+                for name, args, task_id in jobs
+            ]
+            try:
+                self._script('enqueue', _ENQUEUE_LUA)(args=[PREFIX, user_id or 0, batch_id, stride, *payloads])
+            except Exception:
+                logger.warning("Fair scheduler unavailable, publishing %d jobs directly", len(jobs), exc_info=True)
+            else:
+                self.dispatch(producer=producer)
+                return
+        with current_app.producer_or_acquire(producer) as producer:
+            for name, args, task_id in jobs:
+                current_app.tasks[name].apply_async(args, task_id=task_id, producer=producer)
+
+    def dispatch(self, producer=None):
+        """Publish queued jobs until the in-flight limit is reached. Returns how many."""
+        if not self.enabled:
+            return 0
+        dispatched = 0
+        limit = self.in_flight_limit()
+        script = self._script('dispatch', _DISPATCH_LUA)
+        with current_app.producer_or_acquire(producer) as producer:
+            while True:
+                try:
+                    raw = script(args=[PREFIX, limit, time.time(), self.lease_seconds])
+                except Exception:
+                    logger.warning("Fair scheduler dispatch failed", exc_info=True)
+                    break
+                if raw is None:
+                    break
+                job = json.loads(raw)
+                try:
+                    current_app.tasks[job['task']].apply_async(job['args'], task_id=job['task_id'], producer=producer)
+                except Exception:
+                    # The job left its queue and holds a slot: put both back for the next dispatch
+                    logger.warning("Publishing import job %s failed, requeued", job['task_id'], exc_info=True)
+                    self.requeue(job, raw)
+                    break
+                dispatched += 1
+        return dispatched
+
+    def requeue(self, job, raw):
+        """Return a dispatched job that could not be published to the head of its batch."""
+        try:
+            self._script('requeue', _REQUEUE_LUA)(
+                args=[PREFIX, job['user_id'], job['batch_id'], job['stride'], job['task_id'], raw]
+            )
+        except Exception:
+            logger.error("Import job %s lost: requeue failed", job['task_id'], exc_info=True)
+
+    def in_flight_limit(self):
+        return min(self.max_in_flight, write_governor.concurrency())
+
+    def release(self, task_id):
+        """Called by a finished import task: free its slot and dispatch the next job."""
+        if not self.enabled:
+            return
+        try:
+            get_redis().zrem(PREFIX + 'inflight', task_id)
+        except Exception:
+            logger.warning("Fair scheduler release failed", exc_info=True)
+        self.dispatch()
+
+    def get_stats(self):
+        stats = {'enabled': self.enabled, 'max_in_flight': self.max_in_flight, 'in_flight_limit': self.in_flight_limit()}
+        if not self.enabled:
+            return stats
+        client = get_redis()
+        try:
+            depth = client.hgetall(PREFIX + 'depth')
+            stats['in_flight'] = client.zcard(PREFIX + 'inflight')
+            users = {}
+            for uid, queued in depth.items():
+                uid = uid.decode()
+                raw = {k.decode(): float(v) for k, v in client.hgetall(f'{PREFIX}stats:{uid}').items()}
+                dispatched = int(raw.get('dispatched', 0))
+                users[uid] = {
+                    'queued_jobs': int(queued),
+                    'dispatched': dispatched,
+                    'avg_wait_ms': round(raw.get('wait_total', 0) / dispatched * 1000, 1) if dispatched else None,
+                    'max_wait_ms': round(raw.get('wait_max', 0) * 1000, 1),
+                }
+            stats['users'] = users
+        except Exception:
+            logger.warning("Fair scheduler stats unavailable", exc_info=True)
+        return stats
+
+
+scheduler = FairScheduler(
+    max_in_flight=getattr(settings, 'IMPORT_MAX_IN_FLIGHT', 8),
+    lease_seconds=getattr(settings, 'CELERY_TASK_TIME_LIMIT', 1800),
+)
@@ -12,6 +12,16 @@ class BookSerializer(serializers.ModelSerializer):
         extra_kwargs = {
             'author': {'required': True, 'allow_blank': False},
         }
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Sparse fieldset (context['fields'], e.g. from ?fields=id,title):
+        # dropped fields are never computed, so no picture URL work either
+        fields = self.context.get('fields')
+        if fields:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
     def get_picture_url(self, obj):
         """Return the picture URL if picture exists"""
         if obj.picture:
@@ -0,0 +1,21 @@
+# account/signals.py
+from django.contrib.auth.models import User
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import AuthToken
+from .token_cache import invalidate_token, invalidate_user
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def drop_cached_user(sender, instance, **kwargs):
+    """Deactivation, password changes etc. must not be served from cache."""
+    invalidate_user(instance.pk)
+
+
+@receiver(post_delete, sender=AuthToken)
+def drop_cached_token(sender, instance, **kwargs):
+    # Only valid tokens are ever cached; skip the broadcast for purged rows.
+    if instance.is_valid():
+        invalidate_token(instance.token)
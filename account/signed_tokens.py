@@ -0,0 +1,150 @@
+# account/signed_tokens.py
+"""
+Stateless signed access tokens.
+
+A signed token embeds the public id of its AuthToken row (AuthToken.jti,
+never the opaque token itself: the payload is only signed, not
+encrypted), the user id, the expiry and the permission scope, signed with HMAC-SHA256 through
+django.core.signing. Verifying one needs no database access; revocations
+are tracked in a small in-memory denylist of unexpired revoked jtis that is
+periodically re-synced from the AuthToken table and updated immediately
+over Redis pub/sub when a token is revoked.
+
+Signed tokens start with SIGNED_TOKEN_PREFIX, so they can be told apart
+from the 64-char hex opaque tokens, which keep working side by side.
+"""
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core import signing
+from django.db.models import Q
+from django.utils import timezone
+
+from .cache import ensure_listener, publish, subscribe
+from .models import AuthToken
+
+SIGNED_TOKEN_PREFIX = 'st1.'
+_SALT = 'account.signed_tokens'
+_REVOKED_CHANNEL = 'account:authtoken:revoked'
+
+
+def _signing_key():
+    return getattr(settings, 'AUTH_SIGNED_TOKEN_KEY', None) or settings.SECRET_KEY
+
+
+def is_signed_token(token_str):
+    return token_str.startswith(SIGNED_TOKEN_PREFIX)
+
+
+def make_signed_token(token_obj):
+    """Return the signed form of an AuthToken row."""
+    payload = {
+        'jti': token_obj.jti,
+        'uid': token_obj.user_id,
+        'exp': int(token_obj.expires_at.timestamp()),
+        'scope': token_obj.permissions,
+    }
+    return SIGNED_TOKEN_PREFIX + signing.dumps(payload, key=_signing_key(), salt=_SALT, compress=True)
+
+
+def decode_signed_token(token_str):
+    """Return the claims if signature and expiry check out, else None. No I/O."""
+    try:
+        claims = signing.loads(token_str[len(SIGNED_TOKEN_PREFIX):], key=_signing_key(), salt=_SALT)
+    except signing.BadSignature:
+        return None
+    if claims['exp'] <= time.time():
+        return None
+    # Tokens signed before AuthToken.jti existed carry the opaque token and
+    # can't be revoked: refuse them
+    if len(claims['jti']) != AuthToken._meta.get_field('jti').max_length:
+        return None
+    return claims
+
+
+def verify_signed_token(token_str):
+    """
+    Return the token's claims, or None if the signature is invalid, the
+    token has expired or its jti has been revoked.
+    """
+    claims = decode_signed_token(token_str)
+    if claims is None or claims['jti'] in denylist:
+        return None
+    return claims
+
+
+async def averify_signed_token(token_str):
+    claims = decode_signed_token(token_str)
+    if claims is None:
+        return None
+    if denylist.is_stale():
+        await sync_to_async(denylist.sync)()
+    if denylist.is_revoked(claims['jti']):
+        return None
+    return claims
+
+
+class RevocationDenylist:
+    """jti -> expiry timestamp for revoked tokens that have not expired yet."""
+
+    def __init__(self, sync_interval=30):
+        self.sync_interval = sync_interval
+        self._revoked = {}
+        self._synced_at = 0.0
+        self._lock = threading.Lock()
+        subscribe(_REVOKED_CHANNEL, self._on_message)
+
+    def __contains__(self, jti):
+        if self.is_stale():
+            self.sync()
+        return self.is_revoked(jti)
+
+    def is_stale(self):
+        return time.monotonic() - self._synced_at > self.sync_interval
+
+    def is_revoked(self, jti):
+        """Membership test without the periodic resync (no I/O)."""
+        exp = self._revoked.get(jti)
+        return exp is not None and exp > time.time()
+
+    def __len__(self):
+        return len(self._revoked)
+
+    def add(self, jti, exp, broadcast=True):
+        self._revoked[jti] = exp
+        if broadcast:
+            publish(_REVOKED_CHANNEL, f'{jti} {exp}')
+
+    def sync(self):
+        """Reload the denylist from the AuthToken table."""
+        # Only the very first load (or a forced resync) has to block; after
+        # that, readers keep using the previous set while one thread reloads.
+        if not self._lock.acquire(blocking=not self._synced_at):
+            return
+        try:
+            ensure_listener()
+            rows = (
+                AuthToken.objects
+                .filter(expires_at__gt=timezone.now())
+                .filter(Q(is_active=False) | ~Q(status='active'))
+                .order_by()
+                .values_list('jti', 'expires_at')
+            )
+            self._revoked = {jti: expires_at.timestamp() for jti, expires_at in rows}
+            self._synced_at = time.monotonic()
+        finally:
+            self._lock.release()
+
+    def _on_message(self, message):
+        if message is None:
+            self._synced_at = 0.0  # may have missed revocations: resync
+            return
+        jti, exp = message.split()
+        self._revoked[jti] = float(exp)
+
+
+denylist = RevocationDenylist(
+    sync_interval=getattr(settings, 'AUTH_SIGNED_TOKEN_DENYLIST_SYNC', 30),
+)
@@ -0,0 +1,108 @@
+# account/status_store.py
+"""
+Hot store for BulkUploadTask status.
+
+Import workers record each transition here as the serialized
+/task-status/ payload, and the status views read it before touching
+MySQL. With TASK_STATUS_WRITE_BEHIND the transient 'processing' state
+lives only in this store, and the durable row is written once, in bulk,
+when the task reaches success or failed.
+
+Entries live in Redis, so the store is only enabled when REDIS_CACHE_URL
+is set: an in-process copy would be invisible to the web processes that
+read it. Without Redis, writes are dropped, reads fall back to MySQL and
+write-behind is off.
+"""
+import json
+import logging
+import threading
+import uuid
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from .cache import get_redis
+from .serializers import BulkUploadTaskSerializer
+
+logger = logging.getLogger(__name__)
+
+
+class TaskStatusStore:
+    """Serialized task payloads by task id, with a TTL."""
+
+    def __init__(self, ttl=3600):
+        self.ttl = ttl
+        self._stats = {'hits': 0, 'misses': 0, 'writes': 0}
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return get_redis() is not None
+
+    @property
+    def write_behind(self):
+        """Keep 'processing' in the store only (needs the store to be shared)."""
+        return settings.TASK_STATUS_WRITE_BEHIND and self.enabled
+
+    def _key(self, task_id):
+        return f'taskstatus:{task_id}'
+
+    def _count(self, name, n=1):
+        with self._lock:
+            self._stats[name] += n
+
+    def put_many(self, payloads):
+        """Store {task_id: payload} in one pipelined round trip."""
+        client = get_redis()
+        if not payloads or client is None:
+            return
+        encoded = {str(task_id): json.dumps(data, default=str) for task_id, data in payloads.items()}
+        self._count('writes', len(encoded))
+        try:
+            pipe = client.pipeline(transaction=False)
+            for task_id, raw in encoded.items():
+                pipe.set(self._key(task_id), raw, ex=self.ttl)
+            pipe.execute()
+        except Exception:
+            logger.warning("Task status store write failed", exc_info=True)
+
+    def get(self, task_id):
+        """The stored payload for task_id, or None (caller falls back to MySQL)."""
+        client = get_redis()
+        if client is None:
+            return None
+        try:
+            task_id = str(uuid.UUID(str(task_id)))
+        except ValueError:
+            return None
+        try:
+            raw = client.get(self._key(task_id))
+        except Exception:
+            logger.warning("Task status store read failed", exc_info=True)
+            raw = None
+        self._count('misses' if raw is None else 'hits')
+        return None if raw is None else json.loads(raw)
+
+    async def aget(self, task_id):
+        if get_redis() is None:
+            return self.get(task_id)
+        return await sync_to_async(self.get, thread_sensitive=False)(task_id)
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats['enabled'] = self.enabled
+        stats['write_behind'] = self.write_behind
+        return stats
+
+
+task_status_store = TaskStatusStore(
+    ttl=getattr(settings, 'TASK_STATUS_STORE_TTL', 3600),
+)
+
+
+def record(tasks):
+    """Put the current /task-status/ payload of each task into the store."""
+    if not task_status_store.enabled:
+        return
+    task_status_store.put_many({task.task_id: BulkUploadTaskSerializer(task).data for task in tasks})
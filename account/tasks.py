@@ -1,61 +1,186 @@
-import time
+from contextlib import contextmanager
+from datetime import timedelta
 from celery import shared_task
+from django.conf import settings
 from django.utils import timezone
-from .models import Book, BulkUploadTask
+from django.core.files.storage import default_storage
+from .bulk_import import abort_ingest, ingest_rows, run_import_job
+from .compact import import_segment, ingest_compact, release_source, uncompressed_source
+from .governor import write_governor
+from .ingest import READ_SIZE, UploadFormatError, is_plain_csv, iter_row_offsets, iter_rows
+from .parallel_ingest import iter_parallel_rows
+from .models import AuthToken, BulkUploadBatch, ResumableUpload
+from .resumable import abort_upload
+from .scheduler import scheduler
 
-@shared_task(bind=True, max_retries=3)
-def process_book_upload(self, task_id_str, user_id):
+@shared_task(acks_late=True, reject_on_worker_lost=True)
+def process_book_upload(task_id_str, user_id):
     """
-    Async task: process single CSV row with 0.5s delay
+    Async task: import a single CSV row. Uploads queue chunks now; this
+    name is kept so single-row messages still in a queue drain through
+    the same code path.
+    """
+    write_governor.pace()
+    return run_import_job([task_id_str], user_id)
+
+
+@shared_task(bind=True, acks_late=True, reject_on_worker_lost=True)
+def process_book_upload_chunk(self, task_ids, user_id):
+    """
+    Async task: import a chunk of CSV rows (BULK_IMPORT_CHUNK_SIZE per
+    message) with bulk writes. Returns per-chunk counts and timings.
+    """
+    try:
+        if not scheduler.enabled:
+            # Nothing limits the messages in flight: back off while writes are slow
+            write_governor.pace(len(task_ids))
+        return run_import_job(task_ids, user_id)
+    finally:
+        # Free the fair-scheduler slot and let the next job in
+        scheduler.release(self.request.id)
+
+
+def use_parallel_parse(size):
+    return settings.BULK_UPLOAD_PARSE_WORKERS > 1 and size >= settings.BULK_UPLOAD_PARALLEL_MIN_BYTES
+
+
+@contextmanager
+def stored_rows(path, offsets=False):
+    """
+    Rows of a stored upload: parsed by the process pool when it is a large
+    uncompressed CSV on local disk, streamed (in any format) otherwise.
+    With `offsets`, (offset, row) pairs of an uncompressed upload.
+    """
+    try:
+        local_path = default_storage.path(path)
+    except NotImplementedError:
+        local_path = None
+    if local_path and use_parallel_parse(default_storage.size(path)):
+        with open(local_path, 'rb') as f:
+            head = f.read(8)
+        if is_plain_csv(head, path):
+            yield iter_parallel_rows(local_path, settings.BULK_UPLOAD_PARSE_WORKERS, offsets=offsets)
+            return
+    with default_storage.open(path, 'rb') as f:
+        yield (iter_row_offsets if offsets else iter_rows)(f.chunks(READ_SIZE), path)
+
+
+@shared_task
+def ingest_bulk_upload(path, user_id, batch_id, priority=1):
+    """
+    Coordinator for deferred uploads: parse a stored upload file off the
+    request path and fan the rows out as chunk import messages.
+    """
+    try:
+        with stored_rows(path) as rows:
+            total_rows, valid_rows, _ = ingest_rows(
+                rows, user_id, batch_id,
+                settings.BULK_UPLOAD_CHUNK_SIZE, settings.BULK_IMPORT_CHUNK_SIZE, collect_ids=False, priority=priority,
+            )
+    except (UnicodeDecodeError, UploadFormatError) as exc:
+        return abort_ingest(batch_id, exc)
+    finally:
+        default_storage.delete(path)
+    return {'batch_id': batch_id, 'total_rows': total_rows, 'valid_rows': valid_rows}
+
+
+@shared_task
+def ingest_compact_upload(batch_id, priority=1):
+    """
+    Coordinator for compact batches (see account/compact.py): the stored
+    upload is parsed into packed status segments whose import messages
+    point back into it; the file is deleted once every row is final.
+    """
+    batch = BulkUploadBatch.objects.get(batch_id=batch_id)
+    try:
+        with stored_rows(uncompressed_source(batch), offsets=True) as rows:
+            total_rows, valid_rows = ingest_compact(rows, batch, settings.BULK_COMPACT_SEGMENT_SIZE, priority)
+    except (UnicodeDecodeError, UploadFormatError) as exc:
+        result = abort_ingest(batch_id, exc)
+        release_source(batch_id)
+        return result
+    return {'batch_id': batch_id, 'total_rows': total_rows, 'valid_rows': valid_rows}
+
+
+@shared_task(bind=True, acks_late=True, reject_on_worker_lost=True)
+def process_compact_segment(self, batch_id, start_row, count, offset, user_id):
+    """
+    Async task: import the valid rows of one compact batch segment, read
+    back from the stored upload at byte `offset`.
     """
     try:
-        # Fetch BulkUploadTask record from DB
-        task = BulkUploadTask.objects.get(task_id=task_id_str)
-        
-        # Validate user_id
-        if not user_id:
-            raise ValueError("user_id is required")
-        
-        # Validate title and author
-        if not task.title or not task.author:
-            raise ValueError("Title and author are required")
-        
-        # Mark as processing
-        task.status = 'processing'
-        task.celery_task_id = self.request.id
-        task.save()
-        
-        # Simulate 0.5s delay per entry
-        time.sleep(0.5)
-        
-        # Create Book in DB
-        book = Book.objects.create(
-            title=task.title,
-            author=task.author,
-            description=task.description or "",
-            user_id=user_id
+        return import_segment(batch_id, start_row, count, offset, user_id)
+    finally:
+        scheduler.release(self.request.id)
+
+
+@shared_task
+def dispatch_import_jobs():
+    """Publish queued import jobs into free (or expired) fair-scheduler slots."""
+    return {'dispatched': scheduler.dispatch()}
+
+
+# ///////////////////////////////////////////////////
+# AuthToken lifecycle (scheduled via CELERY_BEAT_SCHEDULE)
+
+@shared_task
+def expire_auth_tokens(batch_size=None):
+    """
+    Flip active tokens past their expiry to 'expired' in indexed batches.
+    Keeps status writes off the request path (the middleware is read-only).
+    """
+    batch_size = batch_size or settings.AUTH_TOKEN_SWEEP_BATCH_SIZE
+    now = timezone.now()
+    expired = 0
+    while True:
+        # MySQL can't UPDATE ... LIMIT through the ORM, so select keys first
+        tokens = list(
+            AuthToken.objects
+            .filter(status='active', expires_at__lte=now)
+            .order_by()
+            .values_list('token', flat=True)[:batch_size]
+        )
+        if not tokens:
+            break
+        expired += AuthToken.objects.filter(token__in=tokens, status='active').update(status='expired')
+        if len(tokens) < batch_size:
+            break
+    return {'expired': expired}
+
+
+@shared_task
+def purge_stale_auth_tokens(retention_days=None, batch_size=None):
+    """
+    Delete expired and revoked tokens whose expiry is older than the
+    retention window, in chunks. Revoked rows are kept until they expire
+    because the signed-token denylist is synced from them.
+    """
+    retention_days = settings.AUTH_TOKEN_RETENTION_DAYS if retention_days is None else retention_days
+    batch_size = batch_size or settings.AUTH_TOKEN_SWEEP_BATCH_SIZE
+    cutoff = timezone.now() - timedelta(days=retention_days)
+    deleted = 0
+    while True:
+        tokens = list(
+            AuthToken.objects
+            .filter(status__in=['expired', 'revoked'], expires_at__lt=cutoff)
+            .order_by()
+            .values_list('token', flat=True)[:batch_size]
         )
-        
-        # Mark as success
-        task.status = 'success'
-        task.created_book_id = book
-        task.completed_at = timezone.now()
-        task.save()
-        
-        return {'task_id': str(task.task_id), 'status': 'success', 'book_id': book.id}
-    
-    except BulkUploadTask.DoesNotExist:
-        return {'error': 'Task record not found'}
-    
-    except Exception as exc:
-        # Mark task as failed and return (do not retry) so the batch API always shows the task
-        try:
-            task = BulkUploadTask.objects.get(task_id=task_id_str)
-            task.status = 'failed'
-            task.error_message = str(exc)
-            task.completed_at = timezone.now()
-            task.save()
-        except BulkUploadTask.DoesNotExist:
-            pass
-
-        return {'task_id': task_id_str, 'status': 'failed', 'error': str(exc)}
\ No newline at end of file
+        if not tokens:
+            break
+        count, _ = AuthToken.objects.filter(token__in=tokens).delete()
+        deleted += count
+        if len(tokens) < batch_size:
+            break
+    return {'deleted': deleted}
+
+
+@shared_task
+def purge_stale_uploads(ttl_hours=None):
+    """Abort open resumable uploads untouched for ttl_hours and delete their spool files."""
+    ttl_hours = settings.RESUMABLE_UPLOAD_TTL_HOURS if ttl_hours is None else ttl_hours
+    cutoff = timezone.now() - timedelta(hours=ttl_hours)
+    stale = list(ResumableUpload.objects.filter(status='open', updated_at__lt=cutoff))
+    for upload in stale:
+        abort_upload(upload)
+    return {'aborted': len(stale)}
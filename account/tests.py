@@ -1,3 +1,1050 @@
-from django.test import TestCase
+import base64
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+import uuid
+from concurrent.futures import Future
+from contextlib import nullcontext
+from datetime import timedelta
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.http import HttpResponse
+from django.test import AsyncRequestFactory, RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from .async_views import AsyncBatchStatusAPIView, AsyncBookListCreateAPIView, BatchProgressStreamView
+from .auth import authenticate_token
+from . import bulk_import
+from .bulk_import import ingest_rows, insert_books, run_import_job
+from . import compact
+from .governor import WriteGovernor
+from . import ingest
+from .ingest import UploadFormatError, iter_csv_rows, iter_row_offsets, iter_rows, read_rows_at, upload_format, upload_suffix
+from . import login_guard
+from .login_guard import Saturated, TokenBucketThrottle
+from .middleware import CustomAuthMiddleware
+from .models import AuthToken, Book, BulkUploadBatch, BulkUploadTask
+from .parallel_ingest import FIELDS, iter_parallel_rows
+from .scheduler import FairScheduler
+from .serializers import BookSerializer, BulkUploadTaskSerializer
+from .signed_tokens import decode_signed_token, denylist, make_signed_token
+from .status_store import task_status_store
+from .token_cache import get_auth_token, token_cache
+from .validation import ColumnarValidator, book_validator, np, pa
+from .tasks import expire_auth_tokens, ingest_compact_upload, process_book_upload, process_book_upload_chunk, process_compact_segment, purge_stale_auth_tokens
+from .views import book_list_page, book_list_query
+
+
+def make_user(username='reader', **extra):
+    return User.objects.create_user(username=username, password='s3cret-pass', **extra)
+
+
+def bearer(token):
+    return {'HTTP_AUTHORIZATION': f'Bearer {token}'}
+
+
+def run_now(fn, *args, **kwargs):
+    future = Future()
+    future.set_result(fn(*args, **kwargs))
+    return future
+
+
+def csv_upload(*rows, name='books.csv'):
+    lines = ['title,author,description', *(','.join(row) for row in rows)]
+    return SimpleUploadedFile(name, ('\n'.join(lines) + '\n').encode(), content_type='text/csv')
+
+
+class MetricsTests(TestCase):
+    def test_staff_token_can_read_metrics(self):
+        staff = make_user('staff', is_staff=True)
+        token = AuthToken.issue_token(staff)
+        response = self.client.get('/metrics/', **bearer(token.token))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('token_cache', response.json())
+
+    def test_non_staff_token_is_forbidden(self):
+        token = AuthToken.issue_token(make_user())
+        response = self.client.get('/metrics/', **bearer(token.token))
+        self.assertEqual(response.status_code, 403)
+
+
+class TokenCacheTests(TestCase):
+    def test_cached_user_holds_only_auth_fields(self):
+        user = make_user()
+        token = AuthToken.issue_token(user)
+        get_auth_token(token.token)
+        cached = token_cache.get(f'u:{user.pk}')
+        self.assertEqual(dict(zip(['id', 'is_staff', 'is_active'], cached)), {'id': user.pk, 'is_staff': False, 'is_active': True})
+        self.assertEqual(get_auth_token(token.token).user.username, 'reader')
+
+    def test_deactivated_user_is_rejected(self):
+        user = make_user()
+        token = AuthToken.issue_token(user)
+        self.assertEqual(authenticate_token(token.token)[0], user)
+        user.is_active = False
+        user.save()
+        self.assertEqual(authenticate_token(token.token)[2], 'User is not active')
+
+
+
+class TokenSweepTests(TestCase):
+    def setUp(self):
+        self.user = make_user()
+
+    def token(self, status='active', expired_days_ago=None):
+        token = AuthToken.create_token(self.user)
+        if expired_days_ago is not None:
+            token.expires_at = timezone.now() - timedelta(days=expired_days_ago)
+        token.status = status
+        token.save()
+        return token
+
+    def test_validation_leaves_the_expiry_to_the_sweep(self):
+        token = self.token(expired_days_ago=0)
+        self.assertEqual(authenticate_token(token.token)[2], 'Token expired or inactive')
+        self.assertEqual(AuthToken.objects.get(pk=token.pk).status, 'active')
+
+    def test_expire_sweeps_past_expiry_in_batches(self):
+        expired = [self.token(expired_days_ago=1) for _ in range(5)]
+        live = self.token()
+        self.assertEqual(expire_auth_tokens(batch_size=2), {'expired': 5})
+        self.assertEqual(set(AuthToken.objects.filter(status='expired').values_list('pk', flat=True)), {t.pk for t in expired})
+        self.assertEqual(AuthToken.objects.get(pk=live.pk).status, 'active')
+        self.assertEqual(expire_auth_tokens(batch_size=2), {'expired': 0})
+
+    def test_purge_keeps_recent_and_unswept_tokens(self):
+        for status in ['expired', 'revoked', 'expired']:
+            self.token(status, expired_days_ago=30)
+        kept = [self.token('revoked', expired_days_ago=1), self.token('active', expired_days_ago=30), self.token()]
+        self.assertEqual(purge_stale_auth_tokens(retention_days=7, batch_size=2), {'deleted': 3})
+        self.assertEqual(set(AuthToken.objects.values_list('pk', flat=True)), {t.pk for t in kept})
+
+
+class DeviceTokenTests(TestCase):
+    def setUp(self):
+        self.user = make_user()
+        # The in-memory test database isn't visible from pool threads
+        self.enterContext(mock.patch.object(login_guard.password_executor, 'submit', run_now))
+
+    def login(self, **headers):
+        response = self.client.post(
+            '/login/', {'username': 'reader', 'password': 's3cret-pass', 'token_format': 'opaque'},
+            HTTP_ACCEPT='application/json', REMOTE_ADDR=str(uuid.uuid4()), **headers,
+        )
+        self.assertEqual(response.status_code, 200)
+        return response.json()['token']
+
+    def test_device_logins_reuse_the_live_token(self):
+        token = self.login(HTTP_X_DEVICE_ID='phone')
+        self.assertEqual(self.login(HTTP_X_DEVICE_ID='phone'), token)
+        self.assertNotEqual(self.login(HTTP_X_DEVICE_ID='laptop'), token)
+        self.assertNotEqual(self.login(), self.login())
+        self.assertEqual(AuthToken.objects.filter(user=self.user).count(), 4)
+
+    def test_expiry_slides_at_most_once_per_interval(self):
+        token = AuthToken.issue_token(self.user, device_id='phone')
+        AuthToken.objects.filter(pk=token.pk).update(expires_at=token.expires_at - timedelta(seconds=60))
+        with override_settings(AUTH_TOKEN_SLIDE_INTERVAL=900):
+            self.assertFalse(AuthToken.objects.get(pk=token.pk).extend())
+        with override_settings(AUTH_TOKEN_SLIDE_INTERVAL=30):
+            self.assertEqual(AuthToken.issue_token(self.user, device_id='phone'), token)
+        self.assertGreater(AuthToken.objects.get(pk=token.pk).expires_at, token.expires_at - timedelta(seconds=60))
+
+    @override_settings(AUTH_TOKEN_MAX_PER_USER=2)
+    def test_new_logins_revoke_the_oldest_tokens(self):
+        oldest, *newest = [self.login() for _ in range(3)]
+        self.assertEqual(authenticate_token(oldest)[2], 'Token expired or inactive')
+        self.assertEqual(AuthToken.objects.get(pk=oldest).status, 'revoked')
+        for token in newest:
+            self.assertEqual(authenticate_token(token)[0], self.user)
+
+
+class SignedTokenTests(TestCase):
+    def setUp(self):
+        self.token = AuthToken.issue_token(make_user())
+        self.signed = make_signed_token(self.token)
+
+    def test_payload_does_not_carry_the_opaque_token(self):
+        claims = decode_signed_token(self.signed)
+        self.assertEqual(claims['jti'], self.token.jti)
+        self.assertNotIn(self.token.token, str(claims))
+
+    def test_tokens_carrying_the_opaque_token_are_refused(self):
+        with mock.patch.object(self.token, 'jti', self.token.token):
+            self.assertIsNone(decode_signed_token(make_signed_token(self.token)))
+
+    def test_revoked_token_is_denied(self):
+        self.assertIsNone(authenticate_token(self.signed)[2])
+        self.token.revoke()
+        self.assertIn(self.token.jti, denylist)
+        self.assertEqual(authenticate_token(self.signed)[2], 'Invalid or expired token')
+
+    def test_denylist_sync_loads_revoked_jtis(self):
+        AuthToken.objects.filter(token=self.token.token).update(status='revoked', is_active=False)
+        denylist.sync()
+        self.assertIn(self.token.jti, denylist)
+        self.assertNotIn(self.token.token, denylist)
+
+    def test_logout_with_signed_token_revokes_the_row(self):
+        response = self.client.post('/logout/', **bearer(self.signed))
+        self.assertEqual(response.status_code, 200)
+        self.token.refresh_from_db()
+        self.assertEqual(self.token.status, 'revoked')
+        self.assertEqual(authenticate_token(self.signed)[2], 'Invalid or expired token')
+
+    def test_evicted_tokens_are_denied(self):
+        AuthToken.evict_oldest(self.token.user, keep=0)
+        self.assertEqual(authenticate_token(self.signed)[2], 'Invalid or expired token')
+
+
+# The in-memory test database isn't visible from pool threads
+@mock.patch('account.bulk_import.inline_executor', None)
+class InlineUploadTests(TestCase):
+    def setUp(self):
+        self.user = make_user()
+        self.token = AuthToken.issue_token(self.user).token
+
+    def test_small_upload_is_answered_with_the_finished_batch(self):
+        upload = csv_upload(('Dune', 'Frank Herbert', 'Spice'), ('', 'Nobody', 'No title'))
+        response = self.client.post('/bulk-upload/', {'file': upload}, **bearer(self.token))
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual(body['status'], 'completed')
+        self.assertEqual(body['total_rows'], 2)
+        self.assertEqual(len(body['task_ids']), 2)
+        self.assertEqual((body['success'], body['failed']), (1, 1))
+        self.assertEqual([task['task_id'] for task in body['tasks']], body['task_ids'])
+        self.assertEqual(list(Book.objects.filter(user=self.user).values_list('title', flat=True)), ['Dune'])
+
+    def test_size_picks_inline_unless_the_client_says_otherwise(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        # ?defer=1 stores the file
+        self.enterContext(override_settings(BULK_UPLOAD_INLINE_MAX_BYTES=64, MEDIA_ROOT=media_root.name))
+        small = ('Dune', 'Frank Herbert', 'Spice')
+        large = ('Emma', 'Jane Austen', 'x' * 64)
+        with mock.patch('account.bulk_import.enqueue_import_jobs') as enqueue:
+            for row, query, status_code in [
+                (small, '', 200), (large, '', 202), (large, '?inline=1', 200), (small, '?inline=0', 202), (small, '?defer=1', 202),
+            ]:
+                with self.subTest(row=row[0], query=query), mock.patch('account.views.ingest_bulk_upload.delay'):
+                    response = self.client.post(f'/bulk-upload/{query}', {'file': csv_upload(row)}, **bearer(self.token))
+                    self.assertEqual(response.status_code, status_code)
+        self.assertEqual(enqueue.call_count, 2)
+
+    def test_jobs_run_on_the_inline_pool(self):
+        executor = mock.Mock(**{'submit.side_effect': run_now})
+        upload = csv_upload(('Dune', 'Frank Herbert', 'Spice'), ('Emma', 'Jane Austen', 'Matchmaking'))
+        with (
+            mock.patch('account.bulk_import.inline_executor', executor),
+            mock.patch('account.bulk_import.write_governor.chunk_size', return_value=1),
+        ):
+            response = self.client.post('/bulk-upload/', {'file': upload}, **bearer(self.token))
+        self.assertEqual((response.status_code, response.json()['success']), (200, 2))
+        self.assertEqual(executor.submit.call_count, 2)
+
+    @override_settings(CELERY_TASK_ALWAYS_EAGER=True)
+    def test_saturated_pool_falls_back_to_the_queue(self):
+        executor = mock.Mock(**{'submit.side_effect': Saturated})
+        upload = csv_upload(('Dune', 'Frank Herbert', 'Spice'))
+        with mock.patch('account.bulk_import.inline_executor', executor):
+            response = self.client.post('/bulk-upload/', {'file': upload}, **bearer(self.token))
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json()['total_rows'], 1)
+        # Eager Celery: the queued job already ran
+        self.assertTrue(Book.objects.filter(user=self.user, title='Dune').exists())
+
+    @override_settings(BULK_UPLOAD_INLINE_MAX_ROWS=2)
+    def test_rows_past_the_inline_cap_are_queued(self):
+        rows = ''.join(f'Book {i},Author {i},\n' for i in range(5))
+        upload = SimpleUploadedFile('books.csv.gz', gzip.compress(f'title,author,description\n{rows}'.encode()))
+        with (
+            mock.patch('account.bulk_import.write_governor.chunk_size', return_value=2),
+            mock.patch('account.bulk_import.enqueue_import_jobs') as enqueue,
+        ):
+            response = self.client.post('/bulk-upload/?inline=1', {'file': upload}, **bearer(self.token))
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json()['total_rows'], 5)
+        self.assertEqual(Book.objects.filter(user=self.user).count(), 2)
+        self.assertEqual(sum(len(task_ids) for call in enqueue.call_args_list for _, task_ids in call.args[0]), 3)
+
+    @override_settings(CELERY_TASK_ALWAYS_EAGER=True)
+    def test_compact_upload_lists_row_fields_and_drops_its_file(self):
+        upload = csv_upload(('Dune', 'Frank Herbert', 'Spice'), ('', 'Nobody', 'No title'))
+        response = self.client.post('/bulk-upload/?storage=compact', {'file': upload}, **bearer(self.token))
+        self.assertEqual(response.status_code, 202)
+        batch = BulkUploadBatch.objects.get(batch_id=response.json()['batch_id'])
+        self.assertEqual(batch.source_path, '')
+        self.assertFalse(default_storage.exists(f'bulk_uploads/{batch.batch_id}.csv'))
+
+        tasks = compact.task_page(batch, None, 10)['tasks']
+        self.assertEqual(
+            [(task['status'], task['title'], task['author']) for task in tasks],
+            [('success', 'Dune', 'Frank Herbert'), ('failed', '', 'Nobody')],
+        )
+        self.assertEqual(set(tasks[0]), {'task_id', 'status', 'title', 'author', 'error_message', 'created_at', 'completed_at'})
+
+    def test_rejected_uploads_leave_no_batch(self):
+        for upload in (csv_upload(), csv_upload(('', 'Nobody', 'No title'))):
+            response = self.client.post('/bulk-upload/', {'file': upload}, **bearer(self.token))
+            self.assertEqual(response.status_code, 400)
+        self.assertFalse(BulkUploadBatch.objects.exists())
+        self.assertFalse(BulkUploadTask.objects.exists())
+
+    def test_undecodable_upload_ends_the_ingest(self):
+        upload = SimpleUploadedFile('books.csv', b'title,author,description\nDune,Frank Herbert,\xff\n')
+        response = self.client.post('/bulk-upload/', {'file': upload}, **bearer(self.token))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['error'], 'File is not valid UTF-8')
+        batch = BulkUploadBatch.objects.get(batch_id=response.json()['batch_id'])
+        self.assertIsNotNone(batch.ingested_at)
+
+
+@override_settings(IMPORT_FAIR_SCHEDULING=False)
+class QueuedIngestTests(TestCase):
+    def setUp(self):
+        self.user = make_user()
+        self.rows = [
+            {'title': f'Book {i}', 'author': 'A', 'description': ''} if i != 2 else {'title': '', 'author': 'A'}
+            for i in range(5)
+        ]
+
+    def test_each_chunk_is_written_with_one_insert(self):
+        batch_id = str(uuid.uuid4())
+        with (
+            mock.patch.object(BulkUploadTask.objects, 'bulk_create', wraps=BulkUploadTask.objects.bulk_create) as bulk_create,
+            mock.patch('account.bulk_import.enqueue_import_jobs') as enqueue,
+        ):
+            total, valid, task_ids = ingest_rows(iter(self.rows), self.user.id, batch_id, chunk_size=2, import_chunk_size=2)
+        self.assertEqual((total, valid, bulk_create.call_count), (5, 4, 3))
+        tasks = BulkUploadTask.objects.filter(batch_id=batch_id)
+        self.assertEqual(set(task_ids), {str(task.task_id) for task in tasks})
+        # Rows go in already carrying the id of the message that imports them
+        jobs = [job for call in enqueue.call_args_list for job in call.args[0]]
+        self.assertEqual(
+            {task_id: celery_task_id for celery_task_id, job_task_ids in jobs for task_id in job_task_ids},
+            {str(task.task_id): task.celery_task_id for task in tasks if task.status == 'pending'},
+        )
+        self.assertEqual(tasks.get(title='').status, 'failed')
+
+    def test_upload_publishes_over_one_producer(self):
+        producer = object()
+        task = mock.Mock()
+        with (
+            mock.patch('account.bulk_import.current_app') as app,
+            mock.patch('account.scheduler.current_app') as scheduler_app,
+            mock.patch('account.bulk_import.write_governor.chunk_size', return_value=1),
+        ):
+            app.producer_or_acquire.return_value = nullcontext(producer)
+            scheduler_app.producer_or_acquire.side_effect = nullcontext
+            scheduler_app.tasks = {process_book_upload_chunk.name: task}
+            ingest_rows(iter(self.rows), self.user.id, str(uuid.uuid4()), chunk_size=2, import_chunk_size=1)
+        # A message per valid row, all published over the upload's one connection
+        self.assertEqual(app.producer_or_acquire.call_count, 1)
+        self.assertEqual([call.kwargs['producer'] for call in task.apply_async.call_args_list], [producer] * 4)
+
+    def test_deferred_upload_is_ingested_by_the_coordinator(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        self.enterContext(override_settings(CELERY_TASK_ALWAYS_EAGER=True, MEDIA_ROOT=media_root.name))
+        token = AuthToken.issue_token(self.user).token
+        upload = csv_upload(('Dune', 'Frank Herbert', 'Spice'), ('Emma', 'Jane Austen', 'Matchmaking'))
+        response = self.client.post('/bulk-upload/?defer=1', {'file': upload}, **bearer(token))
+        self.assertEqual(response.status_code, 202)
+        batch = BulkUploadBatch.objects.get(batch_id=response.json()['batch_id'])
+        self.assertEqual((batch.total, batch.success), (2, 2))
+        self.assertEqual(Book.objects.filter(user=self.user).count(), 2)
+        self.assertEqual(os.listdir(os.path.join(media_root.name, 'bulk_uploads')), [])
+
+
+class BatchCounterTests(TestCase):
+    def setUp(self):
+        self.user = make_user()
+        self.batch_id = str(uuid.uuid4())
+        rows = [{'title': f'Book {i}', 'author': 'A', 'description': ''} for i in range(4)] + [{'title': '', 'author': 'A'}]
+        with mock.patch('account.bulk_import.enqueue_import_jobs') as enqueue:
+            ingest_rows(iter(rows), self.user.id, self.batch_id, chunk_size=2, import_chunk_size=10)
+        self.jobs = [job_task_ids for call in enqueue.call_args_list for _, job_task_ids in call.args[0]]
+
+    def counters(self):
+        return BulkUploadBatch.objects.get(batch_id=self.batch_id).counters()
+
+    def test_counters_follow_ingest_and_import(self):
+        self.assertEqual(self.counters(), {'total': 5, 'pending': 4, 'processing': 0, 'success': 0, 'failed': 1})
+        for task_ids in self.jobs:
+            run_import_job(task_ids, self.user.id)
+        self.assertEqual(self.counters(), {'total': 5, 'pending': 0, 'processing': 0, 'success': 4, 'failed': 1})
+        self.assertEqual(self.counters(), BulkUploadBatch.counters_from_status_counts(BulkUploadTask.status_counts(self.batch_id)))
+
+    def test_crashed_job_rebuilds_the_counters(self):
+        with mock.patch('account.bulk_import.import_chunk', side_effect=RuntimeError('boom')):
+            result = run_import_job(self.jobs[0], self.user.id)
+        self.assertEqual(result['status'], 'failed')
+        self.assertEqual(self.counters()['failed'], 1 + len(self.jobs[0]))
+        self.assertEqual(self.counters(), BulkUploadBatch.counters_from_status_counts(BulkUploadTask.status_counts(self.batch_id)))
+
+    def test_recount_repairs_drifted_counters(self):
+        BulkUploadBatch.bump(self.batch_id, pending=7, success=-2)
+        BulkUploadBatch.objects.get(batch_id=self.batch_id).recount()
+        self.assertEqual(self.counters(), {'total': 5, 'pending': 4, 'processing': 0, 'success': 0, 'failed': 1})
+
+    def test_summary_only_status_reads_the_batch_row(self):
+        token = AuthToken.issue_token(self.user).token
+        authenticate_token(token)  # warm the token cache
+        with self.assertNumQueries(1):
+            response = self.client.get('/batch-status/', {'batch_id': self.batch_id, 'include_tasks': '0'}, **bearer(token))
+        self.assertEqual(response.json(), {'batch_id': self.batch_id, **self.counters()})
+
+
+class CompactStorageTests(TestCase):
+    def setUp(self):
+        self.user = make_user()
+        self.jobs = []
+        patcher = mock.patch('account.compact.scheduler.submit', lambda user_id, batch_id, jobs, **kw: self.jobs.extend(jobs))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def stored_batch(self, name, data):
+        batch_id = uuid.uuid4()
+        path = default_storage.save(f'bulk_uploads/{batch_id}{name}', ContentFile(data))
+        self.addCleanup(default_storage.delete, path)
+        return BulkUploadBatch.objects.create(batch_id=batch_id, user=self.user, storage='compact', source_path=path)
+
+    def test_segment_messages_point_into_the_stored_file(self):
+        lines = [json.dumps({'title': f'Book {i}', 'author': 'A'}) for i in range(5)] + ['{"title": ""}']
+        batch = self.stored_batch('.jsonl.gz', gzip.compress('\n'.join(lines).encode()))
+        with self.settings(BULK_COMPACT_SEGMENT_SIZE=4):
+            ingest_compact_upload.apply(args=[str(batch.batch_id)])
+        batch.refresh_from_db()
+        self.assertEqual(batch.source_path, f'bulk_uploads/{batch.batch_id}.jsonl')
+        self.assertEqual(
+            [args[1:4] for _, args, _ in self.jobs], [[1, 4, 0], [5, 2, len('\n'.join(lines[:4])) + 1]]
+        )
+        self.assertNotIn('Book', json.dumps(self.jobs))
+
+        for _, args, task_id in self.jobs:
+            process_compact_segment.apply(args=args, task_id=task_id)
+        self.assertEqual(Book.objects.filter(user=self.user).count(), 5)
+        batch.refresh_from_db()
+        self.assertEqual((batch.success, batch.failed, batch.source_path), (5, 1, ''))
+
+
+    def test_listing_pages_by_row_and_rejects_since(self):
+        token = AuthToken.issue_token(self.user).token
+        batch = self.stored_batch('.csv', b'title,author\nDune,Frank Herbert\nEmma,Jane Austen\n')
+        ingest_compact_upload.apply(args=[str(batch.batch_id)])
+
+        def poll(**params):
+            return self.client.get('/batch-status/', {'batch_id': str(batch.batch_id), 'limit': 1, **params}, **bearer(token))
+
+        first = poll().json()
+        second = poll(cursor=first['next_cursor']).json()
+        self.assertEqual(
+            [task['task_id'] for task in first['tasks'] + second['tasks']],
+            [f'{batch.batch_id}:1', f'{batch.batch_id}:2'],
+        )
+        self.assertFalse(second['has_more'])
+        response = poll(since=first['next_cursor'])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['error'], compact.SINCE_UNSUPPORTED)
+
+
+class ResumableUploadTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root.name))
+        self.media_root = media_root.name
+        self.ingest = self.enterContext(mock.patch('account.views.ingest_bulk_upload.delay'))
+        self.token = AuthToken.issue_token(make_user()).token
+        response = self.client.post('/bulk-upload/resumable/', {'filename': 'books.csv'}, **bearer(self.token))
+        self.url = reverse('resumable-upload', args=[response.json()['upload_id']])
+
+    def patch(self, data, offset, **headers):
+        return self.client.patch(
+            self.url, data, content_type='application/octet-stream', HTTP_UPLOAD_OFFSET=str(offset),
+            **bearer(self.token), **headers,
+        )
+
+    def complete(self):
+        return self.client.post(self.url, **bearer(self.token))
+
+    def test_chunks_append_at_the_offset_and_complete_hands_over_the_file(self):
+        head, tail = b'title,author\n', b'Dune,Frank Herbert\n'
+        self.assertEqual(self.patch(head, 0).status_code, 204)
+        stale = self.patch(tail, 0)
+        self.assertEqual((stale.status_code, stale['Upload-Offset']), (409, str(len(head))))
+        self.assertEqual(self.client.get(self.url, **bearer(self.token)).json()['offset'], len(head))
+        self.assertEqual(self.patch(tail, len(head)).status_code, 204)
+
+        response = self.complete()
+        self.assertEqual(response.status_code, 202)
+        path, _, batch_id, _ = self.ingest.call_args.args
+        self.assertEqual(batch_id, response.json()['batch_id'])
+        with open(os.path.join(self.media_root, path), 'rb') as f:
+            self.assertEqual(f.read(), head + tail)
+        self.assertEqual(os.listdir(os.path.join(self.media_root, 'bulk_uploads', 'partial')), [])
+
+    def test_checksum_mismatch_keeps_the_offset(self):
+        data = b'title,author\n'
+
+        def checksum(body):
+            return {'HTTP_UPLOAD_CHECKSUM': f'sha256 {base64.b64encode(hashlib.sha256(body).digest()).decode()}'}
+
+        response = self.patch(data, 0, **checksum(b'something else'))
+        self.assertEqual((response.status_code, response.json()['offset']), (460, 0))
+        self.assertEqual(self.patch(data, 0, HTTP_UPLOAD_CHECKSUM='crc32 AAAA').status_code, 400)
+        self.assertEqual(self.patch(data, 0, **checksum(data)).status_code, 204)
+        self.assertEqual(self.client.get(self.url, **bearer(self.token)).json()['offset'], len(data))
+
+    @override_settings(RESUMABLE_UPLOAD_MAX_CHUNK=4)
+    def test_oversized_chunk_is_refused(self):
+        self.assertEqual(self.patch(b'title,author\n', 0).status_code, 413)
+        self.assertEqual(self.client.get(self.url, **bearer(self.token)).json()['offset'], 0)
+
+    def test_repeated_complete_returns_the_first_batch(self):
+        data = b'title,author\nDune,Frank Herbert\n'
+        self.assertEqual(self.patch(data, 0).status_code, 204)
+        first = self.complete()
+        self.assertEqual(first.status_code, 202)
+        again = self.complete()
+        self.assertEqual(again.status_code, 200)
+        self.assertEqual(again.json()['batch_id'], first.json()['batch_id'])
+        self.assertEqual(again.json()['status'], 'complete')
+        self.assertEqual(self.patch(b'Emma,Jane Austen\n', len(data)).status_code, 409)
+
+    def test_aborted_upload_is_gone(self):
+        self.assertEqual(self.client.delete(self.url, **bearer(self.token)).status_code, 204)
+        self.assertEqual(self.patch(b'title,author\n', 0).status_code, 410)
+        self.assertEqual(self.complete().status_code, 410)
+
+
+class AsyncViewTests(TestCase):
+    def setUp(self):
+        self.user = make_user()
+        self.token = AuthToken.issue_token(self.user).token
+        self.factory = AsyncRequestFactory()
+
+    async def call_async(self, view, path, params):
+        request = self.factory.get(path, params, headers={'Accept': 'application/json'})
+        request.user = self.user
+        return await view.as_view()(request)
+
+    async def test_async_middleware_authenticates_tokens(self):
+        async def whoami(request):
+            return HttpResponse(request.user.username)
+
+        middleware = CustomAuthMiddleware(whoami)
+        response = await middleware(self.factory.get('/api/books/', headers={'Authorization': f'Bearer {self.token}'}))
+        self.assertEqual((response.content, response['X-Auth-Status']), (b'reader', 'validated'))
+        response = await middleware(self.factory.get('/api/books/', headers={'Authorization': 'Bearer nope'}))
+        self.assertEqual((response.status_code, json.loads(response.content)['error']), (401, 'Invalid token'))
+
+    async def test_async_book_list_pages_the_users_books(self):
+        ids = [(await Book.objects.acreate(title=f'Book {i}', author='A', user=self.user)).id for i in range(3)]
+        response = await self.call_async(AsyncBookListCreateAPIView, '/api/books/', {'limit': 2, 'fields': 'id'})
+        self.assertEqual(json.loads(response.content), [{'id': id} for id in ids[:2]])
+        response = await self.call_async(AsyncBookListCreateAPIView, '/api/books/', {'cursor': response['X-Next-Cursor']})
+        self.assertEqual([book['id'] for book in json.loads(response.content)], ids[2:])
+
+    async def test_async_batch_status_matches_the_sync_view(self):
+        batch_id = str(uuid.uuid4())
+        for i in range(3):
+            await BulkUploadTask.objects.acreate(batch_id=batch_id, title=f'Book {i}', author='A', status='pending')
+        # Settled tasks, so the cursor doesn't depend on when each view ran
+        await BulkUploadTask.objects.filter(batch_id=batch_id).aupdate(updated_at=timezone.now() - timedelta(minutes=5))
+        params = {'batch_id': batch_id, 'limit': 2}
+        expected = await sync_to_async(self.client.get)('/batch-status/', params, **bearer(self.token))
+        response = await self.call_async(AsyncBatchStatusAPIView, '/batch-status/', params)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content), expected.json())
+
+
+class ProgressStreamTests(TestCase):
+    def setUp(self):
+        self.user = make_user()
+        self.batch_id = str(uuid.uuid4())
+        rows = [{'title': f'Book {i}', 'author': 'A', 'description': ''} for i in range(3)]
+        with mock.patch('account.bulk_import.enqueue_import_jobs') as enqueue:
+            ingest_rows(iter(rows), self.user.id, self.batch_id, chunk_size=10, import_chunk_size=10)
+        (_, self.task_ids), = enqueue.call_args.args[0]
+
+    async def stream(self, **params):
+        request = AsyncRequestFactory().get('/batch-progress/', {'batch_id': self.batch_id, **params})
+        response = await BatchProgressStreamView.as_view()(request)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        return aiter(response.streaming_content)
+
+    async def next_event(self, events):
+        name, data = (await anext(events)).decode().strip().split('\n')
+        return name.removeprefix('event: '), json.loads(data.removeprefix('data: '))
+
+    async def test_snapshot_then_progress_until_done(self):
+        events = await self.stream()
+        name, event = await self.next_event(events)
+        self.assertEqual((name, event['pending'], event['changed']), ('progress', 3, []))
+
+        await sync_to_async(run_import_job)(self.task_ids, self.user.id)
+        name, event = await self.next_event(events)
+        self.assertEqual((name, event['success'], event['done']), ('done', 3, True))
+        self.assertEqual(sorted(event['changed']), sorted(self.task_ids))
+        with self.assertRaises(StopAsyncIteration):
+            await anext(events)
+
+    async def test_finished_batch_closes_after_the_snapshot(self):
+        await sync_to_async(run_import_job)(self.task_ids, self.user.id)
+        events = await self.stream()
+        self.assertEqual((await self.next_event(events))[0], 'done')
+        with self.assertRaises(StopAsyncIteration):
+            await anext(events)
+
+
+class KeysetPaginationTests(TestCase):
+    def test_book_cursor_round_trip(self):
+        user = make_user()
+        ids = [Book.objects.create(title=f'Book {i}', author='A', user=user).id for i in range(5)]
+        Book.objects.create(title='Other', author='B', user=make_user('other'))
+        seen, params = [], {'limit': 2, 'fields': 'id'}
+        while True:
+            request = RequestFactory().get('/api/books/', params)
+            page, fields, limit = book_list_query(Book.objects.filter(user=user), request.GET)
+            body, headers = book_list_page(request, request.GET, list(page), fields, limit)
+            seen.extend(book['id'] for book in json.loads(body))
+            if 'X-Next-Cursor' not in headers:
+                break
+            params['cursor'] = headers['X-Next-Cursor']
+        self.assertEqual(seen, ids)
+
+    def test_batch_status_since_returns_only_settled_changes(self):
+        token = AuthToken.issue_token(make_user()).token
+        batch_id = uuid.uuid4()
+        long_ago = timezone.now() - timedelta(minutes=5)
+        tasks = [
+            BulkUploadTask.objects.create(batch_id=batch_id, title=f'Book {i}', author='A', status='pending')
+            for i in range(3)
+        ]
+        BulkUploadTask.objects.filter(batch_id=batch_id).update(updated_at=long_ago)
+
+        def poll(**params):
+            response = self.client.get('/batch-status/', {'batch_id': str(batch_id), 'limit': 2, **params}, **bearer(token))
+            self.assertEqual(response.status_code, 200)
+            return response.json()
+
+        first = poll()
+        second = poll(since=first['next_cursor'])
+        self.assertTrue(first['has_more'])
+        self.assertEqual(
+            [task['task_id'] for task in first['tasks'] + second['tasks']],
+            [str(task.task_id) for task in sorted(tasks, key=lambda task: task.task_id)],
+        )
+        self.assertEqual(poll(since=second['next_cursor'])['tasks'], [])
+
+        # A change younger than BATCH_TASKS_SETTLE_SECONDS waits for a later poll
+        BulkUploadTask.objects.filter(task_id=tasks[0].task_id).update(status='success', updated_at=timezone.now())
+        self.assertEqual(poll(since=second['next_cursor'])['tasks'], [])
+        BulkUploadTask.objects.filter(task_id=tasks[0].task_id).update(updated_at=long_ago + timedelta(minutes=1))
+        changed = poll(since=second['next_cursor'])
+        self.assertEqual([(task['task_id'], task['status']) for task in changed['tasks']], [(str(tasks[0].task_id), 'success')])
+
+
+    def test_first_page_lists_fresh_tasks_and_later_polls_resend_them(self):
+        token = AuthToken.issue_token(make_user()).token
+        batch_id = uuid.uuid4()
+        tasks = {
+            str(BulkUploadTask.objects.create(batch_id=batch_id, title=f'Book {i}', author='A').task_id) for i in range(2)
+        }
+
+        def poll(**params):
+            response = self.client.get('/batch-status/', {'batch_id': str(batch_id), **params}, **bearer(token))
+            return response.json()
+
+        first = poll()
+        self.assertEqual({task['task_id'] for task in first['tasks']}, tasks)
+        self.assertEqual(poll(since=first['next_cursor'])['tasks'], [])
+        # Once settled they are sent again: the cursor stopped short of them
+        with self.settings(BATCH_TASKS_SETTLE_SECONDS=0):
+            self.assertEqual({task['task_id'] for task in poll(since=first['next_cursor'])['tasks']}, tasks)
+
+
+class WriteGovernorTests(TestCase):
+    def test_samples_are_compared_per_row(self):
+        governor = WriteGovernor(target_ms=1.5, chunk_size=200, interval=0)
+        governor.observe(200, rows=200)  # 1 ms/row: under target
+        self.assertEqual(governor.chunk_size(200), 225)
+        governor.observe(5, rows=1)  # one slow single row pushes the average over
+        self.assertEqual(governor.get_stats()['row_write_ms'], 2.2)
+        self.assertEqual(governor.chunk_size(200), 112)
+
+    def test_slow_writes_halve_and_fast_writes_add_back(self):
+        governor = WriteGovernor(target_ms=1.0, chunk_size=100, min_chunk=25, max_chunk=150, chunk_step=25,
+                                 max_concurrency=8, alpha=1.0, interval=0)
+        for chunk_size, concurrency in [(50, 4), (25, 2), (25, 1), (25, 1)]:
+            governor.observe(10)
+            self.assertEqual((governor.chunk_size(100), governor.concurrency()), (chunk_size, concurrency))
+        for chunk_size, concurrency in [(50, 2), (75, 3)]:
+            governor.observe(0.5)
+            self.assertEqual((governor.chunk_size(100), governor.concurrency()), (chunk_size, concurrency))
+        for _ in range(10):
+            governor.observe(0.5)
+        self.assertEqual((governor.chunk_size(100), governor.concurrency()), (150, 8))
+
+    def test_adjusts_at_most_once_per_interval(self):
+        governor = WriteGovernor(target_ms=1.0, chunk_size=100, alpha=1.0, interval=60)
+        with mock.patch('account.governor.time.time', return_value=1000.0):
+            governor.observe(10)
+            governor.observe(10)
+        self.assertEqual(governor.get_stats()['decreases'], 1)
+        with mock.patch('account.governor.time.time', return_value=1060.0):
+            governor.observe(10)
+        self.assertEqual((governor.get_stats()['decreases'], governor.chunk_size(100)), (2, 25))
+
+    def test_pace_sleeps_off_the_excess(self):
+        governor = WriteGovernor(target_ms=1.0, alpha=1.0, max_pause=0.5)
+        governor.observe(3)
+        with mock.patch('account.governor.time.sleep') as sleep:
+            governor.pace(rows=100)
+            governor.pace(rows=1000)
+        self.assertEqual([call.args[0] for call in sleep.call_args_list], [0.2, 0.5])
+
+    @override_settings(IMPORT_WRITE_GOVERNOR=False)
+    def test_disabled_governor_uses_the_defaults(self):
+        governor = WriteGovernor(target_ms=1.0, max_concurrency=8, interval=0)
+        governor.observe(100)
+        self.assertEqual((governor.chunk_size(200), governor.concurrency(), governor.get_stats()['samples']), (200, 8, 0))
+
+
+class LoginThrottleTests(TestCase):
+    def setUp(self):
+        make_user()
+        throttle = TokenBucketThrottle('test-login-user', per_minute=1, burst=2)
+        for patcher in (
+            mock.patch.object(login_guard, 'username_throttle', throttle),
+            # The in-memory test database isn't visible from pool threads
+            mock.patch.object(login_guard.password_executor, 'submit', run_now),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def login(self, password):
+        return self.client.post('/login/', {'username': 'reader', 'password': password}, REMOTE_ADDR=str(uuid.uuid4()))
+
+    def test_successful_logins_do_not_use_the_username_bucket(self):
+        for _ in range(3):
+            self.assertEqual(self.login('s3cret-pass').status_code, 302)
+
+    def test_failed_logins_exhaust_the_username_bucket(self):
+        for _ in range(2):
+            self.assertEqual(self.login('wrong').status_code, 200)
+        self.assertEqual(self.login('s3cret-pass').status_code, 429)
+
+    def test_zero_rate_disables_the_throttle(self):
+        throttle = TokenBucketThrottle('test-off', per_minute=0, burst=0)
+        self.assertFalse(throttle.enabled)
+        self.assertEqual(throttle.allow('anyone'), (True, 0.0))
+
+
+@skipUnless(os.environ.get('TEST_REDIS_URL'), 'set TEST_REDIS_URL to run the Redis-backed tests')
+@override_settings(IMPORT_FAIR_SCHEDULING=True)
+class FairSchedulerTests(SimpleTestCase):
+    def setUp(self):
+        import redis
+
+        self.redis = redis.Redis.from_url(os.environ['TEST_REDIS_URL'])
+        self.prefix = f'test:{uuid.uuid4().hex}:'
+        self.addCleanup(lambda: [self.redis.delete(key) for key in self.redis.scan_iter(f'{self.prefix}*')])
+        self.enterContext(mock.patch('account.scheduler.get_redis', return_value=self.redis))
+        self.enterContext(mock.patch('account.scheduler.PREFIX', self.prefix))
+        # Earlier imports may have left the shared governor backed off
+        self.enterContext(mock.patch('account.scheduler.write_governor.concurrency', return_value=8))
+        self.published = []
+        task = mock.Mock(**{'apply_async.side_effect': lambda args, task_id, producer: self.published.append(task_id)})
+        app = self.enterContext(mock.patch('account.scheduler.current_app'))
+        app.tasks = {'import': task}
+        app.producer_or_acquire.return_value = nullcontext()
+        self.task = task
+        self.scheduler = FairScheduler(max_in_flight=2)
+
+    def submit(self, user_id, batch_id, *task_ids, priority=1):
+        self.scheduler.submit(user_id, batch_id, [('import', [], task_id) for task_id in task_ids], priority=priority)
+
+    def test_in_flight_limit_holds_jobs_until_a_release(self):
+        self.submit(1, 'b1', 'a', 'b', 'c')
+        self.assertEqual(self.published, ['a', 'b'])
+        self.scheduler.release('a')
+        self.assertEqual(self.published, ['a', 'b', 'c'])
+        self.assertEqual(self.redis.zrange(f'{self.prefix}inflight', 0, -1), [b'b', b'c'])
+
+    def test_users_take_turns(self):
+        self.scheduler.max_in_flight = 0
+        self.submit(1, 'b1', 'a1', 'a2', 'a3')
+        self.submit(2, 'b2', 'x1')
+        self.scheduler.max_in_flight = 10
+        self.scheduler.dispatch()
+        self.assertEqual(self.published, ['a1', 'x1', 'a2', 'a3'])
+
+    def test_priority_batches_get_proportionally_more_turns(self):
+        self.scheduler.max_in_flight = 0
+        self.submit(1, 'b1', *(f'low{i}' for i in range(6)))
+        self.submit(1, 'b2', *(f'high{i}' for i in range(6)), priority=2)
+        self.scheduler.max_in_flight = 6
+        self.scheduler.dispatch()
+        first = [task_id.rstrip('0123456789') for task_id in self.published]
+        self.assertEqual((first.count('high'), first.count('low')), (4, 2))
+
+    def test_failed_publish_puts_the_job_back(self):
+        publish = self.task.apply_async.side_effect
+        self.task.apply_async.side_effect = ConnectionError('broker down')
+        self.submit(1, 'b1', 'a', 'b')
+        self.assertEqual(self.redis.zcard(f'{self.prefix}inflight'), 0)
+        queued = [json.loads(raw)['task_id'] for raw in self.redis.lrange(f'{self.prefix}batch:b1', 0, -1)]
+        self.assertEqual(queued, ['a', 'b'])
+        self.assertEqual(self.scheduler.get_stats()['users']['1']['queued_jobs'], 2)
+
+        self.task.apply_async.side_effect = publish
+        self.assertEqual(self.scheduler.dispatch(), 2)
+        self.assertEqual(self.published, ['a', 'b'])
+
+
+@skipUnless(os.environ.get('TEST_REDIS_URL'), 'set TEST_REDIS_URL to run the Redis-backed tests')
+@override_settings(TASK_STATUS_WRITE_BEHIND=True)
+class TaskStatusStoreTests(TestCase):
+    def setUp(self):
+        import redis
+
+        self.redis = redis.Redis.from_url(os.environ['TEST_REDIS_URL'])
+        self.enterContext(mock.patch('account.status_store.get_redis', return_value=self.redis))
+        self.user = make_user()
+        rows = [{'title': f'Book {i}', 'author': 'A', 'description': ''} for i in range(2)]
+        with mock.patch('account.bulk_import.enqueue_import_jobs') as enqueue:
+            ingest_rows(iter(rows), self.user.id, str(uuid.uuid4()), chunk_size=10, import_chunk_size=10)
+        (_, self.task_ids), = enqueue.call_args.args[0]
+        self.addCleanup(self.redis.delete, *(f'taskstatus:{task_id}' for task_id in self.task_ids))
+
+    def stored_status(self):
+        return [task_status_store.get(task_id)['status'] for task_id in self.task_ids]
+
+    def test_processing_is_only_written_to_the_store(self):
+        seen = []
+
+        def insert(books):
+            seen.append((self.stored_status(), [BulkUploadTask.objects.get(task_id=task_id).status for task_id in self.task_ids]))
+            return insert_books(books)
+
+        with mock.patch('account.bulk_import.insert_books', insert):
+            run_import_job(self.task_ids, self.user.id)
+        self.assertEqual(seen, [(['processing'] * 2, ['pending'] * 2)])
+        self.assertEqual(self.stored_status(), ['success'] * 2)
+        self.assertEqual(set(BulkUploadTask.objects.values_list('status', flat=True)), {'success'})
+
+    def test_status_view_reads_the_store_before_the_database(self):
+        run_import_job(self.task_ids, self.user.id)
+        token = AuthToken.issue_token(self.user).token
+        authenticate_token(token)  # warm the token cache
+        with self.assertNumQueries(0):
+            response = self.client.get('/task-status/', {'task_id': self.task_ids[0]}, **bearer(token))
+        expected = BulkUploadTaskSerializer(BulkUploadTask.objects.get(task_id=self.task_ids[0])).data
+        self.assertEqual(response.json(), json.loads(json.dumps(expected, default=str)))
+
+
+class ColumnarValidatorTests(SimpleTestCase):
+    rows = [
+        {'title': '  Dune  ', 'author': 'Frank Herbert', 'description': 'Spice'},
+        {'title': '   ', 'author': 'Nobody', 'description': 'Blank title'},
+        {'author': 'Nobody', 'description': 'No title'},
+        {'title': 'T' * 201, 'author': 'A' * 101, 'description': 'Too long'},
+        {'title': 'Nul\x00', 'author': 'A', 'description': 'x\x00'},
+    ]
+
+    def serializer_error(self, row):
+        serializer = BookSerializer(data=row)
+        if serializer.is_valid():
+            return None
+        return '; '.join(f'{name}: {messages[0]}' for name, messages in serializer.errors.items())
+
+    def test_backends_agree_with_the_serializer(self):
+        expected = [self.serializer_error(row) for row in self.rows]
+        for backend in ['python', 'numpy', 'pyarrow']:
+            if backend != 'python' and (np if backend == 'numpy' else pa) is None:
+                continue
+            with self.subTest(backend=backend):
+                validator = ColumnarValidator(BookSerializer, ('title', 'author', 'description'), optional=('description',), backend=backend)
+                columns, errors = validator.validate(self.rows)
+                self.assertEqual(errors, expected)
+                self.assertEqual(columns['title'][0], 'Dune')
+
+    def test_missing_description_is_stored_blank(self):
+        columns, errors = book_validator.validate([{'title': 'Dune', 'author': 'Frank Herbert'}])
+        self.assertEqual((columns['description'], errors), ([''], [None]))
+
+
+def zstd_compress(data):
+    if ingest.zstd is not None:
+        return ingest.zstd.compress(data)
+    import zstandard
+
+    return zstandard.ZstdCompressor().compress(data)
+
+
+def have_zstd():
+    try:
+        zstd_compress(b'')
+    except ImportError:
+        return False
+    return True
+
+
+class UploadReaderTests(TestCase):
+    jsonl = b'{"title": "Dune", "author": "Frank Herbert", "year": 1965}\n\nnot json\n[1]\n'
+
+    def pieces(self, data, size=3):
+        return [data[i:i + size] for i in range(0, len(data), size)]
+
+    def test_format_comes_from_the_name_then_the_content_type(self):
+        self.assertEqual(upload_format('books.JSONL.gz'), 'jsonl')
+        self.assertEqual(upload_format('books.txt', 'application/x-ndjson; charset=utf-8'), 'jsonl')
+        self.assertEqual(upload_format('books.txt'), 'csv')
+        self.assertEqual(upload_suffix('books.ndjson.zst'), '.jsonl.zst')
+        self.assertEqual(upload_suffix('upload', 'application/jsonl'), '.jsonl')
+
+    def test_jsonl_values_are_strings_and_bad_lines_are_bad_rows(self):
+        rows = list(iter_rows(self.pieces(self.jsonl), 'books.jsonl'))
+        self.assertEqual(rows, [{'title': 'Dune', 'author': 'Frank Herbert', 'year': '1965'}, {}, {}])
+
+    def test_gzip_is_sniffed_and_read_across_members(self):
+        data = gzip.compress(b'title,author\nDune,Frank Herbert\n') + gzip.compress(b'Emma,Jane Austen\n')
+        rows = list(iter_rows(self.pieces(data), 'books.csv'))
+        self.assertEqual([row['title'] for row in rows], ['Dune', 'Emma'])
+
+    def test_corrupt_gzip_is_an_upload_error(self):
+        data = gzip.compress(b'title,author\nDune,Frank Herbert\n')
+        for broken in (data[:-6], data[:12] + b'garbage' + data[19:]):
+            with self.subTest(length=len(broken)), self.assertRaises(UploadFormatError):
+                list(iter_rows([broken], 'books.csv'))
+
+    @skipUnless(have_zstd(), 'zstd needs Python 3.14+ or the zstandard package')
+    def test_zstd_is_sniffed(self):
+        rows = list(iter_rows(self.pieces(zstd_compress(self.jsonl)), 'upload', 'application/jsonl'))
+        self.assertEqual(rows[0]['title'], 'Dune')
+
+    @mock.patch('account.bulk_import.inline_executor', None)
+    def test_compressed_jsonl_upload_is_imported(self):
+        token = AuthToken.issue_token(make_user()).token
+        upload = SimpleUploadedFile('books.jsonl.gz', gzip.compress(self.jsonl), content_type='application/gzip')
+        response = self.client.post('/bulk-upload/', {'file': upload}, **bearer(token))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.json()['success'], response.json()['failed']), (1, 2))
+        upload = SimpleUploadedFile('books.jsonl.gz', gzip.compress(self.jsonl)[:-6])
+        self.assertEqual(self.client.post('/bulk-upload/', {'file': upload}, **bearer(token)).status_code, 400)
+
+
+class ImportRedeliveryTests(TestCase):
+    def setUp(self):
+        self.user = make_user()
+        self.batch_id = str(uuid.uuid4())
+        jobs = []
+        rows = [
+            {'title': 'Dune', 'author': 'Frank Herbert', 'description': 'Spice'},
+            {'title': 'Emma', 'author': 'Jane Austen', 'description': 'Matchmaking'},
+        ]
+        ingest_rows(rows, self.user.id, self.batch_id, 100, 100, run_jobs=jobs.extend)
+        ((_, self.task_ids),) = jobs
+
+    def counters(self):
+        return BulkUploadBatch.objects.get(batch_id=self.batch_id).counters()
+
+    def test_duplicate_delivery_changes_nothing(self):
+        process_book_upload_chunk.apply(args=[self.task_ids, self.user.id])
+        counters = self.counters()
+        self.assertEqual((counters['success'], counters['pending']), (2, 0))
+
+        result = process_book_upload_chunk.apply(args=[self.task_ids, self.user.id]).get()
+        self.assertEqual(result['success'], 0)
+        self.assertEqual(Book.objects.filter(user=self.user).count(), 2)
+        self.assertEqual(self.counters(), counters)
+
+    def test_redelivery_after_a_crash_reuses_the_books(self):
+        # The first delivery inserted a book, then died before finishing its tasks
+        Book.objects.create(title='Dune', author='Frank Herbert', description='Spice', user=self.user,
+                            import_task_id=self.task_ids[0])
+        BulkUploadTask.objects.filter(task_id__in=self.task_ids).update(status='processing')
+        BulkUploadBatch.bump(self.batch_id, pending=-2, processing=2)
+
+        run_import_job(self.task_ids, self.user.id)
+        self.assertEqual(Book.objects.filter(user=self.user).count(), 2)
+        self.assertEqual(self.counters(), {'total': 2, 'pending': 0, 'processing': 0, 'success': 2, 'failed': 0})
+
+    def test_chunk_links_books_and_fails_bad_rows_alone(self):
+        BulkUploadTask.objects.filter(task_id=self.task_ids[1]).update(title='')
+        result = run_import_job(self.task_ids, self.user.id)
+        self.assertEqual((result['success'], result['failed']), (1, 1))
+        dune, emma = (BulkUploadTask.objects.get(task_id=task_id) for task_id in self.task_ids)
+        self.assertEqual((dune.status, dune.created_book_id.title), ('success', 'Dune'))
+        self.assertEqual((emma.status, emma.created_book_id), ('failed', None))
+        self.assertIn('title', emma.error_message)
+        self.assertEqual(self.counters(), {'total': 2, 'pending': 0, 'processing': 0, 'success': 1, 'failed': 1})
+
+    def test_book_created_by_an_overlapping_delivery_counts_as_inserted(self):
+        books = [
+            Book(title='Dune', author='Frank Herbert', user=self.user, import_task_id=self.task_ids[0]),
+            Book(title='Emma', author='Jane Austen', user_id=None, import_task_id=self.task_ids[1]),
+        ]
+        lookup = bulk_import.imported_ids
+
+        def racing_lookup(import_task_ids):
+            existing = lookup(import_task_ids)
+            # The other delivery commits Dune right after the lookup
+            Book.objects.create(title='Dune', author='Frank Herbert', user=self.user, import_task_id=self.task_ids[0])
+            return existing
+
+        with mock.patch.object(bulk_import, 'imported_ids', racing_lookup):
+            errors = insert_books(books)
+        self.assertEqual(list(errors), [1])
+        self.assertEqual(books[0].pk, Book.objects.get(import_task_id=self.task_ids[0]).pk)
+
+    def test_single_row_task_goes_through_the_chunk_import(self):
+        for _ in range(2):
+            process_book_upload.apply(args=[self.task_ids[0], self.user.id])
+        self.assertEqual(list(Book.objects.filter(user=self.user).values_list('title', flat=True)), ['Dune'])
+        self.assertEqual(self.counters()['success'], 1)
+
+
+class ParallelParseTests(SimpleTestCase):
+    CSV = (
+        '\ufefftitle,author,description\n'
+        'Dune,Frank Herbert,Spice\n'
+        '  Emma ,Jane Austen\n'
+        '"Multi\nline",Someone,"Quoted, ""comma"""\n'
+        '\n'
+        'Only a title\n'
+        ',,\n'
+    ) * 50
+
+    def test_parallel_rows_match_streaming_rows(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', encoding='utf-8', newline='', delete=False) as f:
+            f.write(self.CSV)
+        self.addCleanup(os.unlink, f.name)
+        data = self.CSV.encode()
+        streamed = [tuple(row.get(name) for name in FIELDS) for row in iter_csv_rows([data[:100], data[100:]])]
+        parallel = [tuple(row[name] for name in FIELDS) for row in iter_parallel_rows(f.name, 2, range_size=512)]
+        self.assertEqual(parallel, streamed)
+        self.assertIn(('Only a title', None, None), parallel)
+
+    def test_rows_can_be_read_back_at_their_offsets(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', encoding='utf-8', newline='', delete=False) as f:
+            f.write(self.CSV)
+        self.addCleanup(os.unlink, f.name)
+        with open(f.name, 'rb') as stored:
+            streamed = list(iter_row_offsets(iter(lambda: stored.read(100), b''), f.name))
+            parallel = list(iter_parallel_rows(f.name, 2, range_size=512, offsets=True))
+            self.assertEqual(parallel, streamed)
+            for offset, row in streamed[::7]:
+                self.assertEqual(read_rows_at(stored, offset, 1, f.name), [row])
+            self.assertEqual(read_rows_at(stored, streamed[3][0], 3, f.name), [row for _, row in streamed[3:6]])
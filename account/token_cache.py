@@ -0,0 +1,139 @@
+# account/token_cache.py
+"""
+Cache of validated auth tokens and their users.
+
+Tokens and users are cached under separate keys, so deactivating a user
+takes effect for all of their tokens without scanning them. Only the
+columns authentication needs are cached (never the raw token or the
+password hash); the other User fields load from the database on access.
+
+Without Redis there is no way to tell other processes about a revocation,
+so entries then live for AUTH_TOKEN_CACHE_LOCAL_TTL seconds at most.
+"""
+import hashlib
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.utils import timezone
+
+from .cache import TwoLevelCache
+from .models import AuthToken
+
+token_cache = TwoLevelCache(
+    'authtoken',
+    maxsize=getattr(settings, 'AUTH_TOKEN_CACHE_SIZE', 10000),
+    ttl=getattr(settings, 'AUTH_TOKEN_CACHE_TTL', 300),
+    unshared_ttl=getattr(settings, 'AUTH_TOKEN_CACHE_LOCAL_TTL', 5),
+)
+
+_TOKEN_FIELDS = [f.attname for f in AuthToken._meta.concrete_fields if f.attname != 'token']
+# In model field order, as from_db() expects
+_USER_FIELDS = [f.attname for f in User._meta.concrete_fields if f.attname in ('id', 'is_active', 'is_staff')]
+
+
+def _token_key(token_str):
+    # Never put raw tokens into Redis keys or pub/sub messages.
+    return 't:' + hashlib.sha256(token_str.encode()).hexdigest()
+
+
+def _user_key(user_id):
+    return f'u:{user_id}'
+
+
+def _user_values(user):
+    return [getattr(user, name) for name in _USER_FIELDS]
+
+
+def _user_from_values(values):
+    return User.from_db('default', _USER_FIELDS, values)
+
+
+def _token_values(token_obj):
+    return [getattr(token_obj, name) for name in _TOKEN_FIELDS]
+
+
+def _token_from_values(token_str, values):
+    token_obj = AuthToken.from_db('default', _TOKEN_FIELDS, values)
+    token_obj.token = token_str
+    return token_obj
+
+
+def get_user(user_id):
+    """Return the User with user_id, from cache when possible."""
+    values = token_cache.get(_user_key(user_id))
+    if values is not None:
+        return _user_from_values(values)
+    user = User.objects.filter(pk=user_id).first()
+    if user is not None:
+        token_cache.set(_user_key(user_id), _user_values(user))
+    return user
+
+
+async def aget_user(user_id):
+    values = await token_cache.aget(_user_key(user_id))
+    if values is not None:
+        return _user_from_values(values)
+    user = await User.objects.filter(pk=user_id).afirst()
+    if user is not None:
+        await token_cache.aset(_user_key(user_id), _user_values(user))
+    return user
+
+
+def get_auth_token(token_str):
+    """
+    Return the AuthToken for token_str with ``user`` loaded, or None if it
+    does not exist. Validity is left to the caller (token.is_valid()).
+    """
+    key = _token_key(token_str)
+    values = token_cache.get(key)
+    if values is not None:
+        token_obj = _token_from_values(token_str, values)
+        user = get_user(token_obj.user_id)
+        if user is None:
+            return None
+        token_obj.user = user
+        return token_obj
+
+    try:
+        token_obj = AuthToken.objects.select_related('user').get(token=token_str)
+    except AuthToken.DoesNotExist:
+        return None
+
+    # Only usable tokens are cached, and never past their expiry.
+    if token_obj.is_valid():
+        remaining = (token_obj.expires_at - timezone.now()).total_seconds()
+        token_cache.set(key, _token_values(token_obj), ttl=remaining)
+        token_cache.set(_user_key(token_obj.user_id), _user_values(token_obj.user))
+    return token_obj
+
+
+async def aget_auth_token(token_str):
+    """Async version of get_auth_token() using the async ORM."""
+    key = _token_key(token_str)
+    values = await token_cache.aget(key)
+    if values is not None:
+        token_obj = _token_from_values(token_str, values)
+        user = await aget_user(token_obj.user_id)
+        if user is None:
+            return None
+        token_obj.user = user
+        return token_obj
+
+    try:
+        token_obj = await AuthToken.objects.select_related('user').aget(token=token_str)
+    except AuthToken.DoesNotExist:
+        return None
+
+    if token_obj.is_valid():
+        remaining = (token_obj.expires_at - timezone.now()).total_seconds()
+        await token_cache.aset(key, _token_values(token_obj), ttl=remaining)
+        await token_cache.aset(_user_key(token_obj.user_id), _user_values(token_obj.user))
+    return token_obj
+
+
+def invalidate_token(token_str):
+    token_cache.invalidate(_token_key(token_str))
+
+
+def invalidate_user(user_id):
+    token_cache.invalidate(_user_key(user_id))
@@ -0,0 +1,127 @@
+# account/validation.py
+"""
+Columnar validation of bulk-upload rows against the BookSerializer rules.
+
+The per-field rules (required, allow_blank, max_length, whitespace
+trimming, no NUL characters) are read from BookSerializer's fields, which
+derive them from the Book model, so they cannot drift from what the API
+enforces. A chunk of rows is checked one column at a time. The length and
+character checks run as pyarrow compute kernels when pyarrow is
+installed, as NumPy array comparisons when only NumPy is, and in plain
+Python otherwise.
+"""
+from functools import cached_property
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+except ImportError:
+    pa = pc = None
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from .serializers import BookSerializer
+
+BACKEND = 'pyarrow' if pa is not None else 'numpy' if np is not None else 'python'
+
+NULL_CHARACTERS_MESSAGE = 'Null characters are not allowed.'
+
+
+def _flags_pyarrow(values, max_length):
+    arr = pa.array(values, type=pa.string())
+    lengths = pc.utf8_length(arr)
+    blank = pc.indices_nonzero(pc.equal(lengths, 0)).to_pylist()
+    too_long = pc.indices_nonzero(pc.greater(lengths, max_length)).to_pylist() if max_length else []
+    nul = pc.indices_nonzero(pc.match_substring(arr, '\x00')).to_pylist()
+    return blank, too_long, nul
+
+
+def _flags_numpy(values, max_length):
+    lengths = np.fromiter(map(len, values), dtype=np.int64, count=len(values))
+    blank = np.flatnonzero(lengths == 0).tolist()
+    too_long = np.flatnonzero(lengths > max_length).tolist() if max_length else []
+    has_nul = np.fromiter(('\x00' in value for value in values), dtype=bool, count=len(values))
+    return blank, too_long, np.flatnonzero(has_nul).tolist()
+
+
+def _flags_python(values, max_length):
+    lengths = [len(value) for value in values]
+    blank = [i for i, n in enumerate(lengths) if n == 0]
+    too_long = [i for i, n in enumerate(lengths) if n > max_length] if max_length else []
+    nul = [i for i, value in enumerate(values) if '\x00' in value]
+    return blank, too_long, nul
+
+
+_FLAGS = {'pyarrow': _flags_pyarrow, 'numpy': _flags_numpy, 'python': _flags_python}
+
+
+class ColumnarValidator:
+    """
+    Validate chunks of row dicts against a serializer's CharField rules.
+    Fields listed in `optional` may be missing or blank (stored as '').
+    """
+
+    def __init__(self, serializer_class, fields, optional=(), backend=BACKEND):
+        self.serializer_class = serializer_class
+        self.field_names = tuple(fields)
+        self.optional = frozenset(optional)
+        self._flags = _FLAGS[backend]
+
+    @cached_property
+    def rules(self):
+        # Built on first use: serializer fields need the app registry
+        fields = self.serializer_class().fields
+        rules = []
+        for name in self.field_names:
+            field = fields[name]
+            optional = name in self.optional
+            rules.append({
+                'name': name,
+                'required': field.required and not optional,
+                'allow_blank': field.allow_blank or optional,
+                'max_length': field.max_length,
+                'trim': field.trim_whitespace,
+                'messages': field.error_messages,
+            })
+        return rules
+
+    def validate(self, rows):
+        """
+        Returns (columns, errors): the cleaned value lists per field and,
+        for every row, None or a 'field: message' string.
+        """
+        columns = {}
+        errors = [None] * len(rows)
+
+        def add(index, name, message):
+            message = f'{name}: {message}'
+            errors[index] = message if errors[index] is None else f'{errors[index]}; {message}'
+
+        for rule in self.rules:
+            name = rule['name']
+            raw = [row.get(name) for row in rows]
+            values = [(value or '').strip() if rule['trim'] else (value or '') for value in raw]
+            columns[name] = values
+
+            blank, too_long, nul = self._flags(values, rule['max_length'])
+            flagged = set()
+            if not rule['allow_blank']:
+                for i in blank:
+                    key = 'required' if raw[i] is None and rule['required'] else 'blank'
+                    add(i, name, rule['messages'][key])
+                    flagged.add(i)
+            for i in too_long:
+                if i not in flagged:
+                    add(i, name, rule['messages']['max_length'].format(max_length=rule['max_length']))
+                    flagged.add(i)
+            for i in nul:
+                if i not in flagged:
+                    add(i, name, NULL_CHARACTERS_MESSAGE)
+        return columns, errors
+
+
+# Bulk uploads have always accepted rows without a description (stored as '')
+book_validator = ColumnarValidator(BookSerializer, ('title', 'author', 'description'), optional=('description',))
@@ -2,13 +2,14 @@ from django.contrib import messages
 from django.shortcuts import render,redirect, get_object_or_404
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
-from django.utils import timezone
+from django.conf import settings
 # from rest_framework_simplejwt.tokens import RefreshToken
 
 # from .decorators import book_owner_required
 # CookieJWTAuthentication removed — using custom middleware for auth
-from .models import Book, BulkUploadTask, AuthToken
+from .models import Book, BulkUploadBatch, BulkUploadTask, AuthToken, ResumableUpload
 from django.http import HttpResponse, JsonResponse
+from django.urls import reverse
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
@@ -19,10 +20,59 @@ from django.contrib.auth import authenticate, login , logout
 from django.contrib.auth.decorators import login_required
 from rest_framework.permissions import IsAuthenticated
 # from rest_framework_simplejwt.authentication import JWTAuthentication
-from .tasks import process_book_upload
-import csv 
+from . import login_guard
+from .auth import authenticate_token
+from .signed_tokens import denylist, is_signed_token, make_signed_token, verify_signed_token
+from .token_cache import token_cache
 import uuid
-from io import StringIO
+from .bulk_import import abort_ingest, discard_batch, import_inline, ingest_rows, inline_executor
+from .tasks import ingest_bulk_upload, ingest_compact_upload, use_parallel_parse
+from . import compact, resumable
+from django.core.files.storage import default_storage
+from .ingest import READ_SIZE, UploadFormatError, is_plain_csv, iter_rows, upload_suffix
+from .parallel_ingest import iter_parallel_rows, spooled_path
+from .pagination import InvalidCursor, book_cursor, books_after, parse_limit, settle_horizon, task_changes, task_cursor
+from .fast_serializers import book_columns, books_json
+from .governor import write_governor
+from .progress import broadcaster
+from .scheduler import scheduler
+from .status_store import task_status_store
+
+
+def book_list_query(books, params):
+    """
+    Keyset page of the JSON book list, ordered by id: returns (queryset of
+    up to limit + 1 value tuples, fields, limit). ?fields=id,title limits
+    the columns fetched and serialized. Raises InvalidCursor, or ValueError
+    for unknown fields.
+    """
+    fields = None
+    if params.get('fields'):
+        fields = [name.strip() for name in params['fields'].split(',') if name.strip()]
+        unknown = set(fields) - set(BookSerializer.Meta.fields)
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+    limit = parse_limit(params.get('limit'), settings.BOOKS_PAGE_SIZE, settings.BOOKS_MAX_PAGE_SIZE)
+    books = books_after(books, params.get('cursor')).values_list(*book_columns(fields))
+    return books[:limit + 1], fields, limit
+
+
+def book_list_page(req, params, page, fields, limit):
+    """
+    (JSON bytes, headers) for a page fetched with book_list_query, encoded
+    by the fast path (account/fast_serializers.py) exactly as BookSerializer
+    would render it. The body stays a plain list; the next page's cursor
+    comes in X-Next-Cursor and a Link rel="next" header.
+    """
+    headers = {}
+    if len(page) > limit:
+        page = page[:limit]
+        next_cursor = book_cursor(page[-1][0])
+        params = params.copy()
+        params['cursor'] = next_cursor
+        headers['X-Next-Cursor'] = next_cursor
+        headers['Link'] = f'<{req.build_absolute_uri(req.path)}?{params.urlencode()}>; rel="next"'
+    return books_json(page, fields, req), headers
 
 
 # @method_decorator(login_required(login_url='login'), name='dispatch')
@@ -38,16 +88,27 @@ class BookListCreateAPIView(APIView):
             return redirect('login')  # Or render error page
         
         books = Book.objects.filter(user=req.user)  # Filter by user for security
-        serializer = BookSerializer(books, many=True, context={'request': req})
         
         # If API request, return JSON
         if req.headers.get('Accept') == 'application/json':
-            return Response(serializer.data)
+            return self._json_page(req, books)
         
         # Else, render HTML
+        serializer = BookSerializer(books, many=True, context={'request': req})
         context = {"books": serializer.data}
         return render(req, "takebook.html", context)
     
+    def _json_page(self, req, books):
+        try:
+            books, fields, limit = book_list_query(books, req.query_params)
+            page = list(books)
+        except InvalidCursor:
+            return Response({'error': 'invalid cursor'}, status=400)
+        except ValueError as exc:
+            return Response({'error': str(exc)}, status=400)
+        body, headers = book_list_page(req, req.query_params, page, fields, limit)
+        return HttpResponse(body, content_type='application/json', headers=headers)
+
     # create a book
     def post(self, req):
         serializer = BookSerializer(data=req.data, context={'request': req})
@@ -186,26 +247,63 @@ class BookDeleteAPIView(APIView):
 
 # ///////////////////////////////////////////////////
 # User auth apis (functional)
+def _device_id(req):
+    """Client/device identifier used to reuse sessions ('' if not sent)."""
+    return (req.POST.get('device_id') or req.headers.get('X-Device-Id') or '')[:64]
+
+
+def _login_throttled(req, message, retry_after):
+    """429 for login attempts rejected by account.login_guard."""
+    if req.headers.get('Accept') == 'application/json' or req.headers.get('Content-Type') == 'application/json':
+        resp = JsonResponse({'error': message, 'status': 'throttled'}, status=429)
+    else:
+        messages.error(req, message)
+        resp = render(req, "login.html", status=429)
+    resp['Retry-After'] = str(retry_after)
+    return resp
+
+
+def _client_token(req, token_obj):
+    """Token string handed to the client: signed if enabled or asked for, else opaque."""
+    token_format = req.POST.get('token_format') or req.headers.get('X-Token-Format')
+    if token_format == 'signed' or (token_format != 'opaque' and settings.AUTH_SIGNED_TOKENS):
+        return make_signed_token(token_obj)
+    return token_obj.token
+
+
 @csrf_exempt
 def login_view(req):
     """Login view - CSRF exempt for API usage"""
     if req.method == "POST":
         username = req.POST.get("username")
         password = req.POST.get("password")
-        user = authenticate(req, username=username, password=password)
+
+        retry_after = login_guard.check_login_throttle(username, req.META.get('REMOTE_ADDR'))
+        if retry_after:
+            return _login_throttled(req, "Too many login attempts. Please try again later.", retry_after)
+
+        # Password hashing runs on a bounded pool; fail fast when it's saturated
+        try:
+            user = login_guard.password_executor.submit(
+                authenticate, req, username=username, password=password
+            ).result()
+        except login_guard.Saturated:
+            return _login_throttled(req, "Server is busy. Please try again shortly.", 1)
         
         if user is None:
+            login_guard.record_login_failure(username)
             messages.error(req, "Invalid credentials. Please try again.")
             return render(req, "login.html")
         
-        token_obj = AuthToken.create_token(user, expiration_hours=24)
+        token_obj = AuthToken.issue_token(user, device_id=_device_id(req), expiration_hours=24)
+        token_str = _client_token(req, token_obj)
 
         # For API: return JSON with token
         if req.headers.get('Accept') == 'application/json' or req.headers.get('Content-Type') == 'application/json':
             return JsonResponse({
                 'status': 'success',
                 'message': 'Login successful',
-                'token': token_obj.token,
+                'token': token_str,
                 'expires_at': token_obj.expires_at.isoformat(),
                 'user_id': user.id,
                 'username': user.username,
@@ -215,7 +313,7 @@ def login_view(req):
         
         # refresh = RefreshToken.for_user(user)
         resp = redirect("book-list-create")
-        resp.set_cookie('auth_token', token_obj.token, httponly=True, samesite='Strict', secure=False)
+        resp.set_cookie('auth_token', token_str, httponly=True, samesite='Strict', secure=False)
         messages.success(req, "Login successful!")
         return resp
         
@@ -252,15 +350,15 @@ def signup_view(req):
         )
          
         # Generate custom auth token
-        token_obj = AuthToken.create_token(user, expiration_hours=24)
-        
+        token_obj = AuthToken.issue_token(user, device_id=_device_id(req), expiration_hours=24)
+        token_str = _client_token(req, token_obj)
 
         # For API: return JSON
         if req.headers.get('Accept') == 'application/json':
             return JsonResponse({
                 'status': 'success',
                 'message': 'Signup successful',
-                'token': token_obj.token,
+                'token': token_str,
                 'expires_at': token_obj.expires_at.isoformat(),
                 'user_id': user.id,
                 'username': user.username,
@@ -268,7 +366,7 @@ def signup_view(req):
         
         # For web: set cookie and redirect
         resp = redirect("book-list-create")
-        resp.set_cookie('auth_token', token_obj.token, httponly=True, samesite='Lax')
+        resp.set_cookie('auth_token', token_str, httponly=True, samesite='Lax')
         messages.success(req, "Signup successful!")
         return resp
 
@@ -283,10 +381,17 @@ def logout_view(req):
      # Get token from header or cookie
     token_str = req.META.get('HTTP_AUTHORIZATION', '')[7:] or req.COOKIES.get('auth_token')
     
+    lookup = None
     if token_str:
+        if is_signed_token(token_str):
+            claims = verify_signed_token(token_str)
+            lookup = {'jti': claims['jti']} if claims else None
+        else:
+            lookup = {'token': token_str}
+    if lookup:
         try:
-            token_obj = AuthToken.objects.get(token=token_str)
-            token_obj.revoke()  # Mark as revoked
+            token_obj = AuthToken.objects.get(**lookup)
+            token_obj.revoke()  # Mark as revoked, evict from cache, deny signed form
         except AuthToken.DoesNotExist:
             pass  # Token already invalid
     
@@ -359,28 +464,58 @@ def logout_view(req):
 #  bulk upload and bg job views
 
 
+def _bearer_user(req):
+    """Authenticate request using Bearer token in Authorization header."""
+    auth_header = req.META.get('HTTP_AUTHORIZATION', '')
+    token_str = auth_header[7:] if auth_header.startswith('Bearer ') else None
+
+    if not token_str:
+        return None, Response({'error': 'Missing or invalid Authorization header'}, status=401)
+
+    user, _auth, error = authenticate_token(token_str)
+    if error:
+        return None, Response({'error': error}, status=401)
+
+    return user, None
+
+
+def _import_priority(req):
+    """?priority= weight of the batch in the fair scheduler, 1 by default."""
+    try:
+        priority = int(req.query_params.get('priority', 1))
+    except (TypeError, ValueError):
+        return 1
+    return min(max(priority, 1), settings.IMPORT_MAX_PRIORITY)
+
+
+def _use_inline(req, file):
+    """
+    Import in-process: ?inline=1, or a small upload unless ?inline=0 / ?defer=1.
+    Either way only the first BULK_UPLOAD_INLINE_MAX_ROWS rows (counted after
+    decompression) are imported in the request; the rest are queued.
+    """
+    inline = req.query_params.get('inline')
+    if inline is not None:
+        return inline == '1'
+    return req.query_params.get('defer') != '1' and file.size <= settings.BULK_UPLOAD_INLINE_MAX_BYTES
+
+
+def _queue_stored_upload(path, user, batch_id, compact, priority=1):
+    """Hand a stored upload file to the compact or deferred coordinator task."""
+    if compact:
+        BulkUploadBatch.objects.create(batch_id=batch_id, user=user, storage='compact', source_path=path)
+        ingest_compact_upload.delay(batch_id, priority)
+        return {'batch_id': batch_id, 'status': 'queued', 'storage': 'compact'}
+    ingest_bulk_upload.delay(path, user.id, batch_id, priority)
+    return {'batch_id': batch_id, 'status': 'queued'}
+
+
 class BulkUploadBooksAPIView(APIView):
     authentication_classes = []
     permission_classes = []
     
     def _authenticate_token(self, req):
-        """Authenticate request using Bearer token in Authorization header."""
-        auth_header = req.META.get('HTTP_AUTHORIZATION', '')
-        token_str = auth_header[7:] if auth_header.startswith('Bearer ') else None
-        print(f"DEBUG bulk-upload auth: header={auth_header}, token_str={token_str}")
-
-        if not token_str:
-            return None, Response({'error': 'Missing or invalid Authorization header'}, status=401)
-
-        try:
-            token_obj = AuthToken.objects.get(token=token_str)
-        except AuthToken.DoesNotExist:
-            return None, Response({'error': 'Invalid token'}, status=401)
-
-        if not token_obj.is_valid() or not token_obj.user.is_active:
-            return None, Response({'error': 'Token expired or inactive'}, status=401)
-
-        return token_obj.user, None
+        return _bearer_user(req)
 
     def get(self, req):
         user, error_response = self._authenticate_token(req)
@@ -396,53 +531,191 @@ class BulkUploadBooksAPIView(APIView):
         file = req.FILES.get('file')
         if not file:
             return Response({'error': 'No file provided'}, status=400)
-        # Parse CSV
-        file_content = file.read().decode('utf-8')
-        reader = csv.DictReader(StringIO(file_content))
-        rows = list(reader)
-        if not rows:
-            return Response({'error': 'CSV is empty'}, status=400)
         batch_id = str(uuid.uuid4())
-        valid_rows = 0
-        for row in rows:
-            title = row.get('title', '').strip()
-            author = row.get('author', '').strip()
-            description = row.get('description', '').strip()
-            
-            # create a task record for every CSV row (even invalid ones)
-            task = BulkUploadTask.objects.create(
-                task_id=uuid.uuid4(),
-                batch_id=batch_id,
-                title=title,
-                author=author,
-                description=description,
-                status='pending'
-            )
-
-            # If row is invalid, mark task failed immediately so it appears in the batch
-            if not title or not author:
-                task.status = 'failed'
-                task.error_message = 'missing title or author'
-                task.completed_at = timezone.now()
-                task.save()
-                continue
-            
-            # Enqueue valid rows
-            celery_task = process_book_upload.delay(str(task.task_id), user.id)
-            task.celery_task_id = celery_task.id
-            task.save()
-            valid_rows += 1
+        priority = _import_priority(req)
+        # stored copies keep their format in the name, e.g. '.jsonl.gz'
+        suffix = upload_suffix(file.name, file.content_type)
+
+        # Very large uploads: packed per-row status instead of a task row per line
+        if req.query_params.get('storage') == 'compact' or file.size >= settings.BULK_UPLOAD_COMPACT_MIN_BYTES:
+            path = default_storage.save(f'bulk_uploads/{batch_id}{suffix}', file)
+            return Response(_queue_stored_upload(path, user, batch_id, compact=True, priority=priority), status=202)
+
+        # Small uploads (or ?inline=1): import in this request, no broker round trip
+        inline = _use_inline(req, file)
+
+        # Deferred mode: store the file and let a coordinator task do the rest
+        if not inline and (settings.BULK_UPLOAD_DEFERRED or req.query_params.get('defer') == '1'):
+            path = default_storage.save(f'bulk_uploads/{batch_id}{suffix}', file)
+            return Response(_queue_stored_upload(path, user, batch_id, compact=False, priority=priority), status=202)
+
+        # Stream the upload: decode incrementally, parse lazily, and write and
+        # enqueue task rows a chunk at a time
+        head = file.read(8)
+        file.seek(0)
+        queued = 0
+        try:
+            if inline:
+                total_rows, valid_rows, task_ids, queued = import_inline(
+                    iter_rows(file.chunks(READ_SIZE), file.name, file.content_type), user.id, batch_id,
+                    settings.BULK_UPLOAD_CHUNK_SIZE, settings.BULK_IMPORT_CHUNK_SIZE, priority=priority,
+                    max_rows=settings.BULK_UPLOAD_INLINE_MAX_ROWS,
+                )
+            elif use_parallel_parse(file.size) and is_plain_csv(head, file.name, file.content_type):
+                # Huge files: spool to disk and parse record-aligned ranges in a process pool
+                with spooled_path(file) as path:
+                    total_rows, valid_rows, task_ids = ingest_rows(
+                        iter_parallel_rows(path, settings.BULK_UPLOAD_PARSE_WORKERS), user.id, batch_id,
+                        settings.BULK_UPLOAD_CHUNK_SIZE, settings.BULK_IMPORT_CHUNK_SIZE, priority=priority,
+                    )
+            else:
+                total_rows, valid_rows, task_ids = ingest_rows(
+                    iter_rows(file.chunks(READ_SIZE), file.name, file.content_type), user.id, batch_id,
+                    settings.BULK_UPLOAD_CHUNK_SIZE, settings.BULK_IMPORT_CHUNK_SIZE, priority=priority,
+                )
+        except (UnicodeDecodeError, UploadFormatError) as exc:
+            return Response(abort_ingest(batch_id, exc), status=400)
+
+        # Nothing was accepted: don't leave a batch behind for the 400
+        if total_rows == 0:
+            discard_batch(batch_id)
+            return Response({'error': 'CSV is empty'}, status=400)
         
         if valid_rows == 0:
+            discard_batch(batch_id)
             return Response({'error': 'No valid rows in CSV'}, status=400)
+
+        if inline and not queued:
+            # Every row is final already: answer with the finished batch
+            batch = BulkUploadBatch.objects.get(batch_id=batch_id)
+            tasks = BulkUploadTask.objects.in_bulk(task_ids, field_name='task_id')
+            return Response({
+                'batch_id': batch_id,
+                'task_ids': task_ids,
+                'total_rows': total_rows,
+                'status': 'completed',
+                **batch.counters(),
+                'tasks': BulkUploadTaskSerializer(
+                    [tasks[uuid.UUID(task_id)] for task_id in task_ids], many=True, context={'request': req}
+                ).data,
+            }, status=200)
         
         return Response({
             'batch_id': batch_id,
-            'task_ids': [str(t) for t in BulkUploadTask.objects.filter(batch_id=batch_id).values_list('task_id', flat=True)],
-            'total_rows': len(rows)
+            'task_ids': task_ids,
+            'total_rows': total_rows
         }, status=202)
         
 
+def _upload_response(upload, status_code=200, body=True):
+    data = {
+        'upload_id': str(upload.upload_id),
+        'offset': upload.offset,
+        'size': upload.size,
+        'status': upload.status,
+        'batch_id': str(upload.batch_id) if upload.batch_id else None,
+    }
+    response = Response(data if body else None, status=status_code)
+    response['Upload-Offset'] = str(upload.offset)
+    return response
+
+
+class ResumableUploadCreateAPIView(APIView):
+    """POST /bulk-upload/resumable/ {filename, content_type, size}: start a resumable upload."""
+    authentication_classes = []
+    permission_classes = []
+
+    def post(self, req):
+        user, error_response = _bearer_user(req)
+        if error_response:
+            return error_response
+
+        size = req.data.get('size')
+        try:
+            size = int(size) if size not in (None, '') else None
+            if size is not None and size < 0:
+                raise ValueError(size)
+        except (TypeError, ValueError):
+            return Response({'error': 'size must be a non-negative integer'}, status=400)
+
+        upload = resumable.create_upload(
+            user, str(req.data.get('filename') or ''), str(req.data.get('content_type') or ''), size
+        )
+        response = _upload_response(upload, status_code=201)
+        response['Location'] = reverse('resumable-upload', args=[upload.upload_id])
+        return response
+
+
+class ResumableUploadAPIView(APIView):
+    """
+    GET/HEAD: current offset. PATCH: append the request body at
+    Upload-Offset. POST: complete and import. DELETE: abort.
+    """
+    authentication_classes = []
+    permission_classes = []
+
+    def _get_upload(self, req, upload_id):
+        user, error_response = _bearer_user(req)
+        if error_response:
+            return None, error_response
+        upload = ResumableUpload.objects.filter(upload_id=upload_id, user=user).first()
+        if upload is None:
+            return None, Response({'error': 'Upload not found'}, status=404)
+        return upload, None
+
+    def get(self, req, upload_id):
+        upload, error_response = self._get_upload(req, upload_id)
+        if error_response:
+            return error_response
+        return _upload_response(upload)
+
+    def patch(self, req, upload_id):
+        upload, error_response = self._get_upload(req, upload_id)
+        if error_response:
+            return error_response
+        try:
+            offset = int(req.headers.get('Upload-Offset', ''))
+        except ValueError:
+            return Response({'error': 'Upload-Offset header required'}, status=400)
+        length = req.META.get('CONTENT_LENGTH')
+
+        try:
+            checksum = resumable.parse_checksum(req.headers.get('Upload-Checksum'))
+            # The body is streamed to the spool file, never read into memory
+            resumable.append_chunk(upload, offset, req, int(length) if length else None, checksum)
+        except resumable.ResumableUploadError as exc:
+            response = _upload_response(upload, status_code=exc.status_code)
+            response.data['error'] = str(exc)
+            return response
+        return _upload_response(upload, status_code=204, body=False)
+
+    def post(self, req, upload_id):
+        upload, error_response = self._get_upload(req, upload_id)
+        if error_response:
+            return error_response
+        batch_id = str(uuid.uuid4())
+        try:
+            path = resumable.complete_upload(upload, batch_id)
+        except resumable.UploadComplete:
+            # A retried complete: answer with the batch the first one started
+            return _upload_response(upload)
+        except resumable.ResumableUploadError as exc:
+            response = _upload_response(upload, status_code=exc.status_code)
+            response.data['error'] = str(exc)
+            return response
+
+        compact = req.query_params.get('storage') == 'compact' or upload.offset >= settings.BULK_UPLOAD_COMPACT_MIN_BYTES
+        return Response(_queue_stored_upload(path, upload.user, batch_id, compact, _import_priority(req)), status=202)
+
+    def delete(self, req, upload_id):
+        upload, error_response = self._get_upload(req, upload_id)
+        if error_response:
+            return error_response
+        if upload.status == 'open':
+            resumable.abort_upload(upload)
+        return _upload_response(upload, status_code=204, body=False)
+
+
 class TaskStatusAPIView(APIView):
     authentication_classes = []
     permission_classes = []
@@ -452,6 +725,16 @@ class TaskStatusAPIView(APIView):
         if not task_id:
             return Response({'error': 'task_id required'}, status=status.HTTP_400_BAD_REQUEST)
         
+        # In-flight and recently finished tasks are served from the hot store
+        payload = task_status_store.get(task_id)
+        if payload is not None:
+            return Response(payload)
+        if compact.parse_task_id(task_id) is not None:
+            payload = compact.task_status(task_id)
+            if payload is None:
+                return Response({'error': 'Task not found'}, status=status.HTTP_404_NOT_FOUND)
+            return Response(payload)
+
         try:
             task = BulkUploadTask.objects.get(task_id=task_id)
             # Optional: Check if task belongs to user (if you add user field to BulkUploadTask)
@@ -460,6 +743,18 @@ class TaskStatusAPIView(APIView):
         except BulkUploadTask.DoesNotExist:
             return Response({'error': 'Task not found'}, status=status.HTTP_404_NOT_FOUND)
 
+def task_page(page, limit, cursor, request, horizon=None):
+    """tasks/next_cursor/has_more for a page fetched with limit + 1 rows by task_changes()."""
+    has_more = len(page) > limit
+    page = page[:limit]
+    return {
+        'tasks': BulkUploadTaskSerializer(page, many=True, context={'request': request}).data,
+        # With nothing new, keep the caller's cursor so it can poll again
+        'next_cursor': task_cursor(page[-1], horizon) if page else cursor,
+        'has_more': has_more,
+    }
+
+
 class BatchStatusAPIView(APIView):
     authentication_classes = []
     permission_classes = []
@@ -476,18 +771,55 @@ class BatchStatusAPIView(APIView):
             return Response({'error': 'invalid batch_id'}, status=status.HTTP_400_BAD_REQUEST)
 
         try:
-            tasks_qs = BulkUploadTask.objects.filter(batch_id=batch_uuid).order_by('created_at')
-            summary = {
-                'batch_id': str(batch_uuid),
-                'total': tasks_qs.count(),
-                'pending': tasks_qs.filter(status__iexact='pending').count(),
-                'processing': tasks_qs.filter(status__iexact='processing').count(),
-                'success': tasks_qs.filter(status__iexact='success').count(),
-                'failed': tasks_qs.filter(status__iexact='failed').count(),
-                'tasks': BulkUploadTaskSerializer(tasks_qs, many=True, context={'request': request}).data
-            }
+            # O(1): counters maintained by the import tasks
+            batch = BulkUploadBatch.objects.filter(batch_id=batch_uuid).first()
+            if batch is not None:
+                counters = batch.counters()
+            else:
+                counters = BulkUploadBatch.counters_from_status_counts(BulkUploadTask.status_counts(batch_uuid))
+            summary = {'batch_id': str(batch_uuid), **counters}
+            if request.query_params.get('include_tasks', '1') != '0':
+                # Keyset page of tasks ordered by (updated_at, task_id); pass
+                # next_cursor back as ?since= to get only what changed since
+                cursor = request.query_params.get('since') or request.query_params.get('cursor')
+                limit = parse_limit(request.query_params.get('limit'), settings.BATCH_TASKS_PAGE_SIZE, settings.BATCH_TASKS_MAX_PAGE_SIZE)
+                if batch is not None and batch.storage == 'compact':
+                    if request.query_params.get('since'):
+                        return Response({'error': compact.SINCE_UNSUPPORTED}, status=status.HTTP_400_BAD_REQUEST)
+                    summary.update(compact.task_page(batch, cursor, limit))
+                else:
+                    horizon = settle_horizon()
+                    queryset = task_changes(BulkUploadTask.objects.filter(batch_id=batch_uuid), cursor, horizon)
+                    summary.update(task_page(list(queryset[:limit + 1]), limit, cursor, request, horizon))
             return Response(summary)
+        except InvalidCursor:
+            return Response({'error': 'invalid cursor'}, status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
             return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
 
+class MetricsAPIView(APIView):
+    """Internal counters for staff users (cache hit ratios etc.)."""
+    authentication_classes = []
+    permission_classes = []
+
+    def get(self, req):
+        # With no DRF authenticators req.user is always AnonymousUser
+        user, error_response = _bearer_user(req)
+        if error_response:
+            return error_response
+        if not user.is_staff:
+            return Response({'detail': 'Forbidden'}, status=403)
+
+        return Response({
+            'token_cache': token_cache.get_stats(),
+            'signed_token_denylist': {'size': len(denylist)},
+            'login': login_guard.get_stats(),
+            'inline_import': inline_executor.get_stats() if inline_executor else None,
+            'batch_progress': broadcaster.get_stats(),
+            'task_status_store': task_status_store.get_stats(),
+            'import_scheduler': scheduler.get_stats(),
+            'write_governor': write_governor.get_stats(),
+        })
+
+
@@ -102,6 +102,11 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'proj1.wsgi.application'
+ASGI_APPLICATION = 'proj1.asgi.application'
+
+# Route book/task/batch JSON reads to the native async views in
+# account/async_views.py. Only useful when serving proj1.asgi (uvicorn).
+ASYNC_API_VIEWS = os.environ.get('ASYNC_API_VIEWS', '0') == '1'
 
 
 # Database
@@ -176,6 +181,152 @@ CELERY_TIMEZONE = 'UTC'
 CELERY_TASK_TRACK_STARTED = True
 CELERY_TASK_TIME_LIMIT = 30 * 60  # 30 min hard limit
 
+# Import tasks are idempotent and acks_late (acknowledged after they finish,
+# redelivered if a worker dies), so workers can prefetch deeply and be
+# recycled often. The broker must not redeliver a message that is still
+# running: keep the visibility timeout above the task time limit.
+CELERY_WORKER_PREFETCH_MULTIPLIER = int(os.environ.get('CELERY_WORKER_PREFETCH_MULTIPLIER', '16'))
+CELERY_WORKER_MAX_TASKS_PER_CHILD = int(os.environ.get('CELERY_WORKER_MAX_TASKS_PER_CHILD', '500'))
+CELERY_WORKER_MAX_MEMORY_PER_CHILD = int(os.environ.get('CELERY_WORKER_MAX_MEMORY_PER_CHILD', '262144'))  # KiB
+CELERY_BROKER_TRANSPORT_OPTIONS = {'visibility_timeout': CELERY_TASK_TIME_LIMIT * 2}
+
+# Periodic jobs (run `celery -A proj1 beat`)
+CELERY_BEAT_SCHEDULE = {
+    'expire-auth-tokens': {
+        'task': 'account.tasks.expire_auth_tokens',
+        'schedule': float(os.environ.get('AUTH_TOKEN_SWEEP_INTERVAL', '60')),  # seconds
+    },
+    'purge-stale-auth-tokens': {
+        'task': 'account.tasks.purge_stale_auth_tokens',
+        'schedule': float(os.environ.get('AUTH_TOKEN_PURGE_INTERVAL', '3600')),  # seconds
+    },
+    'purge-stale-uploads': {
+        'task': 'account.tasks.purge_stale_uploads',
+        'schedule': float(os.environ.get('RESUMABLE_UPLOAD_PURGE_INTERVAL', '3600')),  # seconds
+    },
+    # Safety net for the fair scheduler: refills slots freed by expired leases
+    'dispatch-import-jobs': {
+        'task': 'account.tasks.dispatch_import_jobs',
+        'schedule': float(os.environ.get('IMPORT_DISPATCH_INTERVAL', '30')),  # seconds
+    },
+}
+
+
+# Bulk upload ingestion: rows are parsed from the upload as a stream and
+# handled BULK_UPLOAD_CHUNK_SIZE rows at a time, so memory doesn't grow
+# with file size (uploads over FILE_UPLOAD_MAX_MEMORY_SIZE are spooled to disk).
+BULK_UPLOAD_CHUNK_SIZE = int(os.environ.get('BULK_UPLOAD_CHUNK_SIZE', '1000'))
+# Rows per Celery import message (account.tasks.process_book_upload_chunk)
+BULK_IMPORT_CHUNK_SIZE = int(os.environ.get('BULK_IMPORT_CHUNK_SIZE', '200'))
+# Deferred uploads: store the file under MEDIA_ROOT/bulk_uploads/ and return
+# 202 right away; account.tasks.ingest_bulk_upload parses and fans out.
+# Per request with ?defer=1.
+BULK_UPLOAD_DEFERRED = os.environ.get('BULK_UPLOAD_DEFERRED', '0') == '1'
+# Uploads up to BULK_UPLOAD_INLINE_MAX_BYTES (or POST /bulk-upload/?inline=1)
+# are imported inside the request on a pool of BULK_UPLOAD_INLINE_WORKERS
+# threads shared by the whole process (0 = in the request thread) and
+# answered with the finished batch. Jobs beyond the pool's queue go to the
+# workers instead. ?inline=0 forces the queued path; 0 bytes disables it.
+# Whatever the file size (a compressed one can inflate to millions of rows)
+# and with ?inline=1 too, rows past BULK_UPLOAD_INLINE_MAX_ROWS are queued.
+BULK_UPLOAD_INLINE_MAX_BYTES = int(os.environ.get('BULK_UPLOAD_INLINE_MAX_BYTES', str(64 * 1024)))
+BULK_UPLOAD_INLINE_MAX_ROWS = int(os.environ.get('BULK_UPLOAD_INLINE_MAX_ROWS', '2000'))
+BULK_UPLOAD_INLINE_WORKERS = int(os.environ.get('BULK_UPLOAD_INLINE_WORKERS', '4'))
+BULK_UPLOAD_INLINE_QUEUE_SIZE = int(os.environ.get('BULK_UPLOAD_INLINE_QUEUE_SIZE', '16'))
+
+# Parse uploads of at least BULK_UPLOAD_PARALLEL_MIN_BYTES in this many
+# processes (account/parallel_ingest.py); 0 or 1 keeps the streaming parser
+BULK_UPLOAD_PARSE_WORKERS = int(os.environ.get('BULK_UPLOAD_PARSE_WORKERS', '0'))
+BULK_UPLOAD_PARALLEL_MIN_BYTES = int(os.environ.get('BULK_UPLOAD_PARALLEL_MIN_BYTES', str(32 * 1024 * 1024)))
+
+# Uploads this large (or POST /bulk-upload/?storage=compact) use compact
+# storage: packed per-row status segments of BULK_COMPACT_SEGMENT_SIZE rows
+# and a row only for failures, instead of one BulkUploadTask per line
+BULK_UPLOAD_COMPACT_MIN_BYTES = int(os.environ.get('BULK_UPLOAD_COMPACT_MIN_BYTES', str(64 * 1024 * 1024)))
+BULK_COMPACT_SEGMENT_SIZE = int(os.environ.get('BULK_COMPACT_SEGMENT_SIZE', '1000'))
+
+# Resumable uploads (/bulk-upload/resumable/): largest accepted PATCH body,
+# and how long an untouched open upload is kept before its spool file is purged
+RESUMABLE_UPLOAD_MAX_CHUNK = int(os.environ.get('RESUMABLE_UPLOAD_MAX_CHUNK', str(64 * 1024 * 1024)))
+RESUMABLE_UPLOAD_TTL_HOURS = int(os.environ.get('RESUMABLE_UPLOAD_TTL_HOURS', '24'))
+
+# /api/books/ JSON listing: keyset pages ordered by id (?cursor=, ?limit=)
+BOOKS_PAGE_SIZE = int(os.environ.get('BOOKS_PAGE_SIZE', '100'))
+BOOKS_MAX_PAGE_SIZE = int(os.environ.get('BOOKS_MAX_PAGE_SIZE', '1000'))
+
+# /batch-status/ task listing: keyset pages ordered by (updated_at, task_id).
+# With ?since=, rows updated in the last BATCH_TASKS_SETTLE_SECONDS are left for
+# the next poll, so it never skips a change whose transaction committed late.
+BATCH_TASKS_PAGE_SIZE = int(os.environ.get('BATCH_TASKS_PAGE_SIZE', '100'))
+BATCH_TASKS_MAX_PAGE_SIZE = int(os.environ.get('BATCH_TASKS_MAX_PAGE_SIZE', '1000'))
+BATCH_TASKS_SETTLE_SECONDS = float(os.environ.get('BATCH_TASKS_SETTLE_SECONDS', '5'))
+
+# /batch-progress/ Server-Sent Events: keepalive comment interval and how
+# long one stream stays open before the client reconnects (seconds)
+BATCH_PROGRESS_HEARTBEAT = int(os.environ.get('BATCH_PROGRESS_HEARTBEAT', '15'))
+BATCH_PROGRESS_STREAM_TIMEOUT = int(os.environ.get('BATCH_PROGRESS_STREAM_TIMEOUT', '300'))
+
+# Optional shared Redis used by the account app (token cache etc.).
+# Leave unset to keep everything in-process.
+REDIS_CACHE_URL = os.environ.get('REDIS_CACHE_URL')
+
+# Hot store for /task-status/ payloads (Redis only; off without it).
+# With write-behind the transient 'processing' state is kept only there and
+# BulkUploadTask rows are written once, at their terminal state.
+TASK_STATUS_STORE_TTL = int(os.environ.get('TASK_STATUS_STORE_TTL', '3600'))  # seconds
+TASK_STATUS_WRITE_BEHIND = os.environ.get('TASK_STATUS_WRITE_BEHIND', '1' if REDIS_CACHE_URL else '0') == '1'
+
+# Fair scheduling of import messages (account/scheduler.py, needs Redis):
+# jobs wait in per-batch queues and at most IMPORT_MAX_IN_FLIGHT are on the
+# broker at once, released round-robin across users, then batches. Uploads
+# may pass ?priority=1..IMPORT_MAX_PRIORITY to weight their batch.
+IMPORT_FAIR_SCHEDULING = os.environ.get('IMPORT_FAIR_SCHEDULING', '1' if REDIS_CACHE_URL else '0') == '1'
+IMPORT_MAX_IN_FLIGHT = int(os.environ.get('IMPORT_MAX_IN_FLIGHT', '8'))
+IMPORT_MAX_PRIORITY = int(os.environ.get('IMPORT_MAX_PRIORITY', '10'))
+
+# AIMD write governor (account/governor.py): import tasks report their DB
+# write time per row; above the target the import chunk size and in-flight
+# limit are halved, below it they grow back step by step.
+IMPORT_WRITE_GOVERNOR = os.environ.get('IMPORT_WRITE_GOVERNOR', '1') == '1'
+IMPORT_WRITE_ROW_TARGET_MS = float(os.environ.get('IMPORT_WRITE_ROW_TARGET_MS', '1.5'))
+IMPORT_CHUNK_SIZE_MIN = int(os.environ.get('IMPORT_CHUNK_SIZE_MIN', '25'))
+IMPORT_CHUNK_SIZE_MAX = int(os.environ.get('IMPORT_CHUNK_SIZE_MAX', '1000'))
+
+# Validated auth tokens are cached in-process (LRU + TTL) and, when
+# REDIS_CACHE_URL is set, in Redis as well. Revocation invalidates both.
+# Without Redis other processes cannot be told about a revocation, so
+# entries then expire after AUTH_TOKEN_CACHE_LOCAL_TTL (0 disables the cache).
+AUTH_TOKEN_CACHE_SIZE = int(os.environ.get('AUTH_TOKEN_CACHE_SIZE', '10000'))
+AUTH_TOKEN_CACHE_TTL = int(os.environ.get('AUTH_TOKEN_CACHE_TTL', '300'))  # seconds
+AUTH_TOKEN_CACHE_LOCAL_TTL = int(os.environ.get('AUTH_TOKEN_CACHE_LOCAL_TTL', '5'))  # seconds
+
+# Signed (stateless) access tokens. When enabled, login/signup hand out
+# HMAC-signed tokens instead of opaque ones; clients can also ask for a
+# format with token_format=signed|opaque. Opaque tokens are always accepted.
+AUTH_SIGNED_TOKENS = os.environ.get('AUTH_SIGNED_TOKENS', '0') == '1'
+AUTH_SIGNED_TOKEN_KEY = os.environ.get('AUTH_SIGNED_TOKEN_KEY')  # defaults to SECRET_KEY
+AUTH_SIGNED_TOKEN_DENYLIST_SYNC = int(os.environ.get('AUTH_SIGNED_TOKEN_DENYLIST_SYNC', '30'))  # seconds
+
+# AuthToken table lifecycle (see account.tasks.expire_auth_tokens / purge_stale_auth_tokens)
+AUTH_TOKEN_SWEEP_BATCH_SIZE = int(os.environ.get('AUTH_TOKEN_SWEEP_BATCH_SIZE', '1000'))
+AUTH_TOKEN_RETENTION_DAYS = int(os.environ.get('AUTH_TOKEN_RETENTION_DAYS', '7'))
+
+# Sliding sessions: logins from the same device_id reuse their live token and
+# only extend it when that moves expiry by at least AUTH_TOKEN_SLIDE_INTERVAL.
+AUTH_TOKEN_SLIDE_INTERVAL = int(os.environ.get('AUTH_TOKEN_SLIDE_INTERVAL', '900'))  # seconds
+AUTH_TOKEN_MAX_PER_USER = int(os.environ.get('AUTH_TOKEN_MAX_PER_USER', '20'))
+
+# login_view protection (account/login_guard.py): password hashing runs on a
+# bounded pool per process (429 when full). Attempts are token-bucket
+# throttled per IP, failed attempts per username. 0 per minute disables a
+# throttle.
+LOGIN_HASH_WORKERS = int(os.environ.get('LOGIN_HASH_WORKERS', '2'))
+LOGIN_HASH_QUEUE_SIZE = int(os.environ.get('LOGIN_HASH_QUEUE_SIZE', '16'))
+LOGIN_THROTTLE_USER_PER_MINUTE = float(os.environ.get('LOGIN_THROTTLE_USER_PER_MINUTE', '10'))
+LOGIN_THROTTLE_USER_BURST = int(os.environ.get('LOGIN_THROTTLE_USER_BURST', '10'))
+LOGIN_THROTTLE_IP_PER_MINUTE = float(os.environ.get('LOGIN_THROTTLE_IP_PER_MINUTE', '60'))
+LOGIN_THROTTLE_IP_BURST = int(os.environ.get('LOGIN_THROTTLE_IP_BURST', '30'))
+
 
 
 CSRF_TRUSTED_ORIGINS = [
@@ -29,6 +29,24 @@ def root(request):
     return HttpResponse("++++++")
 
 
+from account.async_views import BatchProgressStreamView
+
+
+# Native async read paths when running under ASGI (see account/async_views.py)
+if settings.ASYNC_API_VIEWS:
+    from account.async_views import (
+        AsyncBookListCreateAPIView as BookListView,
+        AsyncBookDetailAPIView as BookDetailView,
+        AsyncTaskStatusAPIView as TaskStatusView,
+        AsyncBatchStatusAPIView as BatchStatusView,
+    )
+else:
+    BookListView = BookListCreateAPIView
+    BookDetailView = BookDetailAPIView
+    TaskStatusView = TaskStatusAPIView
+    BatchStatusView = BatchStatusAPIView
+
+
 urlpatterns = [
     # JWT auth paths
     path('api/token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
@@ -53,13 +71,13 @@ urlpatterns = [
     # book paths
     
     # apiView paths
-    path("api/books/", BookListCreateAPIView.as_view(), name="book-list-create"),
-    path("api/books/<int:id>/", BookDetailAPIView.as_view(), name="book-detail"),
+    path("api/books/", BookListView.as_view(), name="book-list-create"),
+    path("api/books/<int:id>/", BookDetailView.as_view(), name="book-detail"),
 
     
-    path('takebook/', BookListCreateAPIView.as_view(), name='book-list-create'),
+    path('takebook/', BookListView.as_view(), name='book-list-create'),
     path('deletebook/<int:id>/', BookDeleteAPIView.as_view(), name='deletebook'),
-    path('mybook/<int:id>/', BookDetailAPIView.as_view(), name='book-detail'),
+    path('mybook/<int:id>/', BookDetailView.as_view(), name='book-detail'),
     path('editbook/<int:id>/', BookEditAPIView.as_view(), name='editbook'),
 
     
@@ -72,8 +90,14 @@ urlpatterns = [
 
     # bulk upload endpoints
     path('bulk-upload/', BulkUploadBooksAPIView.as_view(), name='bulk-upload'),
-    path('task-status/', TaskStatusAPIView.as_view(), name='task-status'),
-    path('batch-status/', BatchStatusAPIView.as_view(), name='batch-status'),
+    path('bulk-upload/resumable/', ResumableUploadCreateAPIView.as_view(), name='resumable-upload-create'),
+    path('bulk-upload/resumable/<uuid:upload_id>/', ResumableUploadAPIView.as_view(), name='resumable-upload'),
+    path('task-status/', TaskStatusView.as_view(), name='task-status'),
+    path('batch-status/', BatchStatusView.as_view(), name='batch-status'),
+    path('batch-progress/', BatchProgressStreamView.as_view(), name='batch-progress'),
+
+    # internal metrics (staff only)
+    path('metrics/', MetricsAPIView.as_view(), name='metrics'),
 
 ]    
 